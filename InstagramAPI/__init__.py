@@ -3,8 +3,14 @@
 
 from __future__ import absolute_import
 
+import importlib
+
 from .instagram_api import InstagramAPI
 from .endpoints import InstagramAPIEndPoints
+# Imported by InstagramAPI anyway, so exported directly.
+from .metrics import Metrics
+from .records import RecordList
+from .retry import RetryPolicy
 try:
     # Developers can add a credentials file to enable the tests and examples to log in.
     # It might not be present.
@@ -12,4 +18,30 @@ try:
 except ImportError:
     credentials = None
 
+
+# Classes imported on first use, so clients only pay to import what they use (snapshots needs sqlite3, for one).
+# AsyncInstagramAPI also needs Python 3.6 syntax, and this lazy lookup needs Python 3.7.
+_LAZY = {
+    'AsyncInstagramAPI': 'async_api',
+    'BulkUploader': 'bulk_upload',
+    'FollowSnapshots': 'snapshots',
+    'InstagramAPIPool': 'pool',
+    'RateLimiter': 'throttling',
+    'ResponseCache': 'cache',
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value  # Later lookups find it without calling __getattr__.
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
+
 __all__ = InstagramAPI, InstagramAPIEndPoints, credentials
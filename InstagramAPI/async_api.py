@@ -0,0 +1,597 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains an asyncio flavour of the Instagram API.
+
+    Every end-point of InstagramAPIEndPoints is available, but returns an awaitable, and the iterators of InstagramAPI
+    are asynchronous iterators (for use with `async for`). Many calls can be in flight at once from a single thread.
+
+    Requires Python 3.6 or later, and the aiohttp package.
+    """
+
+import asyncio
+import collections
+import email.utils
+import json
+import logging
+import os
+import time
+
+from . import decoding
+from .base import AuthenticationError, InstagramAPIBase
+from .chunked_upload import ChunkedUpload, DEFAULT_CHUNK_SIZE
+from .endpoints import VIDEO_CHUNK_ENDPOINT
+from .executor import BulkMap
+from .metrics import body_size, clock
+from .instagram_api import InstagramAPI
+from .records import record_fields, record_type
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+
+class _Response(object):
+    """ The parts of an aiohttp response that outlive the connection. Mimics the requests.Response attributes. """
+
+    def __init__(self, content, cookies):
+        self.content = content
+        self.cookies = cookies
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+
+async def _read_in_chunks(readable, size=64 * 1024):
+    """ Yields what readable.read() returns, size bytes at a time. The reads block, so they are made on a thread. """
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, readable.read, size)
+        if not chunk:
+            break
+        yield chunk
+
+
+class _AsyncBulkMap(BulkMap):
+    """ A BulkMap of a coroutine function, whose calls are made by tasks on the event loop. Use async for. """
+
+    def __iter__(self):
+        raise TypeError("Iterate over the results of AsyncInstagramAPI.map() with async for.")
+
+    async def _call(self, item):
+        try:
+            response = await (self.func(*item) if isinstance(item, tuple) else self.func(item))
+            return {'item': item, 'response': response, 'error': None}
+        except Exception as e:
+            return {'item': item, 'response': None, 'error': e}
+
+    async def __aiter__(self):
+        items = iter(self.items)
+        pending = collections.deque()
+        self.stats.started = time.time()
+        self.stats.finished = None
+
+        def submit():
+            for item in items:
+                pending.append(asyncio.ensure_future(self._call(item)))
+                return True
+            return False
+
+        try:
+            while len(pending) < self.concurrency and submit():
+                pass
+            while pending:
+                if self.ordered:
+                    result = await pending.popleft()
+                else:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    task = done.pop()
+                    pending.remove(task)
+                    result = task.result()
+                submit()
+                yield self._result(result)
+        finally:
+            for task in pending:
+                task.cancel()
+            self._finish()
+
+
+class AsyncInstagramAPI(InstagramAPI):
+    """ An InstagramAPI whose calls are coroutines.
+
+        Methods may raise exceptions from the aiohttp module (such as aiohttp.ClientResponseError) where the
+        synchronous version would raise exceptions from the requests module.
+
+        Call close() (or use the instance as an async context manager) to release the connections.
+
+        Calls are made with aiohttp, so a transport (a requests adapter) can't be given, and calls can't be recorded
+        or replayed.
+        """
+
+    def __init__(self, username, password, two_factor_callback=None, **kwargs):
+        InstagramAPI.__init__(self, username, password, two_factor_callback, **kwargs)
+        self._connection_counts = {'opened': 0, 'reused': 0}
+        # Cookies restored before there was an event loop to create the aiohttp session in.
+        self._pending_cookies = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _new_session(self):
+        import aiohttp  # Only required by this class, so only imported when needed.
+
+        async def on_connection_create_end(session, context, params):
+            self._connection_counts['opened'] += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self._connection_counts['reused'] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=self._pool_maxsize, force_close=not self._keep_alive),
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+            trace_configs=[trace_config])
+
+    def _session_cookies(self):
+        if self._session is None:
+            return list(self._pending_cookies)
+        cookies = []
+        for morsel in self._session.cookie_jar:
+            expires = email.utils.parsedate_tz(morsel['expires']) if morsel['expires'] else None
+            cookies.append({'name': morsel.key, 'value': morsel.value, 'domain': morsel['domain'],
+                            'path': morsel['path'] or '/', 'secure': bool(morsel['secure']),
+                            'expires': email.utils.mktime_tz(expires) if expires else None})
+        return cookies
+
+    def _install_cookies(self, cookies):
+        # The aiohttp session has to be created while the event loop is running, so it is created on the next call.
+        self._session = None
+        self._pending_cookies = list(cookies)
+
+    def _connected_session(self):
+        if self._session is None:
+            from http.cookies import SimpleCookie
+
+            self._session = self._new_session()
+            for cookie in self._pending_cookies:
+                simple_cookie = SimpleCookie()
+                simple_cookie[cookie['name']] = cookie['value']
+                morsel = simple_cookie[cookie['name']]
+                morsel['domain'] = cookie['domain']
+                morsel['path'] = cookie['path']
+                if cookie['expires'] is not None:
+                    morsel['expires'] = email.utils.formatdate(cookie['expires'], usegmt=True)
+                if cookie['secure']:
+                    morsel['secure'] = True
+                self._session.cookie_jar.update_cookies(simple_cookie)
+            self._pending_cookies = []
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def connection_stats(self):
+        return dict(self._connection_counts)
+
+    async def _sendrequest(self, endpoint, post=None, login=False, headers=None):
+        """ The asynchronous equivalent of InstagramAPIBase._sendrequest. """
+
+        if not self._isloggedin and not login:
+            raise AuthenticationError("Not logged in.")
+
+        if self.cache is not None and not login:
+            cached = self.cache.get(endpoint)
+            if cached is not None:
+                LOGGER.debug("Answered call to %s from the cache.", endpoint)
+                return cached
+
+        import aiohttp
+
+        headers = headers or self._default_headers()
+
+        retry_policy = self.retry_policy
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.reserve(endpoint)
+                if self.metrics is not None and delay > 0:
+                    self.metrics.observe_throttle(endpoint, delay)
+                await asyncio.sleep(delay)
+
+            LOGGER.debug("%s call to %s %s",
+                         "POST" if post else "GET", endpoint, post)
+            try:
+                response = await self._request(self.API_URL + endpoint, post, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if retry_policy is None:
+                    raise
+                if isinstance(e, aiohttp.ClientResponseError):
+                    delay = retry_policy.retry_delay(endpoint, post, attempt, status=e.status,
+                                                     retry_after=(e.headers or {}).get('Retry-After'))
+                else:
+                    delay = retry_policy.retry_delay(endpoint, post, attempt,
+                                                     sent=not isinstance(e, aiohttp.ClientConnectorError))
+                if delay is None:
+                    retry_policy.record(endpoint, attempt, succeeded=False)
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            break
+
+        if retry_policy is not None:
+            retry_policy.record(endpoint, attempt, succeeded=True)
+
+        if login:
+            LOGGER.debug("Instagram responded successfully to special login operation.")
+            return response
+
+        if self.metrics is not None:
+            started = clock()
+            json_dict = decoding.loads(response.content)
+            self.metrics.observe_decode(endpoint, clock() - started)
+        else:
+            json_dict = decoding.loads(response.content)
+
+        LOGGER.debug("Instagram responded successfully: %s", json_dict)
+        if self.cache is not None:
+            self._update_cache(endpoint, post, json_dict)
+        return json_dict
+
+    async def _request(self, url, post, headers, endpoint=None):
+        """
+        :param endpoint: the name the call goes by for the rate limiter and metrics. Defaults to url's path under
+               API_URL; calls to other URLs without one are neither recorded nor measured.
+        :return: a _Response with the content and cookies of the response from url.
+        """
+        import aiohttp
+
+        if endpoint is None and url.startswith(self.API_URL):
+            endpoint = url[len(self.API_URL):]
+        metrics = self.metrics if endpoint is not None else None
+        method = "POST" if post is not None else "GET"
+        options = {}
+        if self.retry_policy is not None:
+            options['timeout'] = aiohttp.ClientTimeout(sock_connect=self.retry_policy.connect_timeout,
+                                                       sock_read=self.retry_policy.read_timeout)
+        started = clock() if metrics is not None else None
+        try:
+            async with self._connected_session().request(
+                    method, url, data=post, headers=headers, **options) as response:
+                content = await response.read()
+                if self.rate_limiter is not None and endpoint is not None:
+                    self.rate_limiter.record(endpoint, response.status)
+                if metrics is not None:
+                    metrics.observe_call(endpoint, method, response.status, clock() - started,
+                                         body_size(post), int(response.headers.get('Content-Length', len(content))))
+                if response.status >= 400:
+                    text = content.decode('utf-8', 'replace')
+                    if response.status == 400:
+                        self._check_two_factor_required(text)
+                    LOGGER.info("Instagram returned HTTP Error Code %s: (%s)", response.status, text)
+                    response.raise_for_status()
+                cookies = {name: morsel.value for name, morsel in response.cookies.items()}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ce:
+            LOGGER.info("Call to Instagram failed: %s", ce)
+            if metrics is not None and not isinstance(ce, aiohttp.ClientResponseError):
+                metrics.observe_call(endpoint, method, None, clock() - started, body_size(post))
+            raise
+        return _Response(content, cookies)
+
+    @staticmethod
+    async def _iterator_template(func, field, delay_between_calls=0, prefetch=0, fields=None):
+        """
+            Handles pagination and throttling, as an asynchronous generator.
+
+            If prefetch is non-zero, up to that many pages are fetched by a background task while the caller is still
+            processing the current page.
+
+            If fields is given, each item is yielded as a record of just those fields (see records.py).
+        """
+        if prefetch:
+            pages = AsyncInstagramAPI._prefetched_pages(func, delay_between_calls, prefetch)
+        else:
+            pages = AsyncInstagramAPI._pages(func, delay_between_calls)
+        make = record_type(fields).from_dict if fields is not None else None
+        async for json_dict in pages:
+            for item in json_dict.get(field, []):
+                yield item if make is None else make(item)
+
+    @staticmethod
+    async def _pages(func, delay_between_calls=0):
+        max_id = None
+        while True:
+            json_dict = await func(max_id=max_id)
+            arrived = time.time()
+            max_id = json_dict.get('next_max_id', None)
+            yield json_dict
+            if not max_id:
+                break
+            # Avoid overloading Instagram
+            await asyncio.sleep(max(0, delay_between_calls - (time.time() - arrived)))
+
+    @staticmethod
+    async def _prefetched_pages(func, delay_between_calls, prefetch):
+        pages = asyncio.Queue(maxsize=prefetch)
+
+        async def fetch():
+            try:
+                async for json_dict in AsyncInstagramAPI._pages(func, delay_between_calls):
+                    await pages.put((json_dict, None))
+            except Exception as e:
+                await pages.put((None, e))
+            else:
+                await pages.put((None, None))
+
+        worker = asyncio.ensure_future(fetch())
+        try:
+            while True:
+                json_dict, error = await pages.get()
+                if error is not None:
+                    raise error
+                if json_dict is None:
+                    break
+                yield json_dict
+        finally:
+            worker.cancel()
+
+    # The iterators in InstagramAPI iterate over _iterator_template with a plain for loop, so they are redefined here.
+
+    def followers_iter(self, username=None, delay_between_calls=0, prefetch=0, compact=False, fields=None):
+        """
+            Asynchronously yields a series of dictionaries describing each user that follows this user.
+        """
+        username = username or self._loggedinuserid
+        return self._iterator_template(
+            lambda max_id: self.get_user_followers(username, max_id),
+            field="users",
+            delay_between_calls=delay_between_calls,
+            prefetch=prefetch,
+            fields=record_fields('users', compact, fields))
+
+    def followings_iter(self, username=None, delay_between_calls=0, prefetch=0, compact=False, fields=None):
+        """
+            Asynchronously yields a series of dictionaries describing each user that this user follows.
+            If username is None, use logged in user.
+        """
+        username = username or self._loggedinuserid
+        return self._iterator_template(
+            lambda max_id: self.get_user_followings(username, max_id),
+            field="users",
+            delay_between_calls=delay_between_calls,
+            prefetch=prefetch,
+            fields=record_fields('users', compact, fields))
+
+    def userfeed_iter(self, username=None, min_timestamp=None, delay_between_calls=0, prefetch=0, compact=False,
+                      fields=None):
+        """
+            Asynchronously yields a series of dictionaries describing this user's feed.
+            If username is None, use logged in user.
+        """
+        username = username or self._loggedinuserid
+        return self._iterator_template(
+            lambda max_id: self.get_user_feed(username, max_id, min_timestamp),
+            field="items",
+            delay_between_calls=delay_between_calls,
+            prefetch=prefetch,
+            fields=record_fields('items', compact, fields))
+
+    def likedmedia_iter(self, delay_between_calls=0, prefetch=0):
+        """
+            Asynchronously yields a series of dictionaries describing liked media.
+
+            Note: Never ends.
+        """
+        return self._iterator_template(
+            self.get_liked_media,
+            field="items",
+            delay_between_calls=delay_between_calls,
+            prefetch=prefetch)
+
+    def media_comments_iter(self, media_id, delay_between_calls=0, prefetch=0, compact=False, fields=None):
+        """
+            Asynchronously yields a series of dictionaries describing media comments.
+        """
+        return self._iterator_template(
+            lambda max_id: self.get_media_comments(media_id, max_id),
+            field="comments",
+            delay_between_calls=delay_between_calls,
+            prefetch=prefetch,
+            fields=record_fields('comments', compact, fields))
+
+    def map(self, endpoint, items, concurrency=8, ordered=True):
+        """
+            Calls an endpoint for each of a list of arguments, several calls at once. See InstagramAPI.map().
+
+            E.g. async for result in api.map('get_username_info', user_pks): ...
+        """
+        func = endpoint if callable(endpoint) else getattr(self, endpoint)
+        return _AsyncBulkMap(func, items, concurrency=concurrency, ordered=ordered)
+
+    # End-points that do more than return the result of a single _sendrequest call.
+
+    async def login(self, force=False):
+        """
+            Authenticate this API instance.
+
+            If already logged in (and not later logged out) does nothing (unless forced).
+        :param force: if true, will attempt to log in even if already logged in.
+        :return: dictionary of responses.
+        """
+        if not self._isloggedin or force:
+            await self.close()
+            self._pending_cookies = []
+            self._session = self._new_session()
+            full_response = await self._sendrequest(
+                'si/fetch_headers/?challenge_type=signup&guid=' + self.generate_uuid(False), login=True)
+
+            data = {
+                'phone_id': self.generate_uuid(True),
+                '_csrftoken': full_response.cookies['csrftoken'],
+                'username': self._username,
+                'guid': self._uuid,
+                'device_id': self._deviceid,
+                'password': self._password,
+                'login_attempt_count': '0'}
+
+            try:
+                full_response = await self._sendrequest(
+                    'accounts/login/',
+                    post=self._generatesignature(json.dumps(data)),
+                    login=True)
+            except InstagramAPIBase._2FA_Required as exception:
+                if not self._two_factor_callback:
+                    raise AuthenticationError("This account requires support for Two-Factor Authentication")
+                two_factor_info = exception.two_factor_info
+                verification_string = self._two_factor_callback(two_factor_info)
+                if asyncio.iscoroutine(verification_string):
+                    verification_string = await verification_string
+                data = {
+                    'verification_code': verification_string,
+                    'two_factor_identifier': two_factor_info['two_factor_identifier'],
+                    '_csrftoken': full_response.cookies['csrftoken'],
+                    'username': self._username,
+                    'device_id': self._deviceid,
+                    'password': self._password,
+                }
+
+                full_response = await self._sendrequest(
+                    'accounts/two_factor_login/',
+                    post=self._generatesignature(json.dumps(data)),
+                    login=True)
+
+            self._isloggedin = True
+            decoded_text = json.loads(full_response.text)
+            self._loggedinuserid = decoded_text["logged_in_user"]["pk"]
+            self._ranktoken = "%s_%s" % (self._loggedinuserid, self._uuid)
+            self._csrftoken = full_response.cookies["csrftoken"]
+
+            return decoded_text
+
+    async def logout(self):
+        try:
+            return await self._sendrequest('accounts/logout/')
+        finally:
+            self._isloggedin = False
+
+    async def direct_share_batched(self, media_id, recipients, text=None, batch_size=None, concurrency=4):
+        import aiohttp
+
+        in_flight = asyncio.Semaphore(max(1, concurrency))
+
+        async def share(batch):
+            async with in_flight:
+                try:
+                    return {'recipients': batch, 'response': await self.direct_share(media_id, batch, text),
+                            'error': None}
+                except (aiohttp.ClientError, ValueError) as e:
+                    LOGGER.warning("Failed to share %s with %s: %s", media_id, batch, e)
+                    return {'recipients': batch, 'response': None, 'error': e}
+
+        batches = self._batches(recipients, batch_size or self.DIRECT_SHARE_BATCH_SIZE)
+        return list(await asyncio.gather(*[share(batch) for batch in batches]))
+
+    async def configure_video(self, upload_id, video, thumbnail, caption=''):
+        await self._upload_photo_file(thumbnail, upload_id)
+        # Probing the video is blocking work, so keep it off the event loop.
+        signed_body = await asyncio.get_running_loop().run_in_executor(
+            None, self._video_configuration, upload_id, video, caption)
+        return await self._sendrequest('media/configure/?video=1', signed_body)
+
+    async def upload_photo(self, photo, caption=None, upload_id=None, progress=None, normalizer=None):
+        if upload_id is None:
+            upload_id = self.generate_upload_id()
+        if normalizer is not None:
+            normalized = await asyncio.get_running_loop().run_in_executor(None, normalizer.normalize, photo)
+            try:
+                return await self.upload_photo(normalized, caption, upload_id, progress)
+            finally:
+                if normalized != photo:
+                    os.remove(normalized)
+        await self._upload_photo_file(photo, upload_id, progress)
+        response = await self.configure(upload_id, photo, caption)
+        if response:
+            await self.expose()
+        return response
+
+    async def _upload_photo_file(self, photo, upload_id, progress=None):
+        with open(photo, 'rb') as photo_file:
+            m, headers = self._photo_upload_request(photo_file, upload_id, progress)
+            # aiohttp streams asynchronous iterables, but only knows their length if told.
+            headers['Content-Length'] = str(m.len)
+            return await self._sendrequest("upload/photo/", post=_read_in_chunks(m), headers=headers)
+
+    async def upload_video(self, video, thumbnail, caption=None, upload_id=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                           concurrency=1, chunk_retries=3, resume_file=None):
+        if not self._isloggedin:
+            raise AuthenticationError("Not logged in.")
+        upload = ChunkedUpload(video, chunk_size, resume_file)
+        if not upload.started:
+            if upload_id is None:
+                upload_id = self.generate_upload_id()
+            m, headers = self._video_upload_request(upload_id)
+            body = await self._sendrequest("upload/video/", post=m.to_string(), headers=headers)
+            upload.start(upload_id, body['video_upload_urls'][3]['url'], body['video_upload_urls'][3]['job'])
+        upload_id = upload.upload_id
+
+        with upload:
+            pending = upload.pending()
+            LOGGER.info("Starting to upload %d bytes of video data in %d chunks",
+                        sum(end - start for start, end in pending), len(pending))
+            in_flight = asyncio.Semaphore(max(1, concurrency))
+
+            async def upload_chunk(start, end):
+                async with in_flight:
+                    await self._upload_video_chunk(upload, start, end, chunk_retries)
+
+            chunks = [asyncio.ensure_future(upload_chunk(start, end)) for start, end in pending]
+            try:
+                await asyncio.gather(*chunks)
+            finally:
+                for chunk in chunks:
+                    chunk.cancel()
+                await asyncio.gather(*chunks, return_exceptions=True)
+        upload.finish()
+
+        response = await self.configure_video(upload_id, video, thumbnail, caption)
+        if response:
+            LOGGER.info("Video configuration complete. Exposing.")
+            await self.expose()
+            LOGGER.info("Video upload complete.")
+        return response
+
+    async def _upload_video_chunk(self, upload, start, end, retries):
+        import aiohttp
+
+        headers = self._video_chunk_headers(upload.upload_id, upload.upload_job, start, end, upload.size)
+        attempt = 0
+        while True:
+            chunk = upload.view(start, end)
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.reserve(VIDEO_CHUNK_ENDPOINT)
+                if self.metrics is not None and delay > 0:
+                    self.metrics.observe_throttle(VIDEO_CHUNK_ENDPOINT, delay)
+                await asyncio.sleep(delay)
+            try:
+                await self._request(upload.upload_url, chunk, headers, VIDEO_CHUNK_ENDPOINT)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = getattr(e, 'status', None)
+                transient = status is None or status == 429 or status >= 500
+                if attempt >= retries or not transient:
+                    raise
+                delay = upload.RETRY_DELAY * 2 ** attempt
+                attempt += 1
+                LOGGER.info("Upload of video %s failed (%s). Trying again in %s seconds.",
+                            headers['Content-Range'], e, delay)
+                await asyncio.sleep(delay)
+            else:
+                upload.acknowledge(start)
+                return
+            finally:
+                chunk.release()
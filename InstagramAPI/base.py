@@ -9,8 +9,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
-import calendar
-from datetime import datetime
 import json
 import logging
 import hashlib
@@ -19,21 +17,31 @@ import os
 import urllib
 import uuid
 import sys
-from time import sleep
+import threading
+from time import sleep, time
 
 import requests
 
+from . import decoding
+from .metrics import body_size, clock
+from .records import record_type
+from .transport import PooledHTTPAdapter
+
 LOGGER = logging.getLogger('InstagramAPI')
 
 if sys.version_info.major == 3:
     # The urllib library was split into other modules from Python 2 to Python 3
     import urllib.parse
+    import queue
 
-try:
-    from moviepy.editor import VideoFileClip
-except:  # imageio.core.fetching.NeedDownloadError
-    LOGGER.warning(
-        "moviepy is not correctly installed (e.g. ffmpeg not installed). VideoConfig not supported.")
+    _quote = urllib.parse.quote
+else:
+    import Queue as queue
+
+    _quote = urllib.quote
+
+# HMACs keyed with each signature key, ready to be copied for each signature.
+_prepared_hmacs = {}
 
 try:
     import credentials
@@ -58,17 +66,40 @@ class InstagramAPIBase:
     IG_SIG_KEY = '012a54f51c49aa8c5c322416ab1410909add32c966bbaa0fe3dc58ac43fd7ede'
     EXPERIMENTS = 'ig_android_progressive_jpeg,ig_creation_growth_holdout,ig_android_report_and_hide,ig_android_new_browser,ig_android_enable_share_to_whatsapp,ig_android_direct_drawing_in_quick_cam_universe,ig_android_huawei_app_badging,ig_android_universe_video_production,ig_android_asus_app_badging,ig_android_direct_plus_button,ig_android_ads_heatmap_overlay_universe,ig_android_http_stack_experiment_2016,ig_android_infinite_scrolling,ig_fbns_blocked,ig_android_white_out_universe,ig_android_full_people_card_in_user_list,ig_android_post_auto_retry_v7_21,ig_fbns_push,ig_android_feed_pill,ig_android_profile_link_iab,ig_explore_v3_us_holdout,ig_android_histogram_reporter,ig_android_anrwatchdog,ig_android_search_client_matching,ig_android_high_res_upload_2,ig_android_new_browser_pre_kitkat,ig_android_2fac,ig_android_grid_video_icon,ig_android_white_camera_universe,ig_android_disable_chroma_subsampling,ig_android_share_spinner,ig_android_explore_people_feed_icon,ig_explore_v3_android_universe,ig_android_media_favorites,ig_android_nux_holdout,ig_android_search_null_state,ig_android_react_native_notification_setting,ig_android_ads_indicator_change_universe,ig_android_video_loading_behavior,ig_android_black_camera_tab,liger_instagram_android_univ,ig_explore_v3_internal,ig_android_direct_emoji_picker,ig_android_prefetch_explore_delay_time,ig_android_business_insights_qe,ig_android_direct_media_size,ig_android_enable_client_share,ig_android_promoted_posts,ig_android_app_badging_holdout,ig_android_ads_cta_universe,ig_android_mini_inbox_2,ig_android_feed_reshare_button_nux,ig_android_boomerang_feed_attribution,ig_android_fbinvite_qe,ig_fbns_shared,ig_android_direct_full_width_media,ig_android_hscroll_profile_chaining,ig_android_feed_unit_footer,ig_android_media_tighten_space,ig_android_private_follow_request,ig_android_inline_gallery_backoff_hours_universe,ig_android_direct_thread_ui_rewrite,ig_android_rendering_controls,ig_android_ads_full_width_cta_universe,ig_video_max_duration_qe_preuniverse,ig_android_prefetch_explore_expire_time,ig_timestamp_public_test,ig_android_profile,ig_android_dv2_consistent_http_realtime_response,ig_android_enable_share_to_messenger,ig_explore_v3,ig_ranking_following,ig_android_pending_request_search_bar,ig_android_feed_ufi_redesign,ig_android_video_pause_logging_fix,ig_android_default_folder_to_camera,ig_android_video_stitching_7_23,ig_android_profanity_filter,ig_android_business_profile_qe,ig_android_search,ig_android_boomerang_entry,ig_android_inline_gallery_universe,ig_android_ads_overlay_design_universe,ig_android_options_app_invite,ig_android_view_count_decouple_likes_universe,ig_android_periodic_analytics_upload_v2,ig_android_feed_unit_hscroll_auto_advance,ig_peek_profile_photo_universe,ig_android_ads_holdout_universe,ig_android_prefetch_explore,ig_android_direct_bubble_icon,ig_video_use_sve_universe,ig_android_inline_gallery_no_backoff_on_launch_universe,ig_android_image_cache_multi_queue,ig_android_camera_nux,ig_android_immersive_viewer,ig_android_dense_feed_unit_cards,ig_android_sqlite_dev,ig_android_exoplayer,ig_android_add_to_last_post,ig_android_direct_public_threads,ig_android_prefetch_venue_in_composer,ig_android_bigger_share_button,ig_android_dv2_realtime_private_share,ig_android_non_square_first,ig_android_video_interleaved_v2,ig_android_follow_search_bar,ig_android_last_edits,ig_android_video_download_logging,ig_android_ads_loop_count_universe,ig_android_swipeable_filters_blacklist,ig_android_boomerang_layout_white_out_universe,ig_android_ads_carousel_multi_row_universe,ig_android_mentions_invite_v2,ig_android_direct_mention_qe,ig_android_following_follower_social_context'
     SIG_KEY_VERSION = '4'
+    # The JPEG quality photos are declared (and, if normalized, encoded) at.
+    JPEG_QUALITY = 87
 
     class _2FA_Required(Exception):
         """ Raised and caught internally to the class to indicate Two-Factor Authentication is turned on for login."""
         def __init__(self, two_factor_info):
             self.two_factor_info = two_factor_info
 
-    def __init__(self, username, password):
+    def __init__(self, username, password, keep_alive=True, pool_maxsize=10, warm_connections=1, rate_limiter=None,
+                 cache=None, retry_policy=None, metrics=None, transport=None):
+        """
+        :param keep_alive: if True, connections to Instagram are kept open and re-used between calls.
+        :param pool_maxsize: maximum number of connections kept open to each host.
+        :param warm_connections: number of connections to open in advance when logging in.
+        :param rate_limiter: optional throttling.RateLimiter that paces every call. May be shared between instances.
+        :param cache: optional cache.ResponseCache that answers repeated read-only calls.
+        :param retry_policy: optional retry.RetryPolicy that retries calls which failed but are safe to make again,
+               and sets the timeout of every call. May be shared between instances.
+        :param metrics: optional metrics.Metrics that measures every call. May be shared between instances.
+        :param transport: optional requests adapter that makes every call, such as a transport.RecordingAdapter or
+               transport.ReplayAdapter. By default, a transport.PooledHTTPAdapter.
+        """
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.retry_policy = retry_policy
+        self.metrics = metrics
+        self.transport = transport
         self._loggedinuserid = ''
         self._ranktoken = ''
         self._csrftoken = ''
         self._session = None
+        self._keep_alive = keep_alive
+        self._pool_maxsize = pool_maxsize
+        self._warm_connections = warm_connections
 
         md5hash = hashlib.md5()
         md5hash.update(username.encode('utf-8') + password.encode('utf-8'))
@@ -76,6 +107,10 @@ class InstagramAPIBase:
         self._setuser(username, password)
         self._isloggedin = False
         self.last_response = None
+        # Set while an iterator streams its pages: the name of the list to decode as it downloads.
+        self._stream_field = threading.local()
+        # (session fields, their JSON, quoted JSON), re-used by _signed_payload.
+        self._session_fragment = None
 
     def _setuser(self, username, password):
         self._username = username
@@ -84,16 +119,37 @@ class InstagramAPIBase:
 
     @classmethod
     def _generatesignature(cls, data):
-        if sys.version_info.major == 3:
-            parsed_data = urllib.parse.quote(data)
-        else:
-            parsed_data = urllib.quote(data)
+        return cls._signature(data, _quote(data))
+
+    @classmethod
+    def _signature(cls, data, quoted_data):
+        """ :return: the signed body of data, given data already URL-quoted. """
+        prepared_hmac = _prepared_hmacs.get(cls.IG_SIG_KEY)
+        if prepared_hmac is None:
+            prepared_hmac = _prepared_hmacs[cls.IG_SIG_KEY] = hmac.new(cls.IG_SIG_KEY.encode('utf-8'),
+                                                                        digestmod=hashlib.sha256)
+        signature = prepared_hmac.copy()
+        signature.update(data.encode('utf-8'))
+        return 'ig_sig_key_version=' + cls.SIG_KEY_VERSION + '&signed_body=' + signature.hexdigest() + '.' + quoted_data
+
+    def _signed_payload(self, **fields):
+        """
+            Most POSTs are signed JSON objects of the session's _uuid, _uid and _csrftoken, plus a few fields of their
+            own. The session's part is serialized and quoted once, and re-used until the session changes.
 
-        return (
-            'ig_sig_key_version=' + cls.SIG_KEY_VERSION +
-            '&signed_body=' + hmac.new(
-                cls.IG_SIG_KEY.encode('utf-8'), data.encode('utf-8'), hashlib.sha256).hexdigest() +
-            '.' + parsed_data)
+        :return: signed body of fields, along with the session's fields.
+        """
+        started = clock() if self.metrics is not None else None
+        session = (self._uuid, self._loggedinuserid, self._csrftoken)
+        if self._session_fragment is None or self._session_fragment[0] != session:
+            data = json.dumps({'_uuid': self._uuid, '_uid': self._loggedinuserid, '_csrftoken': self._csrftoken})[:-1]
+            self._session_fragment = (session, data, _quote(data))
+        _, data, quoted_data = self._session_fragment
+        rest = ', ' + json.dumps(fields)[1:] if fields else '}'
+        signed_body = self._signature(data + rest, quoted_data + _quote(rest))
+        if started is not None:
+            self.metrics.observe_signing(clock() - started)
+        return signed_body
 
     @staticmethod
     def _generatedeviceid(seed):
@@ -110,30 +166,206 @@ class InstagramAPIBase:
         else:
             return generated_uuid.replace('-', '')
 
+    _upload_id_lock = threading.Lock()
+    _last_upload_id = 0
+
     @staticmethod
     def generate_upload_id():
-        return str(calendar.timegm(datetime.utcnow().utctimetuple()))
+        """ :return: the time in milliseconds, bumped if need be so that no two calls in this process share a result. """
+        with InstagramAPIBase._upload_id_lock:
+            upload_id = max(int(time() * 1000), InstagramAPIBase._last_upload_id + 1)
+            InstagramAPIBase._last_upload_id = upload_id
+        return str(upload_id)
 
     @staticmethod
     def build_body(bodies, boundary):
-        body = u''
+        """
+            Builds a multipart/form-data body.
+
+        :param bodies: list of dictionaries, each describing a part with its 'type' (e.g. 'form-data'), 'name' and
+               'data' (text or bytes). File parts also have a 'filename', and any part may have a list of extra
+               'headers'.
+        :return: the body, as bytes.
+        """
+        parts = []
         for b in bodies:
-            body += u'--{boundary}\r\n'.format(boundary=boundary)
-            body += u'Content-Disposition: {b_type}; name="{b_name}"'.format(
-                b_type=b['type'], b_name=b['name'])
-            _filename = b.get('filename', None)
-            _headers = b.get('headers', None)
-            if _filename:
-                _filename, ext = os.path.splitext(_filename)
-                # TODO: Investigate why there is an _body here.
-                _body += u'; filename="pending_media_{uid}.{ext}"'.format(
+            disposition = u'Content-Disposition: {b_type}; name="{b_name}"'.format(b_type=b['type'], b_name=b['name'])
+            if b.get('filename'):
+                _, ext = os.path.splitext(b['filename'])
+                disposition += u'; filename="pending_media_{uid}{ext}"'.format(
                     uid=InstagramAPIBase.generate_upload_id(), ext=ext)
-            if _headers and isinstance(_headers, list):
-                for h in _headers:
-                    _body += u'\r\n{header}'.format(header=h)
-            body += u'\r\n\r\n{data}\r\n'.format(data=b['data'])
-        body += u'--{boundary}--'.format(boundary=boundary)
-        return body
+            lines = [u'--' + boundary, disposition] + list(b.get('headers') or [])
+            parts.append(u'\r\n'.join(lines).encode('utf-8'))
+            parts.append(b'\r\n\r\n')
+            data = b['data']
+            parts.append(data if isinstance(data, bytes) else u'{}'.format(data).encode('utf-8'))
+            parts.append(b'\r\n')
+        parts.append(u'--{boundary}--'.format(boundary=boundary).encode('utf-8'))
+        return b''.join(parts)
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = self.transport or PooledHTTPAdapter(pool_maxsize=self._pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _warm_up(self):
+        """ Opens connections ahead of time. Failure is not fatal; the real call will report any problem. """
+        if not self._keep_alive or not self._warm_connections:
+            return
+        adapter = self._session.get_adapter(self.API_URL)
+        if not isinstance(adapter, PooledHTTPAdapter):
+            return
+        try:
+            settings = self._session.merge_environment_settings(self.API_URL, {}, None, None, None)
+            opened = adapter.warm_up(self.API_URL, self._warm_connections, verify=settings['verify'],
+                                     cert=settings['cert'], proxies=settings['proxies'])
+            LOGGER.debug("Opened %s connection(s) to Instagram in advance.", opened)
+        except Exception as e:
+            LOGGER.info("Unable to open connections to Instagram in advance: %s", e)
+
+    def connection_stats(self):
+        """
+        :return: dictionary with the number of connections "opened" to Instagram, and how many calls "reused" an
+                 existing connection rather than opening a new one.
+        """
+        stats = {'opened': 0, 'reused': 0}
+        if self._session is None:
+            return stats
+        for adapter in set(self._session.adapters.values()):
+            if isinstance(adapter, PooledHTTPAdapter):
+                for key, value in adapter.connection_stats().items():
+                    stats[key] += value
+        return stats
+
+    # Saving and restoring the logged in state, so new processes needn't log in again.
+
+    SESSION_STATE_VERSION = 1
+    # Cookies that must be present, and not expired, for a restored session to be worth using.
+    SESSION_COOKIES = ('sessionid', 'ds_user_id')
+
+    def _session_cookies(self):
+        """ :return: list of dictionaries describing the cookies of the current session. """
+        if self._session is None:
+            return []
+        return [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+                 'expires': cookie.expires, 'secure': cookie.secure} for cookie in self._session.cookies]
+
+    def _install_cookies(self, cookies):
+        self._session = self._new_session()
+        for cookie in cookies:
+            self._session.cookies.set_cookie(requests.cookies.create_cookie(**cookie))
+
+    def session_state(self):
+        """
+        :return: a JSON-serialisable dictionary of everything needed to continue this session without logging in.
+                 It does not include the password, but it does give access to the account; keep it private.
+        """
+        return {
+            'version': self.SESSION_STATE_VERSION,
+            'username': self._username,
+            'device_id': self._deviceid,
+            'uuid': self._uuid,
+            'logged_in_user_id': self._loggedinuserid,
+            'rank_token': self._ranktoken,
+            'csrf_token': self._csrftoken,
+            'logged_in': self._isloggedin,
+            'cookies': self._session_cookies(),
+        }
+
+    def restore_session_state(self, state):
+        """
+            Continues a session described by session_state(), without contacting Instagram.
+
+        :return: True if the restored session looks usable (see session_is_valid()).
+        """
+        if state.get('version') != self.SESSION_STATE_VERSION:
+            raise ValueError("Unsupported session state version: %s" % state.get('version'))
+        if state['username'] != self._username:
+            raise ValueError("Session state belongs to %s, not %s" % (state['username'], self._username))
+        self._deviceid = state['device_id']
+        self._uuid = state['uuid']
+        self._loggedinuserid = state['logged_in_user_id']
+        self._ranktoken = state['rank_token']
+        self._csrftoken = state['csrf_token']
+        self._install_cookies(state['cookies'])
+        self._isloggedin = state['logged_in']
+        return self.session_is_valid()
+
+    def session_is_valid(self, now=None):
+        """
+            Cheaply checks, without contacting Instagram, whether this session is logged in and none of its session
+            cookies have expired. Instagram may still have ended the session early.
+        """
+        if not self._isloggedin:
+            return False
+        now = now if now is not None else time()
+        for cookie in self._session_cookies():
+            if cookie['name'] in self.SESSION_COOKIES and cookie['expires'] is not None and cookie['expires'] <= now:
+                return False
+        return True
+
+    def save_session(self, filename):
+        """ Saves session_state() to a file, readable only by the current user. """
+        temporary_filename = filename + '.tmp'
+        descriptor = os.open(temporary_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, 'w') as session_file:
+            json.dump(self.session_state(), session_file)
+        if hasattr(os, 'replace'):
+            os.replace(temporary_filename, filename)
+        else:
+            os.rename(temporary_filename, filename)
+
+    def load_session(self, filename):
+        """
+            Restores the session saved by save_session().
+
+        :return: True if the restored session looks usable. False if the file is missing or damaged, or the session
+                 has expired, in which case login() is needed.
+        """
+        try:
+            with open(filename) as session_file:
+                state = json.load(session_file)
+        except (IOError, OSError):
+            return False
+        except ValueError as e:
+            LOGGER.warning("Session file %s is damaged, so it can't be restored: %s", filename, e)
+            return False
+        return self.restore_session_state(state)
+
+    def __getstate__(self):
+        # The HTTP session can't be pickled usefully; its cookies are carried over and it is rebuilt on unpickling.
+        state = self.__dict__.copy()
+        state['_session'] = None
+        state['_session_cookies'] = self._session_cookies()
+        del state['_stream_field']
+        if '_two_factor_callback' in state:
+            state['_two_factor_callback'] = None  # Often a lambda or closure, which can't be pickled.
+        return state
+
+    def __setstate__(self, state):
+        cookies = state.pop('_session_cookies')
+        self.__dict__.update(state)
+        self._stream_field = threading.local()
+        if cookies or self._isloggedin:
+            self._install_cookies(cookies)
+
+    def _default_headers(self):
+        return {
+            'Connection': 'keep-alive' if self._keep_alive else 'close',
+            'Accept': '*/*',
+            'Content-type': 'application/x-www-form-urlencoded; charset=UTF-8',
+            'Cookie2': '$Version=1',
+            'Accept-Language': 'en-US',
+            'User-Agent': self.USER_AGENT}
+
+    def _check_two_factor_required(self, text):
+        """ Instagram reports that the login needs a second factor in the body of an HTTP 400 response. """
+        json_dict = json.loads(text)
+        if "two_factor_required" in json_dict and json_dict["two_factor_required"]:
+            LOGGER.info("2FA required.")
+            raise self._2FA_Required(two_factor_info=json_dict["two_factor_info"])
 
     def _sendrequest(self, endpoint, post=None, login=False, headers=None):
         """
@@ -141,7 +373,8 @@ class InstagramAPIBase:
         :param post: data to HTTP POST. If None, do a GET call.
         :param login: if True, this is a call to login, so no need to check we are logged in. Also changes return type.
         :param headers: if not None, override default headers
-        :return: full response from Instagram if login, else just extracted dictionary of JSON part
+        :return: full response from Instagram if login, else just extracted dictionary of JSON part (or, for a GET
+                 made while an iterator is streaming, a decoding.StreamedPage)
         """
 
         # login parameter indicates
@@ -150,41 +383,87 @@ class InstagramAPIBase:
         if not self._isloggedin and not login:
             raise AuthenticationError("Not logged in.")
 
-        headers = headers or {
-            'Connection': 'close',
-            'Accept': '*/*',
-            'Content-type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            'Cookie2': '$Version=1',
-            'Accept-Language': 'en-US',
-            'User-Agent': self.USER_AGENT}
-        self._session.headers.update(headers)
+        if self.cache is not None and not login:
+            cached = self.cache.get(endpoint)
+            if cached is not None:
+                LOGGER.debug("Answered call to %s from the cache.", endpoint)
+                return cached
 
-        LOGGER.debug("%s call to %s %s",
-                     "POST" if post else "GET", endpoint, post)
-        try:
-            if post is not None:  # POST
-                response = self._session.post(
-                    self.API_URL + endpoint, data=post)  # , verify=False
-            else:  # GET
-                response = self._session.get(
-                    self.API_URL + endpoint)  # , verify=False
-        except requests.RequestException as re:
-            LOGGER.info("Call to Instagram failed: %s", re)
-            raise
+        # Headers are sent with this request only, so they don't leak into later calls on the shared session.
+        headers = headers or self._default_headers()
 
-        try:
-            response.raise_for_status()
-        except requests.RequestException as re:
-            # Special case for 2FA response:
-            if isinstance(re, requests.HTTPError) and response.status_code == 400:
-                json_dict = json.loads(response.text)
-                if "two_factor_required" in json_dict and json_dict["two_factor_required"]:
-                    LOGGER.info("2FA required.")
-                    raise self._2FA_Required(two_factor_info=json_dict["two_factor_info"])
-
-            LOGGER.info("Instagram returned HTTP Error Code %s: (%s)",
-                        response.status_code, response.text)
-            raise
+        stream_field = getattr(self._stream_field, 'value', None) if post is None and not login else None
+
+        retry_policy = self.retry_policy
+        metrics = self.metrics
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                slept = self.rate_limiter.acquire(endpoint)
+                if metrics is not None and slept:
+                    metrics.observe_throttle(endpoint, slept)
+
+            LOGGER.debug("%s call to %s %s",
+                         "POST" if post else "GET", endpoint, post)
+            started = clock() if metrics is not None else None
+            try:
+                if post is not None:  # POST
+                    response = self._session.post(
+                        self.API_URL + endpoint, data=post, headers=headers,
+                        timeout=retry_policy and retry_policy.timeout)  # , verify=False
+                else:  # GET
+                    response = self._session.get(
+                        self.API_URL + endpoint, headers=headers, stream=stream_field is not None,
+                        timeout=retry_policy and retry_policy.timeout)  # , verify=False
+            except requests.RequestException as re:
+                LOGGER.info("Call to Instagram failed: %s", re)
+                if metrics is not None:
+                    metrics.observe_call(endpoint, 'GET' if post is None else 'POST', None, clock() - started,
+                                         body_size(post))
+                if retry_policy is not None and isinstance(re, (requests.ConnectionError, requests.Timeout)):
+                    delay = retry_policy.retry_delay(endpoint, post, attempt,
+                                                     sent=not isinstance(re, requests.ConnectTimeout))
+                    if delay is not None:
+                        retry_policy.wait(delay)
+                        attempt += 1
+                        continue
+                    retry_policy.record(endpoint, attempt, succeeded=False)
+                raise
+
+            if self.rate_limiter is not None:
+                self.rate_limiter.record(endpoint, response.status_code)
+            if metrics is not None:
+                # The bytes sent over the wire (which may be compressed), as declared. A streamed response hasn't been
+                # read yet, so otherwise its size isn't known.
+                size = response.headers.get('Content-Length')
+                if size is None:
+                    size = 0 if stream_field is not None else len(response.content)
+                metrics.observe_call(endpoint, 'GET' if post is None else 'POST', response.status_code,
+                                     clock() - started, body_size(post), int(size))
+
+            try:
+                response.raise_for_status()
+            except requests.RequestException as re:
+                # Special case for 2FA response:
+                if isinstance(re, requests.HTTPError) and response.status_code == 400:
+                    self._check_two_factor_required(response.text)
+
+                LOGGER.info("Instagram returned HTTP Error Code %s: (%s)",
+                            response.status_code, response.text)
+                if retry_policy is not None:
+                    delay = retry_policy.retry_delay(endpoint, post, attempt, status=response.status_code,
+                                                     retry_after=response.headers.get('Retry-After'))
+                    if delay is not None:
+                        response.close()
+                        retry_policy.wait(delay)
+                        attempt += 1
+                        continue
+                    retry_policy.record(endpoint, attempt, succeeded=False)
+                raise
+            break
+
+        if retry_policy is not None:
+            retry_policy.record(endpoint, attempt, succeeded=True)
 
         if login:
             # Need full reponse, containing cookies
@@ -193,24 +472,131 @@ class InstagramAPIBase:
 
         # Otherwise, unpack just the JSON part
 
-        json_dict = json.loads(response.text)
+        if stream_field is not None:
+            LOGGER.debug("Instagram responded successfully. Streaming %s.", stream_field)
+            return decoding.StreamedPage(response, stream_field)
+
+        if metrics is not None:
+            started = clock()
+            json_dict = decoding.loads(response.content)
+            metrics.observe_decode(endpoint, clock() - started)
+        else:
+            json_dict = decoding.loads(response.content)
 
         LOGGER.debug("Instagram responded successfully: %s", json_dict)
+        if self.cache is not None:
+            self._update_cache(endpoint, post, json_dict)
         return json_dict
 
-    @staticmethod
-    def _iterator_template(func, field, delay_between_calls=0):
+    def _update_cache(self, endpoint, post, json_dict):
+        if post is not None:
+            self.cache.invalidate_for(endpoint)
+        self.cache.put(endpoint, json_dict)
+
+    def _iterator_template(self, func, field, delay_between_calls=0, prefetch=0, stream=False, fields=None):
         """ 
             Handles pagination and throttling.
+
+            If prefetch is non-zero, up to that many pages are fetched in the background while the caller is still
+            processing the current page.
+
+            If stream is True, items are decoded and yielded while each page is still downloading.
+
+            If fields is given, each item is yielded as a record of just those fields (see records.py).
+        """
+        if prefetch and stream:
+            raise ValueError("Pages can't be both prefetched and streamed.")
+        if stream:
+            func = self._streaming(func, field)
+        if prefetch:
+            pages = InstagramAPIBase._prefetched_pages(func, delay_between_calls, prefetch)
+        else:
+            pages = InstagramAPIBase._pages(func, delay_between_calls)
+        if self.metrics is not None:
+            pages = self.metrics.timed_pages(pages, field)
+        if fields is not None:
+            make = record_type(fields).from_dict
+            for json_dict in pages:
+                for item in json_dict.get(field, []):
+                    yield make(item)
+            return
+        for json_dict in pages:
+            for item in json_dict.get(field, []):
+                yield item
+
+    def _streaming(self, func, field):
+        """ :return: a version of func whose GET calls stream the list named field. """
+        def fetch(max_id):
+            self._stream_field.value = field
+            try:
+                return func(max_id=max_id)
+            finally:
+                self._stream_field.value = None
+        return fetch
+
+    @staticmethod
+    def _pages(func, delay_between_calls=0, stop=None):
+        """
+            Yields each page of results.
+
+            delay_between_calls is measured from when a page arrived, so time the caller spends processing the page
+            counts towards it.
         """
         max_id = None
         while True:
             json_dict = func(max_id=max_id)
+            arrived = time()
+            yield json_dict
+            # Read after the caller is done with the page, as a streamed page only knows it at the end.
             max_id = json_dict.get('next_max_id', None)
-            for item in json_dict.get(field, []):
-                yield item
             if not max_id:
                 break
-            sleep(delay_between_calls)  # Avoid overloading Instagram
-            # Consider moving the throttling into a separate function that factors in the time spent
-            # outside of the iterator.
+            # Avoid overloading Instagram
+            delay = max(0, delay_between_calls - (time() - arrived))
+            if stop is None:
+                sleep(delay)
+            elif stop.wait(delay):
+                break
+
+    @staticmethod
+    def _prefetched_pages(func, delay_between_calls, prefetch):
+        """
+            Yields the same pages as _pages, but fetches them on a worker thread, staying up to prefetch pages ahead.
+
+            If the generator is closed early, the worker stops after the call it is currently making.
+        """
+        pages = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+
+        def put(entry):
+            while not stop.is_set():
+                try:
+                    pages.put(entry, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def fetch():
+            try:
+                for json_dict in InstagramAPIBase._pages(func, delay_between_calls, stop):
+                    if not put((json_dict, None)):
+                        return
+            except Exception as e:
+                put((None, e))
+            else:
+                put((None, None))
+
+        worker = threading.Thread(target=fetch, name='InstagramAPI-prefetch')
+        worker.daemon = True
+        worker.start()
+        try:
+            while True:
+                json_dict, error = pages.get()
+                if error is not None:
+                    raise error
+                if json_dict is None:
+                    break
+                yield json_dict
+        finally:
+            stop.set()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains an uploader of many photos and videos, which remembers what it has already posted.
+
+    Uploading is a pipeline: while one item is being sent, worker threads probe the next items and prepare their
+    requests, so the connection to Instagram is kept busy rather than waiting on the disk.
+    """
+
+from __future__ import absolute_import
+
+import collections
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from .base import AuthenticationError
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+
+class BulkUploader(object):
+    """ Uploads a list of photos and videos through one logged in API instance.
+
+        Each item is a photo's filename, or a dictionary with either a 'photo', or a 'video' and its 'thumbnail', and
+        optionally a 'caption'.
+
+        If a checkpoint file is given, each item is recorded in it (as a line of JSON) once posted, and items already
+        recorded are skipped, so a bulk upload that was interrupted can be restarted with the same list.
+    """
+
+    def __init__(self, api, checkpoint_file=None, caption='', workers=4, delay_between_uploads=0, normalizer=None,
+                 processes=None):
+        """
+        :param api: a logged in InstagramAPI. Give it a RateLimiter to keep the uploads within a budget.
+        :param checkpoint_file: optional file in which the items already posted are recorded.
+        :param caption: caption for the items that don't have their own.
+        :param workers: number of threads preparing items ahead of the upload.
+        :param delay_between_uploads: number of seconds to wait between posts, or a (shortest, longest) pair to wait a
+               random time in between.
+        :param normalizer: optional image_prep.ImageNormalizer, to shrink, crop and re-encode photos before they are
+               sent. Photos are normalized in a pool of processes, ahead of the upload.
+        :param processes: number of processes normalizing photos. Defaults to the number of CPUs.
+        """
+        self.api = api
+        self.checkpoint_file = checkpoint_file
+        self.caption = caption
+        self.workers = workers
+        self.delay_between_uploads = delay_between_uploads
+        self.normalizer = normalizer
+        self.processes = processes
+        self._process_pool = None
+        # Normalized copies of photos that were prepared but not yet posted, to remove if the upload stops early.
+        self._normalized = set()
+        self._lock = threading.Lock()
+        self._done = self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        if self.checkpoint_file is None:
+            return {}
+        try:
+            with open(self.checkpoint_file) as checkpoint_file:
+                text = checkpoint_file.read()
+        except (IOError, OSError):
+            return {}
+        try:
+            done, lines = self._parse_checkpoint(text)
+        except (ValueError, KeyError) as e:
+            # Starting afresh would post everything again, so a damaged checkpoint has to be dealt with by hand.
+            LOGGER.error("Checkpoint file %s is damaged: %s", self.checkpoint_file, e)
+            raise ValueError("Checkpoint file %s is damaged (%s). Repair or remove it to upload again."
+                             % (self.checkpoint_file, e))
+        if lines != len(done):
+            self._save_checkpoint(done)  # Compacted, or converted from the format of earlier versions.
+        return done
+
+    @staticmethod
+    def _parse_checkpoint(text):
+        """ :return: (dictionary of the items recorded, number of lines they were recorded in, or None). """
+        try:
+            done = json.loads(text)
+        except ValueError:
+            done = None
+        if isinstance(done, dict) and 'key' not in done:  # Earlier versions wrote a single object of every item.
+            return done, None
+        done, lines = {}, 0
+        for line in text.splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                done[entry.pop('key')] = entry
+                lines += 1
+        return done, lines
+
+    def _save_checkpoint(self, done):
+        """ Rewrites the checkpoint file, with a line for each item in done. """
+        temporary_filename = self.checkpoint_file + '.tmp'
+        with open(temporary_filename, 'w') as checkpoint_file:
+            for key in sorted(done):
+                checkpoint_file.write(self._checkpoint_line(key, done[key]))
+        if hasattr(os, 'replace'):
+            os.replace(temporary_filename, self.checkpoint_file)
+        else:
+            os.rename(temporary_filename, self.checkpoint_file)
+
+    @staticmethod
+    def _checkpoint_line(key, entry):
+        line = dict(entry)
+        line['key'] = key
+        return json.dumps(line, sort_keys=True) + '\n'
+
+    @staticmethod
+    def key(item):
+        """ :return: the name item is recorded under in the checkpoint file. """
+        if not isinstance(item, dict):
+            return os.path.abspath(item)
+        return os.path.abspath(item['video'] if 'video' in item else item['photo'])
+
+    def is_done(self, item):
+        with self._lock:
+            return self.key(item) in self._done
+
+    def _prepare(self, item):
+        """ Probes item and builds the body of the request that posts it. Runs on a worker thread. """
+        if not isinstance(item, dict):
+            item = {'photo': item}
+        upload_id = self.api.generate_upload_id()
+        caption = item.get('caption', self.caption)
+        if 'video' in item:
+            configuration = self.api._video_configuration(upload_id, item['video'], caption)
+            return item, upload_id, configuration, None
+        photo = item['photo']
+        if self._process_pool is not None:
+            # This thread waits while a process does the work, so as many photos are normalized at once as there are
+            # processes.
+            photo = self._process_pool.apply(self.normalizer.normalize, (photo,))
+            if photo != item['photo']:
+                with self._lock:
+                    self._normalized.add(photo)
+        try:
+            configuration = self.api._photo_configuration(upload_id, photo, caption)
+        except Exception:
+            self._remove_normalized(item, photo)
+            raise
+        return item, upload_id, configuration, photo
+
+    def _post(self, item, upload_id, configuration, photo):
+        try:
+            if 'video' in item:
+                return self.api._post_prepared('video', upload_id, configuration, item['video'], item['thumbnail'])
+            return self.api._post_prepared('photo', upload_id, configuration, photo)
+        finally:
+            self._remove_normalized(item, photo)
+
+    def _remove_normalized(self, item, photo):
+        if photo is not None and photo != item['photo']:
+            with self._lock:
+                self._normalized.discard(photo)
+            os.remove(photo)
+
+    def _wait(self, since):
+        delay = self.delay_between_uploads
+        if isinstance(delay, (tuple, list)):
+            delay = random.uniform(*delay)
+        delay -= time.time() - since
+        if delay > 0:
+            LOGGER.info("Waiting %.0f seconds before the next upload.", delay)
+            time.sleep(delay)
+
+    def upload(self, items):
+        """
+            Uploads each item not already recorded in the checkpoint file, in order.
+
+            An item that fails is logged and left out of the checkpoint file, and the upload carries on with the next
+            item. Failing to be logged in stops the upload.
+
+        :return: list of dictionaries with the "item", Instagram's "response" to posting it (or None) and the "error"
+                 it failed with (or None), for each item attempted.
+        """
+        from multiprocessing.pool import ThreadPool  # Slow to import, and only needed here.
+
+        items = list(items)
+        pending = [item for item in items if not self.is_done(item)]
+        LOGGER.info("Uploading %d items; %d were already uploaded.", len(pending), len(items) - len(pending))
+        results = []
+        if not pending:
+            return results
+        pool = ThreadPool(max(1, min(self.workers, len(pending))))
+        if self.normalizer is not None:
+            import multiprocessing
+
+            self._process_pool = multiprocessing.Pool(self.processes)
+        # Items are prepared in order, at most a couple per worker ahead of the one being posted, so normalized copies
+        # and prepared requests don't pile up while the uploads wait on Instagram.
+        prepare = self._guarded(self._prepare)
+        to_prepare = iter(pending)
+        window = collections.deque()
+
+        def submit():
+            for item in to_prepare:
+                window.append((item, pool.apply_async(prepare, (item,))))
+                return True
+            return False
+
+        try:
+            while len(window) < max(1, self.workers) * 2 and submit():
+                pass
+            last_post = None
+            while window:
+                item, preparing = window.popleft()
+                prepared, error = preparing.get()
+                submit()
+                response = None
+                if error is None:
+                    if last_post is not None:
+                        self._wait(last_post)
+                    try:
+                        response = self._post(*prepared)
+                    except AuthenticationError:
+                        raise
+                    except Exception as e:
+                        error = e
+                    last_post = time.time()
+                if error is None:
+                    self._record(item, response)
+                else:
+                    LOGGER.warning("Failed to upload %s: %s", self.key(item), error)
+                results.append({'item': item, 'response': response, 'error': error})
+        finally:
+            pool.terminate()
+            pool.join()
+            if self._process_pool is not None:
+                self._process_pool.terminate()
+                self._process_pool.join()
+                self._process_pool = None
+            # Photos normalized ahead of an upload that stopped before posting them.
+            with self._lock:
+                leftovers, self._normalized = self._normalized, set()
+            for photo in leftovers:
+                try:
+                    os.remove(photo)
+                except OSError:
+                    pass
+        return results
+
+    @staticmethod
+    def _guarded(func):
+        def call(item):
+            try:
+                return func(item), None
+            except Exception as e:
+                return None, e
+
+        return call
+
+    def _record(self, item, response):
+        with self._lock:
+            media = response.get('media', {}) if isinstance(response, dict) else {}
+            key = self.key(item)
+            self._done[key] = {'media_id': media.get('id'), 'uploaded': time.time()}
+            if self.checkpoint_file is not None:
+                # Appending a line per item keeps recording each upload cheap, however long the list.
+                with open(self.checkpoint_file, 'a') as checkpoint_file:
+                    checkpoint_file.write(self._checkpoint_line(key, self._done[key]))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains the optional cache of responses from read-only endpoints.
+
+    Give a ResponseCache to an API instance to have repeated look-ups answered from memory. Some answers (such as
+    friendship status) depend on the logged in user, so don't share a cache between accounts.
+    """
+
+from __future__ import absolute_import
+
+import collections
+import logging
+import re
+import threading
+import time
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+
+class ResponseCache(object):
+    """ A size-bounded, least-recently-used cache of decoded responses, with a time-to-live for each endpoint.
+
+        Only endpoints with a time-to-live are cached. Successful calls to endpoints that change something remove the
+        cached responses they make stale; e.g. follow() removes the cached user_friendship() of that user.
+
+        Cached responses are shared between callers, so they should be treated as read-only.
+    """
+
+    # (pattern, seconds) for each cacheable endpoint. The first matching pattern wins.
+    DEFAULT_TTLS = (
+        (r'users/[^/]+/info/', 300),  # get_username_info
+        (r'users/[^/]+/usernameinfo/', 300),  # search_username
+        (r'media/[^/]+/info/', 60),  # media_info
+        (r'media/[^/]+/likers/', 60),  # get_media_likers
+        (r'friendships/show/[^/]+/', 60),  # user_friendship
+    )
+
+    # (pattern of an endpoint that changes something, prefixes of the cached endpoints it makes stale).
+    INVALIDATIONS = (
+        (r'friendships/(?:create|destroy|block|unblock)/(?P<id>[^/]+)/', ('friendships/show/{id}/',)),
+        (r'media/(?P<id>[^/]+)/(?:like|unlike|comment|delete|edit_media)/', ('media/{id}/info/', 'media/{id}/likers/')),
+    )
+
+    def __init__(self, maxsize=1024, ttls=None, clock=time.time):
+        """
+        :param maxsize: maximum number of responses kept.
+        :param ttls: optional list of (pattern, seconds), consulted before DEFAULT_TTLS. Use 0 seconds to stop an
+               endpoint being cached.
+        """
+        self.maxsize = maxsize
+        self._clock = clock
+        self._ttls = [(re.compile(pattern), seconds) for pattern, seconds in list(ttls or []) + list(self.DEFAULT_TTLS)]
+        self._invalidations = [(re.compile(pattern), prefixes) for pattern, prefixes in self.INVALIDATIONS]
+        self._entries = collections.OrderedDict()  # endpoint -> (expiry time, response), least recently used first.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def ttl(self, endpoint):
+        """ :return: number of seconds responses from endpoint may be cached for, or 0 if they mustn't be. """
+        for pattern, seconds in self._ttls:
+            if pattern.match(endpoint):
+                return seconds
+        return 0
+
+    def get(self, endpoint):
+        """ :return: the cached response from endpoint, or None if there isn't a fresh one. """
+        with self._lock:
+            entry = self._entries.get(endpoint)
+            if entry is not None:
+                expiry, response = entry
+                if expiry > self._clock():
+                    self._move_to_end(endpoint)
+                    self.hits += 1
+                    return response
+                del self._entries[endpoint]
+            if self.ttl(endpoint):
+                self.misses += 1
+            return None
+
+    def _move_to_end(self, endpoint):
+        if hasattr(self._entries, 'move_to_end'):
+            self._entries.move_to_end(endpoint)
+        else:
+            self._entries[endpoint] = self._entries.pop(endpoint)
+
+    def put(self, endpoint, response):
+        """ Caches response from endpoint, if endpoint is cacheable. """
+        ttl = self.ttl(endpoint)
+        if not ttl:
+            return
+        with self._lock:
+            self._entries.pop(endpoint, None)
+            self._entries[endpoint] = (self._clock() + ttl, response)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, prefix):
+        """ Removes the cached responses of every endpoint starting with prefix. """
+        with self._lock:
+            for endpoint in [endpoint for endpoint in self._entries if endpoint.startswith(prefix)]:
+                del self._entries[endpoint]
+
+    def invalidate_for(self, endpoint):
+        """ Removes the cached responses made stale by a successful call to endpoint. """
+        for pattern, prefixes in self._invalidations:
+            match = pattern.match(endpoint)
+            if match:
+                for prefix in prefixes:
+                    LOGGER.debug("Call to %s invalidates cached %s", endpoint, prefix.format(**match.groupdict()))
+                    self.invalidate(prefix.format(**match.groupdict()))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """ :return: dictionary of the number of "hits", "misses" and "evictions", and the current "size". """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._entries)}
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains the book-keeping for uploading a video in chunks.
+
+    The video is memory-mapped and each chunk is sent straight from the mapping, so the file is never read into memory
+    as a whole. The chunks Instagram has acknowledged can be recorded in a resume file, so that an interrupted upload
+    carries on where it stopped rather than starting again.
+    """
+
+from __future__ import absolute_import
+
+import json
+import logging
+import mmap
+import os
+import threading
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class ChunkedUpload(object):
+    """ The chunks of a video file, and which of them have been acknowledged.
+
+        Use as a context manager to map the file into memory while the chunks are being sent.
+    """
+
+    # Seconds to wait before sending a failed chunk again. Doubles with each further attempt.
+    RETRY_DELAY = 1.0
+
+    def __init__(self, filename, chunk_size=DEFAULT_CHUNK_SIZE, resume_file=None):
+        """
+        :param filename: the video file.
+        :param chunk_size: number of bytes sent in each request.
+        :param resume_file: optional file in which the progress of the upload is kept. If it records an earlier,
+               unfinished upload of the same file, that upload is continued.
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive.")
+        self.filename = os.path.abspath(filename)
+        self.chunk_size = chunk_size
+        self.resume_file = resume_file
+        self.size = os.path.getsize(filename)
+        self.upload_id = None
+        self.upload_url = None
+        self.upload_job = None
+        self._modified = os.path.getmtime(filename)
+        self._acknowledged = set()
+        self._lock = threading.Lock()
+        self._file = None
+        self._mmap = None
+        if resume_file is not None:
+            self._load()
+
+    @property
+    def started(self):
+        """ True if Instagram has already been asked for somewhere to upload the video to. """
+        return self.upload_url is not None
+
+    def start(self, upload_id, upload_url, upload_job):
+        """ Records where Instagram asked for the video to be uploaded to. """
+        with self._lock:
+            self.upload_id, self.upload_url, self.upload_job = upload_id, upload_url, upload_job
+            self._acknowledged = set()
+            self._save()
+
+    def chunks(self):
+        """ :return: list of (start, end) byte ranges of every chunk. """
+        return [(start, min(start + self.chunk_size, self.size)) for start in range(0, self.size, self.chunk_size)]
+
+    def pending(self):
+        """ :return: list of (start, end) byte ranges of the chunks that haven't been acknowledged yet. """
+        with self._lock:
+            return [(start, end) for start, end in self.chunks() if start not in self._acknowledged]
+
+    def acknowledge(self, start):
+        """ Records that Instagram has received the chunk starting at byte start. """
+        with self._lock:
+            self._acknowledged.add(start)
+            self._save()
+
+    def finish(self):
+        """ Forgets the upload, once every chunk has been acknowledged. """
+        if self.resume_file is not None and os.path.exists(self.resume_file):
+            os.remove(self.resume_file)
+
+    def view(self, start, end):
+        """ :return: bytes [start, end) of the file, without copying them where possible. """
+        try:
+            return memoryview(self._mmap)[start:end]
+        except TypeError:  # Python 2's mmap doesn't support memoryview, so copy just this chunk.
+            return self._mmap[start:end]
+
+    def __enter__(self):
+        self._file = open(self.filename, 'rb')
+        if self.size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A chunk is still referenced (e.g. by a traceback); the mapping is released along with it.
+                LOGGER.debug("Leaving %s mapped until its last chunk is released.", self.filename)
+            self._mmap = None
+        self._file.close()
+        self._file = None
+
+    def _load(self):
+        try:
+            with open(self.resume_file) as resume_file:
+                state = json.load(resume_file)
+        except (IOError, OSError, ValueError):
+            return
+        if [state.get('filename'), state.get('size'), state.get('modified'), state.get('chunk_size')] != [
+                self.filename, self.size, self._modified, self.chunk_size]:
+            LOGGER.info("Ignoring %s, which records the upload of a different file.", self.resume_file)
+            return
+        self.upload_id, self.upload_url, self.upload_job = state['upload_id'], state['upload_url'], state['upload_job']
+        self._acknowledged = set(state['acknowledged'])
+        LOGGER.info("Resuming the upload of %s; %d chunks were already acknowledged.",
+                    self.filename, len(self._acknowledged))
+
+    def _save(self):
+        if self.resume_file is None:
+            return
+        temporary_filename = self.resume_file + '.tmp'
+        with open(temporary_filename, 'w') as resume_file:
+            json.dump({
+                'filename': self.filename,
+                'size': self.size,
+                'modified': self._modified,
+                'chunk_size': self.chunk_size,
+                'upload_id': self.upload_id,
+                'upload_url': self.upload_url,
+                'upload_job': self.upload_job,
+                'acknowledged': sorted(self._acknowledged),
+            }, resume_file)
+        if hasattr(os, 'replace'):
+            os.replace(temporary_filename, self.resume_file)
+        else:
+            os.rename(temporary_filename, self.resume_file)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains the decoding of Instagram's JSON responses.
+
+    Responses are decoded straight from bytes, using the fastest JSON library installed (orjson, then ujson, then the
+    standard json module). If ijson is installed, pages of results can also be decoded while they are downloading.
+    """
+
+from __future__ import absolute_import
+
+import json
+import logging
+import sys
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+try:
+    import orjson
+
+    BACKEND = 'orjson'
+    _loads = orjson.loads
+except ImportError:
+    try:
+        import ujson
+
+        BACKEND = 'ujson'
+        _loads = ujson.loads
+    except ImportError:
+        BACKEND = 'json'
+        _loads = json.loads
+
+
+def loads(data):
+    """ Decodes a JSON document from bytes (or text). """
+    if BACKEND == 'json' and isinstance(data, bytes) and (3, 0) <= sys.version_info < (3, 6):
+        data = data.decode('utf-8')  # Before Python 3.6, json only accepts text.
+    return _loads(data)
+
+
+def _import_ijson():
+    try:
+        import ijson
+    except ImportError:
+        return None
+    return ijson
+
+
+class StreamedPage(object):
+    """ A page of results whose list of items is decoded while the response is still downloading.
+
+        get(field) returns an iterator over the items in the list; it may only be iterated once. Other top-level
+        values (such as 'next_max_id') are available once the items have been iterated over, and only simple values
+        (not lists or dictionaries) are kept.
+
+        Without ijson, the whole response is decoded at once, but the same interface is provided.
+    """
+
+    _SCALAR_EVENTS = ('null', 'boolean', 'integer', 'double', 'number', 'string')
+
+    def __init__(self, response, field):
+        self._response = response
+        self._field = field
+        self._top = {}
+        self._items = self._iter_items()
+        self._done = False
+
+    def _iter_items(self):
+        ijson = _import_ijson()
+        try:
+            if ijson is None:
+                json_dict = loads(self._response.content)
+                items = json_dict.pop(self._field, [])
+                self._top = json_dict
+                for item in items:
+                    yield item
+            else:
+                for item in self._parse(ijson):
+                    yield item
+        finally:
+            self._done = True
+            self._response.close()
+
+    def _parse(self, ijson):
+        raw = self._response.raw
+        raw.decode_content = True  # Let urllib3 undo any gzip encoding.
+        item_prefix = self._field + '.item'
+        builder = None
+        for prefix, event, value in self._events(ijson, raw):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == item_prefix and event in ('end_map', 'end_array'):
+                    yield builder.value
+                    builder = None
+            elif prefix == item_prefix:
+                if event in ('start_map', 'start_array'):
+                    builder = ijson.ObjectBuilder()
+                    builder.event(event, value)
+                else:
+                    yield value
+            elif prefix and '.' not in prefix and event in self._SCALAR_EVENTS:
+                self._top[prefix] = value
+
+    @staticmethod
+    def _events(ijson, raw):
+        try:
+            return ijson.parse(raw, use_float=True)
+        except TypeError:  # Versions of ijson before 3.1 always produce Decimals.
+            return ijson.parse(raw)
+
+    def get(self, key, default=None):
+        if key == self._field:
+            return self._items
+        if not self._done:
+            # Skip over the rest of the items to reach the values after them.
+            for _ in self._items:
+                pass
+        return self._top.get(key, default)
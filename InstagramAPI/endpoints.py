@@ -14,12 +14,13 @@ from __future__ import absolute_import
 import requests
 import json
 import logging
+import os
 import urllib
 import time
-import copy
-import math
 import sys
 from .base import InstagramAPIBase, AuthenticationError
+from .chunked_upload import ChunkedUpload, DEFAULT_CHUNK_SIZE
+from .metrics import body_size, clock
 
 LOGGER = logging.getLogger('InstagramAPI')
 
@@ -32,14 +33,34 @@ try:
 except ImportError:
     # Issue 159, python3 import fix
     from .image_utils import get_image_size
+from .video_utils import get_video_info
 
-from requests_toolbelt import MultipartEncoder
+# The name video chunk uploads go by for the rate limiter (in the 'media' family) and in metrics; their URL is
+# Instagram's choice, and differs for every upload.
+VIDEO_CHUNK_ENDPOINT = 'upload/video/chunk/'
 
-try:
-    from moviepy.editor import VideoFileClip
-except:  # imageio.core.fetching.NeedDownloadError
-    LOGGER.warning(
-        "moviepy is not correctly installed (e.g. ffmpeg not installed). VideoConfig not supported.")
+
+# The upload dependencies are slow to import (moviepy pulls in numpy, imageio and ffmpeg), and many clients never
+# upload, so they are imported the first time they are needed.
+
+def _multipart_encoder(fields, boundary):
+    from requests_toolbelt import MultipartEncoder
+    return MultipartEncoder(fields, boundary=boundary)
+
+
+def _multipart_monitor(encoder, progress):
+    from requests_toolbelt import MultipartEncoderMonitor
+    return MultipartEncoderMonitor(encoder, lambda monitor: progress(monitor.bytes_read, monitor.len))
+
+
+def _video_file_clip(video):
+    try:
+        from moviepy.editor import VideoFileClip
+    except:  # imageio.core.fetching.NeedDownloadError
+        LOGGER.warning(
+            "moviepy is not correctly installed (e.g. ffmpeg not installed). VideoConfig not supported.")
+        raise
+    return VideoFileClip(video)
 
 try:
     import credentials
@@ -58,7 +79,10 @@ class InstagramAPIEndPoints(InstagramAPIBase):
 
     """
 
-    def __init__(self, username, password, two_factor_callback=None):
+    # Number of recipients a media share is sent to in one call, by direct_share_batched.
+    DIRECT_SHARE_BATCH_SIZE = 15
+
+    def __init__(self, username, password, two_factor_callback=None, **kwargs):
         """
         :param two_factor_callback: a function that takes a dictionary of "two_factor_info", and returns an
                verification string for logging in. Typically, this function would be prompt the user to enter the text
@@ -66,8 +90,9 @@ class InstagramAPIEndPoints(InstagramAPIBase):
                two_factor_info parameter typically contains the user name, parts of the phone number, a unique
                identifier, and details about how frequently the requests may be attempted without triggering robocalls
                or other consequences.
+        :param kwargs: connection options passed to InstagramAPIBase (e.g. keep_alive, pool_maxsize).
                """
-        InstagramAPIBase.__init__(self, username, password)
+        InstagramAPIBase.__init__(self, username, password, **kwargs)
         self._two_factor_callback = two_factor_callback
 
     def auto_complete_user_list(self):
@@ -78,115 +103,103 @@ class InstagramAPIEndPoints(InstagramAPIBase):
         raise NotImplementedError()
 
     def block(self, user_id):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            'user_id': user_id,
-            '_csrftoken': self._csrftoken
-        })
-        return self._sendrequest('friendships/block/' + str(user_id) + '/', self._generatesignature(data))
+        return self._sendrequest('friendships/block/' + str(user_id) + '/', self._signed_payload(user_id=user_id))
 
     def change_password(self, new_password):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken,
-            'old_password': self._password,
-            'new_password1': new_password,
-            'new_password2': new_password
-        })
-        return self._sendrequest('accounts/change_password/', self._generatesignature(data))
+        return self._sendrequest('accounts/change_password/', self._signed_payload(
+            old_password=self._password,
+            new_password1=new_password,
+            new_password2=new_password))
 
     def change_profile_picture(self, photo):
         # TODO Instagram.php 705-775
         raise NotImplementedError()
 
     def comment(self, media_id, comment_text):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken,
-            'comment_text': comment_text
-        })
-        return self._sendrequest('media/' + str(media_id) + '/comment/', self._generatesignature(data))
+        return self._sendrequest('media/' + str(media_id) + '/comment/',
+                                 self._signed_payload(comment_text=comment_text))
 
     def configure(self, upload_id, photo, caption=''):
+        return self._configure_post('photo', upload_id, self._photo_configuration(upload_id, photo, caption))
+
+    def _configure_post(self, kind, upload_id, configuration, thumbnail=None):
+        """ Posts the photo or video (kind) already sent as upload_id, given the signed body configuring it. """
+        if kind == 'video':
+            # The thumbnail is only uploaded, not posted as a photo of its own.
+            self._upload_photo_file(thumbnail, upload_id)
+            return self._sendrequest('media/configure/?video=1', configuration)
+        return self._sendrequest('media/configure/?', configuration)
+
+    def _photo_configuration(self, upload_id, photo, caption=''):
+        """ :return: signed body to POST to media/configure/? for photo. """
         (w, h) = get_image_size(photo)
-        data = json.dumps({
-            '_csrftoken': self._csrftoken,
-            'media_folder': 'Instagram',
-            'source_type': 4,
-            '_uid': self._loggedinuserid,
-            '_uuid': self._uuid,
-            'caption': caption,
-            'upload_id': upload_id,
-            'device': self.DEVICE_SETTINTS,
-            'edits': {
+        return self._signed_payload(
+            media_folder='Instagram',
+            source_type=4,
+            caption=caption,
+            upload_id=upload_id,
+            device=self.DEVICE_SETTINTS,
+            edits={
                 'crop_original_size': [w * 1.0, h * 1.0],
                 'crop_center': [0.0, 0.0],
                 'crop_zoom': 1.0
             },
-            'extra': {
+            extra={
                 'source_width': w,
                 'source_height': h,
-            }})
-        return self._sendrequest('media/configure/?', self._generatesignature(data))
+            })
 
-    def configure_video(self, upload_id, video, thumbnail, caption=''):
-        clip = VideoFileClip(video)
-        self.upload_photo(photo=thumbnail, caption=caption,
-                          upload_id=upload_id)
-        data = json.dumps({
-            'upload_id': upload_id,
-            'source_type': 3,
-            'poster_frame_index': 0,
-            'length': 0.00,
-            'audio_muted': False,
-            'filter_type': 0,
-            'video_result': 'deprecated',
-            'clips': {
-                'length': clip.duration,
+    def _video_configuration(self, upload_id, video, caption=''):
+        """ :return: signed body to POST to media/configure/?video=1 for video. """
+        try:
+            duration, width, height = get_video_info(video)
+        except RuntimeError:
+            # Not a container we can read ourselves, so let ffmpeg work it out.
+            clip = _video_file_clip(video)
+            try:
+                duration, (width, height) = clip.duration, clip.size
+            finally:
+                if hasattr(clip, 'close'):
+                    clip.close()
+        return self._signed_payload(
+            upload_id=upload_id,
+            source_type=3,
+            poster_frame_index=0,
+            length=0.00,
+            audio_muted=False,
+            filter_type=0,
+            video_result='deprecated',
+            clips={
+                'length': duration,
                 'source_type': '3',
                 'camera_position': 'back',
             },
-            'extra': {
-                'source_width': clip.size[0],
-                'source_height': clip.size[1],
+            extra={
+                'source_width': width,
+                'source_height': height,
             },
-            'device': self.DEVICE_SETTINTS,
-            '_csrftoken': self._csrftoken,
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            'caption': caption,
-        })
-        return self._sendrequest('media/configure/?video=1', self._generatesignature(data))
+            device=self.DEVICE_SETTINTS,
+            caption=caption)
+
+    def configure_video(self, upload_id, video, thumbnail, caption=''):
+        return self._configure_post('video', upload_id, self._video_configuration(upload_id, video, caption),
+                                    thumbnail)
 
     def delete_comment(self, media_id, comment_id):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken
-        })
         return self._sendrequest(
             'media/' + str(media_id) + '/comment/' +
             str(comment_id) + '/delete/',
-            self._generatesignature(data))
+            self._signed_payload())
 
     def delete_media(self, media_id):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken,
-            'media_id': media_id
-        })
-        return self._sendrequest('media/' + str(media_id) + '/delete/', self._generatesignature(data))
+        return self._sendrequest('media/' + str(media_id) + '/delete/', self._signed_payload(media_id=media_id))
 
     def direct_share(self, media_id, recipients, text=None):
         # TODO: Support video as well as photo. Support threads.
         # TODO: Indicate recipients must be pks, not user names.
         if not isinstance(recipients, list):
             recipients = [str(recipients)]
-        recipient_users = '"",""'.join(str(r) for r in recipients)
+        recipient_users = json.dumps([[str(r) for r in recipients]], separators=(',', ':'))
         endpoint = 'direct_v2/threads/broadcast/media_share/?media_type=photo'
         boundary = self._uuid
         bodies = [
@@ -198,7 +211,7 @@ class InstagramAPIEndPoints(InstagramAPIBase):
             {
                 'type': 'form-data',
                 'name': 'recipient_users',
-                'data': '[["{}"]]'.format(recipient_users),
+                'data': recipient_users,
             },
             {
                 'type': 'form-data',
@@ -227,29 +240,55 @@ class InstagramAPIEndPoints(InstagramAPIBase):
         }
         return self._sendrequest(endpoint, post=data, headers=headers)
 
+    def direct_share_batched(self, media_id, recipients, text=None, batch_size=None, concurrency=4):
+        """
+            Shares media with a long list of recipients, by sharing it with batches of them, several batches at once.
+
+            A batch that fails doesn't stop the others. Calls are paced by the rate limiter, if there is one.
+
+        :param batch_size: number of recipients in each batch. Defaults to DIRECT_SHARE_BATCH_SIZE.
+        :param concurrency: number of batches in flight at once.
+        :return: list of dictionaries with the "recipients" of each batch, Instagram's "response" to it (or None) and
+                 the "error" it failed with (or None).
+        """
+        batches = self._batches(recipients, batch_size or self.DIRECT_SHARE_BATCH_SIZE)
+
+        def share(batch):
+            try:
+                return {'recipients': batch, 'response': self.direct_share(media_id, batch, text), 'error': None}
+            except (requests.RequestException, ValueError) as e:
+                LOGGER.warning("Failed to share %s with %s: %s", media_id, batch, e)
+                return {'recipients': batch, 'response': None, 'error': e}
+
+        if concurrency <= 1 or len(batches) <= 1:
+            return [share(batch) for batch in batches]
+        from multiprocessing.pool import ThreadPool  # Slow to import, and only needed here.
+
+        pool = ThreadPool(min(concurrency, len(batches)))
+        try:
+            return pool.map(share, batches)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def _batches(items, size):
+        items = list(items) if isinstance(items, (list, tuple)) else [items]
+        return [items[start:start + size] for start in range(0, len(items), size)]
+
     def edit_media(self, media_id, caption_text=''):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken,
-            'caption_text': caption_text
-        })
-        return self._sendrequest('media/' + str(media_id) + '/edit_media/', self._generatesignature(data))
+        return self._sendrequest('media/' + str(media_id) + '/edit_media/',
+                                 self._signed_payload(caption_text=caption_text))
 
     def edit_profile(self, url, phone, first_name, biography, email, gender):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken,
-            'external_url': url,
-            'phone_number': phone,
-            'username': self._username,
-            'full_name': first_name,
-            'biography': biography,
-            'email': email,
-            'gender': gender,
-        })
-        return self._sendrequest('accounts/edit_profile/', self._generatesignature(data))
+        return self._sendrequest('accounts/edit_profile/', self._signed_payload(
+            external_url=url,
+            phone_number=phone,
+            username=self._username,
+            full_name=first_name,
+            biography=biography,
+            email=email,
+            gender=gender))
 
     def explore(self):
         return self._sendrequest('discover/explore/')
@@ -257,27 +296,16 @@ class InstagramAPIEndPoints(InstagramAPIBase):
     def expose(self):
         # TODO: This might be deprecated.
         # http://instagram-private-api.readthedocs.io/en/latest/_modules/instagram_private_api/endpoints/misc.html
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            'id': self._loggedinuserid,
-            '_csrftoken': self._csrftoken,
-            'experiment': 'ig_android_profile_contextual_feed'
-        })
-        return self._sendrequest('qe/expose/', self._generatesignature(data))
+        return self._sendrequest('qe/expose/', self._signed_payload(
+            id=self._loggedinuserid,
+            experiment='ig_android_profile_contextual_feed'))
 
     def fb_user_search(self, query):
         return self._sendrequest(
             'fbsearch/topsearch/?context=blended&query=' + str(query) + '&rank_token=' + str(self._ranktoken))
 
     def follow(self, user_id):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            'user_id': user_id,
-            '_csrftoken': self._csrftoken
-        })
-        return self._sendrequest('friendships/create/' + str(user_id) + '/', self._generatesignature(data))
+        return self._sendrequest('friendships/create/' + str(user_id) + '/', self._signed_payload(user_id=user_id))
 
     def get_direct_share(self):
         return self._sendrequest('direct_share/inbox/?')
@@ -314,12 +342,7 @@ class InstagramAPIEndPoints(InstagramAPIBase):
             'feed/popular/?people_teaser_supported=1&rank_token=' + str(self._ranktoken) + '&ranked_content=true&')
 
     def get_profile_data(self):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken
-        })
-        return self._sendrequest('accounts/current_user/?edit=true', self._generatesignature(data))
+        return self._sendrequest('accounts/current_user/?edit=true', self._signed_payload())
 
     def get_recent_activity(self):
         return self._sendrequest('news/inbox/?')
@@ -366,13 +389,7 @@ class InstagramAPIEndPoints(InstagramAPIBase):
         return self._sendrequest('direct_v2/inbox/?')
 
     def like(self, media_id):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken,
-            'media_id': media_id
-        })
-        return self._sendrequest('media/' + str(media_id) + '/like/', self._generatesignature(data))
+        return self._sendrequest('media/' + str(media_id) + '/like/', self._signed_payload(media_id=media_id))
 
     def login(self, force=False):
         """
@@ -383,9 +400,10 @@ class InstagramAPIEndPoints(InstagramAPIBase):
         :return: dictionary of responses.
         """
         if not self._isloggedin or force:
-            self._session = requests.Session()
+            self._session = self._new_session()
             # if you need proxy make something like this:
-            # self.s.proxies = {"https": "http://proxyip:proxyport"}
+            # self._session.proxies = {"https": "http://proxyip:proxyport"}
+            self._warm_up()
             full_response = self._sendrequest(
                 'si/fetch_headers/?challenge_type=signup&guid=' + self.generate_uuid(False), login=True)
 
@@ -439,32 +457,16 @@ class InstagramAPIEndPoints(InstagramAPIBase):
             self._isloggedin = False
 
     def media_info(self, media_id):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken,
-            'media_id': media_id
-        })
-        return self._sendrequest('media/' + str(media_id) + '/info/', self._generatesignature(data))
+        return self._sendrequest('media/' + str(media_id) + '/info/', self._signed_payload(media_id=media_id))
 
     def megaphone_log(self):
         return self._sendrequest('megaphone/log/')
 
     def remove_profile_picture(self):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken
-        })
-        return self._sendrequest('accounts/remove_profile_picture/', self._generatesignature(data))
+        return self._sendrequest('accounts/remove_profile_picture/', self._signed_payload())
 
     def remove_selftag(self, media_id):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken
-        })
-        return self._sendrequest('media/' + str(media_id) + '/remove/', self._generatesignature(data))
+        return self._sendrequest('media/' + str(media_id) + '/remove/', self._signed_payload())
 
     def search_location(self, query):
         return self._sendrequest('fbsearch/places/?rank_token=' + str(self._ranktoken) + '&query=' + str(query))
@@ -482,44 +484,22 @@ class InstagramAPIEndPoints(InstagramAPIBase):
             '&is_typeahead=true&query=' + str(query) + '&rank_token=' + str(self._ranktoken))
 
     def set_name_phone(self, name='', phone=''):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            'first_name': name,
-            'phone_number': phone,
-            '_csrftoken': self._csrftoken
-        })
-        return self._sendrequest('accounts/set_phone_and_name/', self._generatesignature(data))
+        return self._sendrequest('accounts/set_phone_and_name/',
+                                 self._signed_payload(first_name=name, phone_number=phone))
 
     def set_private_account(self):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken
-        })
-        return self._sendrequest('accounts/set_private/', self._generatesignature(data))
+        return self._sendrequest('accounts/set_private/', self._signed_payload())
 
     def set_public_account(self):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken
-        })
-        return self._sendrequest('accounts/set_public/', self._generatesignature(data))
+        return self._sendrequest('accounts/set_public/', self._signed_payload())
 
     def sync_from_adress_book(self, contacts):
         return self._sendrequest(
             'address_book/link/?include=extra_display_name,thumbnails', "contacts=" + json.dumps(contacts))
 
     def sync_features(self):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            'id': self._loggedinuserid,
-            '_csrftoken': self._csrftoken,
-            'experiments': self.EXPERIMENTS
-        })
-        return self._sendrequest('qe/sync/', self._generatesignature(data))
+        return self._sendrequest('qe/sync/',
+                                 self._signed_payload(id=self._loggedinuserid, experiments=self.EXPERIMENTS))
 
     def tag_feed(self, tag):
         return self._sendrequest(
@@ -529,50 +509,36 @@ class InstagramAPIEndPoints(InstagramAPIBase):
         return self._sendrequest('feed/timeline/')
 
     def unblock(self, user_id):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            'user_id': user_id,
-            '_csrftoken': self._csrftoken
-        })
-        return self._sendrequest('friendships/unblock/' + str(user_id) + '/', self._generatesignature(data))
+        return self._sendrequest('friendships/unblock/' + str(user_id) + '/', self._signed_payload(user_id=user_id))
 
     def unfollow(self, user_id):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            'user_id': user_id,
-            '_csrftoken': self._csrftoken
-        })
-        return self._sendrequest('friendships/destroy/' + str(user_id) + '/', self._generatesignature(data))
+        return self._sendrequest('friendships/destroy/' + str(user_id) + '/', self._signed_payload(user_id=user_id))
 
     def unlike(self, media_id):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            '_csrftoken': self._csrftoken,
-            'media_id': media_id
-        })
-        return self._sendrequest('media/' + str(media_id) + '/unlike/', self._generatesignature(data))
+        return self._sendrequest('media/' + str(media_id) + '/unlike/', self._signed_payload(media_id=media_id))
 
-    def upload_photo(self, photo, caption=None, upload_id=None):
-        if upload_id is None:
-            upload_id = str(int(time.time() * 1000))
+    def _photo_upload_request(self, photo_file, upload_id, progress=None):
+        """
+            The encoder reads photo_file as it is sent, so it can only be sent once, and photo_file must stay open
+            until it has been.
 
-        with open(photo, 'rb') as photo_file:
-            data = {
-                'upload_id': upload_id,
-                '_uuid': self._uuid,
-                '_csrftoken': self._csrftoken,
-                'image_compression': '{"lib_name":"jt","lib_version":"1.3.0","quality":"87"}',
-                'photo': (
-                    'pending_media_%s.jpg' % upload_id,
-                    photo_file.read(),
-                    'application/octet-stream',
-                    {'Content-Transfer-Encoding': 'binary'})
-            }
-
-        m = MultipartEncoder(data, boundary=self._uuid)
+        :param progress: optional function taking (bytes sent, total bytes), called as the body is sent.
+        :return: (MultipartEncoder, headers) to POST photo_file to upload/photo/.
+        """
+        data = {
+            'upload_id': upload_id,
+            '_uuid': self._uuid,
+            '_csrftoken': self._csrftoken,
+            'image_compression': '{"lib_name":"jt","lib_version":"1.3.0","quality":"%d"}' % self.JPEG_QUALITY,
+            'photo': (
+                'pending_media_%s.jpg' % upload_id,
+                photo_file,
+                'application/octet-stream',
+                {'Content-Transfer-Encoding': 'binary'})
+        }
+        m = _multipart_encoder(data, boundary=self._uuid)
+        if progress is not None:
+            m = _multipart_monitor(m, progress)
         headers = {
             'X-IG-Capabilities': '3Q4=',
             'X-IG-Connection-Type': 'WIFI',
@@ -580,28 +546,20 @@ class InstagramAPIEndPoints(InstagramAPIBase):
             'Accept-Language': 'en-US',
             'Accept-Encoding': 'gzip, deflate',
             'Content-type': m.content_type,
-            'Connection': 'close',
+            'Connection': 'keep-alive' if self._keep_alive else 'close',
             'User-Agent': self.USER_AGENT}
-        self._sendrequest("upload/photo/", post=m.to_string(), headers=headers)
-
-        self._session.post(self.API_URL + "upload/photo/",
-                           data=m.to_string(), headers=headers)
-        if self.configure(upload_id, photo, caption):
-            self.expose()
+        return m, headers
 
-    def upload_video(self, video, thumbnail, caption=None, upload_id=None):
-
-        # TODO: Migrate to use _sendrequest.
-        if upload_id is None:
-            upload_id = str(int(time.time() * 1000))
+    def _video_upload_request(self, upload_id):
+        """ :return: (MultipartEncoder, headers) to POST to upload/video/ to obtain the URLs to upload the video to. """
         data = {
             'upload_id': upload_id,
             '_csrftoken': self._csrftoken,
             'media_type': '2',
             '_uuid': self._uuid,
         }
-        m = MultipartEncoder(data, boundary=self._uuid)
-        self._session.headers.update({
+        m = _multipart_encoder(data, boundary=self._uuid)
+        headers = {
             'X-IG-Capabilities': '3Q4=',
             'X-IG-Connection-Type': 'WIFI',
             'Host': 'i.instagram.com',
@@ -610,63 +568,193 @@ class InstagramAPIEndPoints(InstagramAPIBase):
             'Accept-Encoding': 'gzip, deflate',
             'Content-type': m.content_type,
             'Connection': 'keep-alive',
-            'User-Agent': self.USER_AGENT})
-        response = self._session.post(
-            self.API_URL + "upload/video/", data=m.to_string())
-        if response.status_code == 200:
-            body = json.loads(response.text)
-            upload_url = body['video_upload_urls'][3]['url']
-            upload_job = body['video_upload_urls'][3]['job']
-
-            with open(video, 'rb') as videofile:
-                video_data = videofile.read()
-            request_size = int(math.floor(len(video_data) / 4))
-            last_request_extra = (len(video_data) - (request_size * 3))
-
-            headers = copy.deepcopy(self._session.headers)
-            self._session.headers.update({
-                'X-IG-Capabilities': '3Q4=',
-                'X-IG-Connection-Type': 'WIFI',
-                'Cookie2': '$Version=1',
-                'Accept-Language': 'en-US',
-                'Accept-Encoding': 'gzip, deflate',
-                'Content-type': 'application/octet-stream',
-                'Session-ID': upload_id,
-                'Connection': 'keep-alive',
-                'Content-Disposition': 'attachment; filename="video.mov"',
-                'job': upload_job,
-                'Host': 'upload.instagram.com',
-                'User-Agent': self.USER_AGENT})
-            for i in range(0, 4):
-                start = i * request_size
-                if i == 3:
-                    end = i * request_size + last_request_extra
-                else:
-                    end = (i + 1) * request_size
-                length = last_request_extra if i == 3 else request_size
-                content_range = "bytes {start}-{end}/{lenVideo}".format(start=start, end=(end - 1),
-                                                                        lenVideo=len(video_data)).encode('utf-8')
-
-                self._session.headers.update(
-                    {'Content-Length': str(end - start), 'Content-Range': content_range, })
-                LOGGER.info("Starting to upload %d bytes of video data", len(video_data))
-                response = self._session.post(
-                    upload_url, data=video_data[start:start + length])
-            self._session.headers = headers
-
-            if response.status_code == 200:
-                if self.configure_video(upload_id, video, thumbnail, caption):
-                    LOGGER.info("Video configuration complete. Exposing.")
-                    self.expose()
-                    LOGGER.info("Video upload complete.")
-
-        return False
+            'User-Agent': self.USER_AGENT}
+        return m, headers
+
+    def _video_chunk_headers(self, upload_id, upload_job, start, end, total):
+        """ :return: headers to POST bytes [start, end) of a video of total bytes to its upload URL. """
+        return {
+            'X-IG-Capabilities': '3Q4=',
+            'X-IG-Connection-Type': 'WIFI',
+            'Cookie2': '$Version=1',
+            'Accept-Language': 'en-US',
+            'Accept-Encoding': 'gzip, deflate',
+            'Content-type': 'application/octet-stream',
+            'Session-ID': upload_id,
+            'Connection': 'keep-alive',
+            'Content-Disposition': 'attachment; filename="video.mov"',
+            'job': upload_job,
+            'Host': 'upload.instagram.com',
+            'User-Agent': self.USER_AGENT,
+            'Content-Length': str(end - start),
+            'Content-Range': "bytes {start}-{end}/{lenVideo}".format(start=start, end=(end - 1), lenVideo=total),
+        }
+
+    def upload_photo(self, photo, caption=None, upload_id=None, progress=None, normalizer=None):
+        """
+            Uploads a photo and posts it. The request body is streamed from the file, rather than read into memory
+            first.
+
+        :param progress: optional function taking (bytes sent, total bytes), called as the photo is sent.
+        :param normalizer: optional image_prep.ImageNormalizer, to shrink, crop and re-encode the photo before it is
+               sent.
+        :return: the response to configuring the post.
+        """
+        if upload_id is None:
+            upload_id = self.generate_upload_id()
+        if normalizer is not None:
+            normalized = normalizer.normalize(photo)
+            try:
+                return self.upload_photo(normalized, caption, upload_id, progress)
+            finally:
+                if normalized != photo:
+                    os.remove(normalized)
+        return self._post_prepared('photo', upload_id, self._photo_configuration(upload_id, photo, caption), photo,
+                                   progress=progress)
+
+    def _post_prepared(self, kind, upload_id, configuration, media, thumbnail=None, **upload_options):
+        """
+            Sends a photo or video and posts it: the steps shared by upload_photo, upload_video and
+            bulk_upload.BulkUploader, which prepares the configuration ahead of time.
+
+        :param kind: 'photo' or 'video'.
+        :param configuration: the signed body configuring the post, as built by _photo_configuration or
+               _video_configuration; or a function building it from the upload id, which a resumed video upload only
+               knows once the video is sent.
+        :param media: filename of the photo or video.
+        :param thumbnail: filename of the video's thumbnail.
+        :param upload_options: passed on to _upload_photo_file or _upload_video_file.
+        :return: the response to configuring the post.
+        """
+        if kind == 'video':
+            upload_id = self._upload_video_file(media, upload_id, **upload_options)
+        else:
+            self._upload_photo_file(media, upload_id, **upload_options)
+        if callable(configuration):
+            configuration = configuration(upload_id)
+        response = self._configure_post(kind, upload_id, configuration, thumbnail)
+        if response:
+            LOGGER.info("Configuration of %s %s complete. Exposing.", kind, upload_id)
+            self.expose()
+        return response
+
+    def _upload_photo_file(self, photo, upload_id, progress=None):
+        """ Sends photo to Instagram, without posting it. """
+        with open(photo, 'rb') as photo_file:
+            m, headers = self._photo_upload_request(photo_file, upload_id, progress)
+            return self._sendrequest("upload/photo/", post=m, headers=headers)
+
+    def upload_video(self, video, thumbnail, caption=None, upload_id=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                     concurrency=1, chunk_retries=3, resume_file=None):
+        """
+            Uploads a video in chunks, sent straight from a memory mapping of the file.
+
+        :param chunk_size: number of bytes sent in each request.
+        :param concurrency: number of chunks in flight at once.
+        :param chunk_retries: number of times a chunk is sent again after a connection problem or a server error,
+               before giving up.
+        :param resume_file: optional file in which the progress of the upload is kept. If the upload is interrupted,
+               calling upload_video again with the same resume_file only sends the chunks Instagram hasn't
+               acknowledged.
+        :return: the response to configuring the post.
+        """
+        return self._post_prepared(
+            'video', upload_id, lambda final_upload_id: self._video_configuration(final_upload_id, video, caption),
+            video, thumbnail, chunk_size=chunk_size, concurrency=concurrency, chunk_retries=chunk_retries,
+            resume_file=resume_file)
+
+    def _upload_video_file(self, video, upload_id=None, chunk_size=DEFAULT_CHUNK_SIZE, concurrency=1,
+                           chunk_retries=3, resume_file=None):
+        """
+            Sends video to Instagram in chunks, without posting it.
+
+        :return: the upload id, which is the one recorded in resume_file if the upload was resumed.
+        """
+        if not self._isloggedin:
+            raise AuthenticationError("Not logged in.")
+        upload = ChunkedUpload(video, chunk_size, resume_file)
+        if not upload.started:
+            if upload_id is None:
+                upload_id = self.generate_upload_id()
+            m, headers = self._video_upload_request(upload_id)
+            body = self._sendrequest("upload/video/", post=m.to_string(), headers=headers)
+            upload.start(upload_id, body['video_upload_urls'][3]['url'], body['video_upload_urls'][3]['job'])
+        with upload:
+            pending = upload.pending()
+            LOGGER.info("Starting to upload %d bytes of video data in %d chunks",
+                        sum(end - start for start, end in pending), len(pending))
+            if concurrency > 1 and len(pending) > 1:
+                from multiprocessing.pool import ThreadPool  # Slow to import, and only needed here.
+
+                pool = ThreadPool(min(concurrency, len(pending)))
+                try:
+                    for _ in pool.imap_unordered(
+                            lambda chunk: self._upload_video_chunk(upload, chunk[0], chunk[1], chunk_retries),
+                            pending):
+                        pass
+                finally:
+                    pool.terminate()
+                    pool.join()
+            else:
+                for start, end in pending:
+                    self._upload_video_chunk(upload, start, end, chunk_retries)
+        upload.finish()
+        return upload.upload_id
+
+    def _upload_video_chunk(self, upload, start, end, retries):
+        """ POSTs bytes [start, end) of upload, trying again after transient failures. """
+        headers = self._video_chunk_headers(upload.upload_id, upload.upload_job, start, end, upload.size)
+        attempt = 0
+        while True:
+            chunk = upload.view(start, end)
+            try:
+                response = self._post_video_chunk(upload.upload_url, chunk, headers)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                if attempt >= retries or not self._is_transient_upload_error(e):
+                    raise
+                delay = upload.RETRY_DELAY * 2 ** attempt
+                attempt += 1
+                LOGGER.info("Upload of video %s failed (%s). Trying again in %s seconds.",
+                            headers['Content-Range'], e, delay)
+                time.sleep(delay)
+            else:
+                upload.acknowledge(start)
+                return
+            finally:
+                if isinstance(chunk, memoryview):
+                    chunk.release()
+
+    def _post_video_chunk(self, upload_url, chunk, headers):
+        """
+            POSTs a chunk to Instagram's upload URL, paced by the rate limiter, with the retry policy's timeout, and
+            measured by the metrics, as _sendrequest's calls are.
+        """
+        if self.rate_limiter is not None:
+            slept = self.rate_limiter.acquire(VIDEO_CHUNK_ENDPOINT)
+            if self.metrics is not None and slept:
+                self.metrics.observe_throttle(VIDEO_CHUNK_ENDPOINT, slept)
+        started = clock()
+        try:
+            response = self._session.post(upload_url, data=chunk, headers=headers,
+                                          timeout=self.retry_policy and self.retry_policy.timeout)
+        except requests.RequestException:
+            if self.metrics is not None:
+                self.metrics.observe_call(VIDEO_CHUNK_ENDPOINT, 'POST', None, clock() - started, body_size(chunk))
+            raise
+        if self.rate_limiter is not None:
+            self.rate_limiter.record(VIDEO_CHUNK_ENDPOINT, response.status_code)
+        if self.metrics is not None:
+            self.metrics.observe_call(VIDEO_CHUNK_ENDPOINT, 'POST', response.status_code, clock() - started,
+                                      body_size(chunk), len(response.content))
+        return response
+
+    @staticmethod
+    def _is_transient_upload_error(error):
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        status_code = error.response.status_code if getattr(error, 'response', None) is not None else None
+        return status_code is not None and (status_code == 429 or status_code >= 500)
 
     def user_friendship(self, user_id):
-        data = json.dumps({
-            '_uuid': self._uuid,
-            '_uid': self._loggedinuserid,
-            'user_id': user_id,
-            '_csrftoken': self._csrftoken
-        })
-        return self._sendrequest('friendships/show/' + str(user_id) + '/', self._generatesignature(data))
+        return self._sendrequest('friendships/show/' + str(user_id) + '/', self._signed_payload(user_id=user_id))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains the calling of an endpoint for each of a long list of arguments, several calls at once.
+
+    Calls are made by a pool of threads, and only a few more than there are threads are queued at a time, so the list
+    of arguments can be a generator of any length. Each call still goes through the instance's rate limiter, so
+    running more calls at once doesn't break its budget; it just keeps the budget used.
+    """
+
+from __future__ import absolute_import
+
+import collections
+import logging
+import time
+
+from .base import AuthenticationError
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+
+class BulkStats(object):
+    """ Counts of the calls made by a BulkMap, and how fast they were made. """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.errors_by_type = collections.Counter()
+        self.started = None
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        """ Seconds from the first call being made to the last result (or now, if still running). """
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def calls_per_second(self):
+        elapsed = self.elapsed
+        return self.calls / elapsed if elapsed > 0 else 0.0
+
+    def record(self, error):
+        self.calls += 1
+        if error is not None:
+            self.errors += 1
+            self.errors_by_type[type(error).__name__] += 1
+
+    def __repr__(self):
+        return 'BulkStats(calls=%d, errors=%d, elapsed=%.1fs, calls_per_second=%.1f)' % (
+            self.calls, self.errors, self.elapsed, self.calls_per_second)
+
+
+class BulkMap(object):
+    """ Calls a function for each item of an iterable, with at most concurrency calls at once.
+
+        Iterating over it makes the calls, and yields a dictionary for each item, with the "item", the "response" to
+        it (or None) and the "error" the call failed with (or None). A failed call doesn't stop the others, except
+        that failing to be logged in stops them all, by raising AuthenticationError.
+
+        stats holds the number of calls and errors, and the rate they were made at.
+    """
+
+    def __init__(self, func, items, concurrency=8, ordered=True):
+        """
+        :param func: the function to call; typically an endpoint method of a logged in InstagramAPI.
+        :param items: iterable of the argument to call func with for each item. A tuple is passed as several
+               arguments.
+        :param concurrency: number of calls made at once.
+        :param ordered: if True, results are yielded in the order of items; otherwise as the calls finish.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        self.func = func
+        self.items = items
+        self.concurrency = concurrency
+        self.ordered = ordered
+        self.stats = BulkStats()
+
+    def _call(self, item):
+        try:
+            response = self.func(*item) if isinstance(item, tuple) else self.func(item)
+            return {'item': item, 'response': response, 'error': None}
+        except Exception as e:
+            return {'item': item, 'response': None, 'error': e}
+
+    def _result(self, result):
+        error = result['error']
+        if isinstance(error, AuthenticationError):
+            raise error
+        if error is not None:
+            LOGGER.warning("Call for %r failed: %s", result['item'], error)
+        self.stats.record(error)
+        return result
+
+    def __iter__(self):
+        from multiprocessing.pool import ThreadPool  # Slow to import, and only needed here.
+
+        items = iter(self.items)
+        window = self.concurrency * 2  # Calls queued at once, so a thread that finishes has the next call waiting.
+        pending = collections.deque()
+        finished = queue.Queue()
+        pool = ThreadPool(self.concurrency)
+        self.stats.started = time.time()
+        self.stats.finished = None
+        callback = None if self.ordered else finished.put
+
+        def submit():
+            for item in items:
+                pending.append(pool.apply_async(self._call, (item,), callback=callback))
+                return True
+            return False
+
+        try:
+            while len(pending) < window and submit():
+                pass
+            while pending:
+                if self.ordered:
+                    result = pending.popleft().get()
+                else:
+                    result = finished.get()
+                    pending.pop()  # Only the number of calls in flight matters here.
+                submit()
+                yield self._result(result)
+        finally:
+            pool.terminate()
+            pool.join()
+            self._finish()
+
+    def _finish(self):
+        self.stats.finished = time.time()
+        LOGGER.info("Made %d calls in %.1f seconds (%.1f a second); %d failed.", self.stats.calls,
+                    self.stats.elapsed, self.stats.calls_per_second, self.stats.errors)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains sinks that write the items yielded by the iterators to files, as they arrive.
+
+    Items are written in batches: a batch is encoded at once and handed to the file in a single write, so exporting
+    isn't slowed down by encoding and writing each item on its own. Only one batch is held in memory at a time.
+
+    NDJSONSink writes one JSON document per line, optionally compressed with gzip or (with the zstandard package)
+    zstd. ColumnarSink writes chosen fields as a table: Parquet or Arrow with the pyarrow package, otherwise CSV.
+    """
+
+from __future__ import absolute_import
+
+import abc
+import csv
+import decimal
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+
+from .records import Record, record_type
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+COMPRESSIONS = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+}
+
+COLUMNAR_FORMATS = {
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.csv': 'csv',
+}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        LOGGER.warning("zstandard is not installed (pip install zstandard). Files can't be compressed with zstd.")
+        raise
+    return zstandard
+
+
+def _default(value):
+    if isinstance(value, decimal.Decimal):  # Numbers streamed by versions of ijson before 3.1.
+        return float(value)
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+def _encoder():
+    """ :return: a function encoding a list of items as lines of JSON, with the fastest JSON library installed. """
+    try:
+        import orjson
+    except ImportError:
+        pass
+    else:
+        dumps, option = orjson.dumps, orjson.OPT_APPEND_NEWLINE
+        return lambda items: b''.join([dumps(item, default=_default, option=option) for item in items])
+    try:
+        from ujson import dumps
+    except ImportError:
+        dumps = json.JSONEncoder(separators=(',', ':'), default=_default).encode
+    return lambda items: ('\n'.join([dumps(item) for item in items]) + '\n').encode('utf-8')
+
+
+def _compression(filename, compression):
+    if compression is None:
+        compression = COMPRESSIONS.get(os.path.splitext(filename)[1].lower())
+    if compression not in (None, 'gzip', 'zstd'):
+        raise ValueError("compression must be 'gzip', 'zstd' or None.")
+    return compression
+
+
+def _open(filename, compression, level):
+    """ :return: a binary file to write to, compressing what is written to it. """
+    if compression == 'gzip':
+        return gzip.open(filename, 'wb', 1 if level is None else level)
+    if compression == 'zstd':
+        zstandard = _import_zstandard()
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return compressor.stream_writer(open(filename, 'wb'), closefd=True)
+    return open(filename, 'wb')
+
+
+# The metaclass is given this way, rather than with a metaclass= keyword, so the module still works on Python 2.
+_ABC = abc.ABCMeta('_ABC', (object,), {})
+
+
+class _Sink(_ABC):
+    """ Base of the sinks: buffers items and hands them on a batch at a time. Use as a context manager. """
+
+    def __init__(self, batch_size):
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive.")
+        self.batch_size = batch_size
+        self.rows = 0
+        self._batch = []
+
+    def write(self, item):
+        """ Adds an item: a dictionary as Instagram sent it, or a record. """
+        self._batch.append(item)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_all(self, items):
+        """
+            Writes every item an iterator yields.
+
+        :return: the number of rows written so far.
+        """
+        for item in items:
+            self.write(item)
+        self.flush()
+        return self.rows
+
+    def flush(self):
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self._write_batch(batch)
+            self.rows += len(batch)
+
+    @abc.abstractmethod
+    def _write_batch(self, batch):
+        """ Writes a list of items to the file. """
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class NDJSONSink(_Sink):
+    """ Writes items as newline delimited JSON, one item per line. """
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, filename, compression=None, level=None, batch_size=BATCH_SIZE):
+        """
+        :param filename: the file to write.
+        :param compression: 'gzip', 'zstd' or None. Defaults to that of the filename's extension (.gz or .zst).
+        :param level: compression level. Defaults to the fastest for gzip (1), and zstd's default (3).
+        :param batch_size: number of items encoded and written at a time.
+        """
+        _Sink.__init__(self, batch_size)
+        self.filename = filename
+        self.compression = _compression(filename, compression)
+        self._encode = _encoder()
+        self._file = _open(filename, self.compression, level)
+
+    def _write_batch(self, batch):
+        self._file.write(self._encode([item._asdict() if isinstance(item, Record) else item for item in batch]))
+
+    def close(self):
+        if self._file is not None:
+            try:
+                self.flush()
+            finally:
+                self._file.close()
+                self._file = None
+
+
+class ColumnarSink(_Sink):
+    """ Writes chosen fields of items as a table, a row group at a time.
+
+        Parquet and Arrow files need pyarrow. Without it, a CSV file is written instead, next to where the Parquet or
+        Arrow file would have been (with the extension changed to .csv); the filename attribute is the file written.
+    """
+
+    ROW_GROUP_SIZE = 65536
+
+    def __init__(self, filename, fields, format=None, row_group_size=ROW_GROUP_SIZE, schema=None,
+                 compression=None):
+        """
+        :param filename: the file to write.
+        :param fields: the fields to write, as for records.record_type() (e.g. ['pk', 'user.username']). Columns are
+               named after the attributes (e.g. user_username).
+        :param format: 'parquet', 'arrow' or 'csv'. Defaults to that of the filename's extension.
+        :param row_group_size: number of rows held in memory and written at a time.
+        :param schema: optional pyarrow schema of the columns. By default, it is inferred from the first row group.
+        :param compression: for CSV files, 'gzip', 'zstd' or None, as for NDJSONSink.
+        """
+        _Sink.__init__(self, row_group_size)
+        self.record_type = record_type(fields)
+        name, extension = os.path.splitext(filename)
+        if extension.lower() in COMPRESSIONS:  # e.g. followers.csv.gz
+            extension = os.path.splitext(name)[1]
+        self.format = format or COLUMNAR_FORMATS.get(extension.lower())
+        if self.format not in ('parquet', 'arrow', 'csv'):
+            raise ValueError("format must be 'parquet', 'arrow' or 'csv'.")
+        self._pyarrow = None
+        if self.format != 'csv':
+            self._pyarrow = _import_pyarrow()
+            if self._pyarrow is None:
+                LOGGER.warning("pyarrow is not installed (pip install pyarrow). Writing CSV instead of %s.",
+                               self.format)
+                self.format = 'csv'
+                filename = os.path.splitext(filename)[0] + '.csv'
+        self.filename = filename
+        self.schema = schema
+        self._writer = None
+        self._file = None
+        self._closed = False
+        if self.format == 'csv':
+            self._file = _open(filename, _compression(filename, compression), None)
+            if sys.version_info.major == 3:
+                self._file = io.TextIOWrapper(self._file, encoding='utf-8', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.record_type._fields)
+
+    def _rows(self, batch):
+        fields = self.record_type._fields
+        for item in batch:
+            if isinstance(item, dict):
+                item = self.record_type.from_dict(item)
+            yield tuple(getattr(item, name) for name in fields)
+
+    def _write_batch(self, batch):
+        if self.format == 'csv':
+            if sys.version_info.major == 3:
+                self._writer.writerows(self._rows(batch))
+            else:  # Python 2's csv module writes bytes.
+                self._writer.writerows(tuple(value.encode('utf-8') if isinstance(value, unicode) else value  # noqa
+                                             for value in row) for row in self._rows(batch))
+            return
+        pyarrow = self._pyarrow
+        columns = list(zip(*self._rows(batch)))
+        self._write_table(pyarrow.table(dict(zip(self.record_type._fields, [list(column) for column in columns]))))
+
+    def _write_table(self, table):
+        pyarrow = self._pyarrow
+        if self.schema is None:
+            self.schema = table.schema
+        else:
+            table = table.cast(self.schema)
+        if self._writer is None:
+            if self.format == 'parquet':
+                self._writer = pyarrow.parquet.ParquetWriter(self.filename, self.schema)
+            else:
+                self._writer = pyarrow.ipc.new_file(self.filename, self.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        # Parquet and Arrow writers are only made when the first row group is written, so their absence doesn't mean
+        # the sink is closed.
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.flush()
+            if self._writer is None:  # No rows, so the schema can only be the one given, or columns of nulls.
+                self._write_table(self._pyarrow.table(dict((name, []) for name in self.record_type._fields)))
+        finally:
+            if self.format == 'csv':
+                self._file.close()
+            elif self._writer is not None:
+                self._writer.close()
+            self._writer = self._file = None
+
+
+def export(items, filename, fields=None, **kwargs):
+    """
+        Writes every item an iterator yields to a file.
+
+        If fields are given, they are written as a table (see ColumnarSink); otherwise whole items are written as
+        NDJSON (see NDJSONSink). Other keyword arguments are passed on to the sink.
+
+        E.g. export(api.followers_iter(), 'followers.ndjson.gz')
+
+    :return: (filename, number of rows) of the file written.
+    """
+    if fields is not None:
+        sink = ColumnarSink(filename, fields, **kwargs)
+    else:
+        sink = NDJSONSink(filename, **kwargs)
+    with sink:
+        rows = sink.write_all(items)
+    return sink.filename, rows
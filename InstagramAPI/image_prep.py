@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains the optional normalization of photos before they are uploaded.
+
+    Instagram shrinks photos wider than it displays, and crops those outside the aspect ratios it allows, so sending
+    the original wastes bandwidth. Normalizing does the same on the client side, and re-encodes the photo as JPEG at the
+    quality the upload declares.
+
+    Requires the Pillow package.
+    """
+
+from __future__ import absolute_import
+
+import logging
+import os
+import tempfile
+
+from .base import InstagramAPIBase
+from .image_utils import get_image_info
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+
+def _image_module():
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        LOGGER.warning("Pillow is not installed (pip install Pillow). Photos can't be normalized.")
+        raise
+    return Image, ImageOps
+
+
+class ImageNormalizer(object):
+    """ Shrinks, crops and re-encodes photos to what Instagram accepts.
+
+        Instances can be pickled, so normalize() can be run in a multiprocessing pool.
+    """
+
+    MAX_WIDTH = 1080
+    MIN_ASPECT_RATIO = 4.0 / 5  # Width over height, of the tallest portrait photo.
+    MAX_ASPECT_RATIO = 1.91  # Width over height, of the widest landscape photo.
+
+    def __init__(self, directory=None, max_width=MAX_WIDTH, quality=InstagramAPIBase.JPEG_QUALITY):
+        """
+        :param directory: where normalized photos are written. Defaults to the system's temporary directory.
+        :param max_width: photos wider than this are shrunk to it.
+        :param quality: JPEG quality normalized photos are encoded at.
+        """
+        self.directory = directory
+        self.max_width = max_width
+        self.quality = quality
+
+    def target_size(self, width, height):
+        """ :return: ((left, top, right, bottom) crop box, (width, height) after shrinking) for a photo's size. """
+        left, top, right, bottom = 0, 0, width, height
+        if float(width) / height > self.MAX_ASPECT_RATIO:
+            cropped_width = int(round(height * self.MAX_ASPECT_RATIO))
+            left = (width - cropped_width) // 2
+            right = left + cropped_width
+        elif float(width) / height < self.MIN_ASPECT_RATIO:
+            cropped_height = int(round(width / self.MIN_ASPECT_RATIO))
+            top = (height - cropped_height) // 2
+            bottom = top + cropped_height
+        cropped_width, cropped_height = right - left, bottom - top
+        if cropped_width > self.max_width:
+            cropped_width, cropped_height = self.max_width, max(
+                1, int(round(cropped_height * float(self.max_width) / cropped_width)))
+        return (left, top, right, bottom), (cropped_width, cropped_height)
+
+    def needs_normalizing(self, photo):
+        """ :return: True if photo isn't already a JPEG of a size and aspect ratio Instagram accepts. """
+        image_format, width, height = get_image_info(photo)
+        return image_format != 'jpeg' or self.target_size(width, height) != ((0, 0, width, height), (width, height))
+
+    def normalize(self, photo):
+        """
+            Writes a normalized copy of photo, unless it is already fine as it is.
+
+        :return: the filename of the normalized photo, which is photo itself if it needed no change. Otherwise it is
+                 a new file that the caller should remove once it is done with.
+        """
+        try:
+            if not self.needs_normalizing(photo):
+                return photo
+        except RuntimeError:
+            pass  # A format only Pillow can read.
+        Image, ImageOps = _image_module()
+        image = Image.open(photo)
+        image = ImageOps.exif_transpose(image)  # Turn it the way it is displayed, as the EXIF is dropped.
+        if image.mode != 'RGB':
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[3])
+            image = background
+        box, size = self.target_size(*image.size)
+        if box != (0, 0) + image.size:
+            image = image.crop(box)
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS)
+        descriptor, filename = tempfile.mkstemp(suffix='.jpg', dir=self.directory)
+        with os.fdopen(descriptor, 'wb') as normalized_file:
+            image.save(normalized_file, 'JPEG', quality=self.quality, optimize=True)
+        LOGGER.debug("Normalized %s to %s (%sx%s)", photo, filename, size[0], size[1])
+        return filename
@@ -1,33 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains a reader of the format and size of PNG, GIF, JPEG, WebP and HEIC images.
+
+    The format and size are read from the start of the file, which is read once. Only JPEG files whose size comes
+    after large metadata (such as EXIF thumbnails) need more, and then just the few bytes at the start of each segment
+    are read.
+    """
+
+from __future__ import absolute_import
+
+import collections
+import os
 import struct
-import imghdr
+import threading
 
+from .video_utils import _boxes
 
-def get_image_size(filename):
+# Number of bytes read from the start of each file. Enough for the headers of almost every image.
+HEAD_SIZE = 16 * 1024
+
+# Number of sizes remembered by get_image_size, keyed by (path, modification time, file size).
+CACHE_SIZE = 65536
+
+HEIC_BRANDS = (b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'hevm', b'hevs', b'mif1', b'msf1')
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class _Header(object):
+    """ The start of a file, which can also read further into the file when needed. """
+
+    def __init__(self, fhandle):
+        self._fhandle = fhandle
+        self.head = fhandle.read(HEAD_SIZE)
+
+    def read(self, offset, size):
+        if offset + size <= len(self.head):
+            return self.head[offset:offset + size]
+        self._fhandle.seek(offset)
+        data = self._fhandle.read(size)
+        if len(data) != size:
+            raise RuntimeError("Invalid Header")
+        return data
+
+
+def _png_size(header):
+    if header.read(12, 4) != b'IHDR':
+        raise RuntimeError("PNG: Invalid check")
+    return struct.unpack('>II', header.read(16, 8))
+
+
+def _gif_size(header):
+    return struct.unpack('<HH', header.read(6, 4))
+
+
+# Start Of Frame markers, which hold the size. (0xC4, 0xC8 and 0xCC are other segments in the same range.)
+_JPEG_SOF_MARKERS = frozenset(range(0xc0, 0xd0)) - frozenset((0xc4, 0xc8, 0xcc))
+# Markers without a length or a body.
+_JPEG_STANDALONE_MARKERS = frozenset(range(0xd0, 0xda)) | frozenset((0x01,))
+
+
+def _jpeg_size(header):
+    offset = 2
+    while True:
+        marker = header.read(offset, 2)
+        if marker[0:1] != b'\xff':
+            raise RuntimeError("JPEG: Invalid marker")
+        if marker[1:2] == b'\xff':  # Padding before a marker.
+            offset += 1
+            continue
+        marker_type = ord(marker[1:2])
+        if marker_type in _JPEG_STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker_type == 0xda:  # Start Of Scan: the image data has begun without a size being given.
+            raise RuntimeError("JPEG: No size found")
+        if marker_type in _JPEG_SOF_MARKERS:
+            # Skip the length and precision.
+            height, width = struct.unpack('>HH', header.read(offset + 5, 4))
+            return width, height
+        # Skip the whole segment; its length includes the length field itself.
+        offset += 2 + struct.unpack('>H', header.read(offset + 2, 2))[0]
+
+
+def _webp_size(header):
+    chunk = header.read(12, 4)
+    if chunk == b'VP8 ':  # Lossy: the frame header holds 14 bit dimensions.
+        if header.read(23, 3) != b'\x9d\x01\x2a':
+            raise RuntimeError("WebP: Invalid frame")
+        width, height = struct.unpack('<HH', header.read(26, 4))
+        return width & 0x3fff, height & 0x3fff
+    if chunk == b'VP8L':  # Lossless: one-less-than dimensions packed into 14 bits each.
+        if header.read(20, 1) != b'\x2f':
+            raise RuntimeError("WebP: Invalid signature")
+        bits = struct.unpack('<I', header.read(21, 4))[0]
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if chunk == b'VP8X':  # Extended: one-less-than 24 bit canvas dimensions.
+        data = header.read(24, 6)
+        return (struct.unpack('<I', data[0:3] + b'\0')[0] + 1,
+                struct.unpack('<I', data[3:6] + b'\0')[0] + 1)
+    raise RuntimeError("WebP: Unsupported chunk")
+
+
+def _heic_size(header):
+    # The size is an 'ispe' property in meta/iprp/ipco. Thumbnails have their own, so the largest is the image's.
+    offset = 0
+    while True:
+        size, box_type = struct.unpack('>I4s', header.read(offset, 8))
+        if size == 1:
+            size = struct.unpack('>Q', header.read(offset + 8, 8))[0]
+        if size < 8:
+            raise RuntimeError("HEIC: Invalid box size")
+        if box_type == b'meta':
+            meta = header.read(offset, size)
+            break
+        offset += size
+    sizes = []
+    for box_type, start, end in _boxes(meta, 12, len(meta)):  # meta has a version and flags before its boxes.
+        if box_type == b'iprp':
+            for child_type, child_start, child_end in _boxes(meta, start, end):
+                if child_type == b'ipco':
+                    for property_type, property_start, property_end in _boxes(meta, child_start, child_end):
+                        if property_type == b'ispe':
+                            sizes.append(struct.unpack('>II', meta[property_start + 4:property_start + 12]))
+    if not sizes:
+        raise RuntimeError("HEIC: No size found")
+    return max(sizes, key=lambda size: size[0] * size[1])
+
+
+def _image_format(head):
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head.startswith(b'\xff\xd8'):
+        return 'jpeg'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp':
+        brands = head[8:12], head[16:struct.unpack('>I', head[:4])[0]]
+        if brands[0] in HEIC_BRANDS or any(brands[1][i:i + 4] in HEIC_BRANDS for i in range(0, len(brands[1]), 4)):
+            return 'heic'
+    return None
+
+
+_READERS = {
+    'png': _png_size,
+    'gif': _gif_size,
+    'jpeg': _jpeg_size,
+    'webp': _webp_size,
+    'heic': _heic_size,
+}
+
+
+def get_image_info(filename):
+    """
+        Reads the format and size of an image from its headers.
+
+    :return: (format, width, height), where format is 'png', 'gif', 'jpeg', 'webp' or 'heic'.
+    """
     with open(filename, 'rb') as fhandle:
-        head = fhandle.read(24)
-        if len(head) != 24:
+        header = _Header(fhandle)
+        if len(header.head) < 24:
             raise RuntimeError("Invalid Header")
-        if imghdr.what(filename) == 'png':
-            check = struct.unpack('>i', head[4:8])[0]
-            if check != 0x0d0a1a0a:
-                raise RuntimeError("PNG: Invalid check")
-            width, height = struct.unpack('>ii', head[16:24])
-        elif imghdr.what(filename) == 'gif':
-            width, height = struct.unpack('<HH', head[6:10])
-        elif imghdr.what(filename) == 'jpeg':
-            fhandle.seek(0)  # Read 0xff next
-            size = 2
-            ftype = 0
-            while not 0xc0 <= ftype <= 0xcf:
-                fhandle.seek(size, 1)
-                byte = fhandle.read(1)
-                while ord(byte) == 0xff:
-                    byte = fhandle.read(1)
-                ftype = ord(byte)
-                size = struct.unpack('>H', fhandle.read(2))[0] - 2
-            # We are at a SOFn block
-            fhandle.seek(1, 1)  # Skip `precision' byte.
-            height, width = struct.unpack('>HH', fhandle.read(4))
-        else:
+        image_format = _image_format(header.head)
+        if image_format is None:
             raise RuntimeError("Unsupported format")
-        return width, height
+        try:
+            width, height = _READERS[image_format](header)
+        except struct.error:
+            raise RuntimeError("Invalid Header")
+    return image_format, width, height
+
+
+def get_image_size(filename):
+    """
+        Reads the size of an image from its headers. Sizes are remembered until the file changes.
+
+    :return: (width, height)
+    """
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_mtime, stat.st_size)
+    with _cache_lock:
+        size = _cache.pop(key, None)
+        if size is not None:
+            _cache[key] = size  # Now the most recently used.
+    if size is not None:
+        return size
+    _, width, height = get_image_info(filename)
+    with _cache_lock:
+        _cache[key] = (width, height)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return width, height
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def get_image_sizes(directory, workers=8):
+    """
+        Reads the size of every image in directory at once, with a pool of threads.
+
+        The sizes are remembered, so later calls to get_image_size() for these images don't read them again.
+
+    :return: dictionary mapping the path of each image to its (width, height). Files that aren't images of a supported
+             format are left out.
+    """
+    from multiprocessing.pool import ThreadPool  # Slow to import, and only needed here.
+
+    paths = [os.path.join(directory, name) for name in sorted(os.listdir(directory))]
+    paths = [path for path in paths if os.path.isfile(path)]
+    if not paths:
+        return {}
+
+    def probe(path):
+        try:
+            return path, get_image_size(path)
+        except (RuntimeError, IOError, OSError):
+            return path, None
+
+    pool = ThreadPool(max(1, min(workers, len(paths))))
+    try:
+        return dict((path, size) for path, size in pool.imap_unordered(probe, paths, chunksize=16)
+                    if size is not None)
+    finally:
+        pool.terminate()
+        pool.join()
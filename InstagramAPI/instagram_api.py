@@ -4,6 +4,8 @@ from __future__ import absolute_import
 
 from .base import AuthenticationError
 from .endpoints import InstagramAPIEndPoints
+from .executor import BulkMap
+from .records import record_fields
 
 
 class InstagramAPI(InstagramAPIEndPoints):
@@ -17,12 +19,20 @@ class InstagramAPI(InstagramAPIEndPoints):
     # Make visible to clients for ease of reference.
     AuthenticationError = AuthenticationError
 
-    def __init__(self, username, password, two_factor_callback=None):
-        InstagramAPIEndPoints.__init__(self, username, password, two_factor_callback)
+    def __init__(self, username, password, two_factor_callback=None, **kwargs):
+        InstagramAPIEndPoints.__init__(self, username, password, two_factor_callback, **kwargs)
 
     # Helper functions to gather complete lists/deal with pagination.
+    #
+    # Each takes delay_between_calls, the number of seconds to sleep between pages, prefetch, the number of pages
+    # to fetch in the background while the current page is being processed, and stream, which decodes each page
+    # while it is still downloading (requires ijson to save memory).
+    #
+    # The iterators over users, media and comments also take compact, which yields records of a few common fields
+    # instead of whole dictionaries, and fields, which yields records of the fields given (see records.py).
 
-    def followers_iter(self, username=None, delay_between_calls=0):
+    def followers_iter(self, username=None, delay_between_calls=0, prefetch=0, stream=False, compact=False,
+                       fields=None):
         """ 
             Yields a series of dictionaries describing each user that follows this user.
         """
@@ -31,10 +41,14 @@ class InstagramAPI(InstagramAPIEndPoints):
         for item in self._iterator_template(
                 lambda max_id: self.get_user_followers(username, max_id),
                 field="users",
-                delay_between_calls=delay_between_calls):
+                delay_between_calls=delay_between_calls,
+                prefetch=prefetch,
+                stream=stream,
+                fields=record_fields('users', compact, fields)):
             yield item
 
-    def followings_iter(self, username=None, delay_between_calls=0):
+    def followings_iter(self, username=None, delay_between_calls=0, prefetch=0, stream=False, compact=False,
+                        fields=None):
         """ 
             Yields a series of dictionaries describing each user that this user follows
             If username is None, use logged in user.
@@ -45,10 +59,14 @@ class InstagramAPI(InstagramAPIEndPoints):
         for item in self._iterator_template(
                 lambda max_id: self.get_user_followings(username, max_id),
                 field="users",
-                delay_between_calls=delay_between_calls):
+                delay_between_calls=delay_between_calls,
+                prefetch=prefetch,
+                stream=stream,
+                fields=record_fields('users', compact, fields)):
             yield item
 
-    def userfeed_iter(self, username=None, min_timestamp=None, delay_between_calls=0):
+    def userfeed_iter(self, username=None, min_timestamp=None, delay_between_calls=0, prefetch=0, stream=False,
+                      compact=False, fields=None):
         """ 
             Yields a series of dictionaries describing this user's feed.
             If username is None, use logged in user.
@@ -59,10 +77,13 @@ class InstagramAPI(InstagramAPIEndPoints):
         for item in self._iterator_template(
                 lambda max_id: self.get_user_feed(username, max_id, min_timestamp),
                 field="items",
-                delay_between_calls=delay_between_calls):
+                delay_between_calls=delay_between_calls,
+                prefetch=prefetch,
+                stream=stream,
+                fields=record_fields('items', compact, fields)):
             yield item
 
-    def likedmedia_iter(self, delay_between_calls=0):
+    def likedmedia_iter(self, delay_between_calls=0, prefetch=0, stream=False):
         """ 
             Yields a series of dictionaries describing liked media.
 
@@ -71,19 +92,42 @@ class InstagramAPI(InstagramAPIEndPoints):
         for item in self._iterator_template(
                 self.get_liked_media,
                 field="items",
-                delay_between_calls=delay_between_calls):
+                delay_between_calls=delay_between_calls,
+                prefetch=prefetch,
+                stream=stream):
             yield item
 
-    def media_comments_iter(self, media_id, delay_between_calls=0):
+    def media_comments_iter(self, media_id, delay_between_calls=0, prefetch=0, stream=False, compact=False,
+                            fields=None):
         """
             Yields a series of dictionaries describing media comments.
         """
         for item in self._iterator_template(
                 lambda max_id: self.get_media_comments(media_id, max_id),
                 field="comments",
-                delay_between_calls=delay_between_calls):
+                delay_between_calls=delay_between_calls,
+                prefetch=prefetch,
+                stream=stream,
+                fields=record_fields('comments', compact, fields)):
             yield item
 
+    def map(self, endpoint, items, concurrency=8, ordered=True):
+        """
+            Calls an endpoint for each of a list of arguments, several calls at once, within the rate limiter's
+            budget.
+
+            E.g. for result in api.map('get_username_info', user_pks): ...
+
+        :param endpoint: name of the endpoint method (e.g. 'media_info'), or the method itself.
+        :param items: iterable of the argument for each call. A tuple is passed as several arguments.
+        :param concurrency: number of calls made at once.
+        :param ordered: if True, results are yielded in the order of items; otherwise as the calls finish.
+        :return: a BulkMap, which yields a dictionary with the "item", the "response" (or None) and the "error" (or
+                 None) for each call when iterated over, and has the counts of calls and errors in its stats.
+        """
+        func = endpoint if callable(endpoint) else getattr(self, endpoint)
+        return BulkMap(func, items, concurrency=concurrency, ordered=ordered)
+
     # Helper functions to find out information about the logged in user.
     #
     # Consider replacing these with None defaults for userid.
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains the collection of measurements of where the time of calls to Instagram goes.
+
+    Give an API instance a Metrics to have it measure each call: its latency, status, the bytes sent and received,
+    the time spent decoding the response, signing the request and waiting on the rate limiter, and the time iterators
+    wait for each page. Without one, the only cost is checking that there isn't one.
+
+    The measurements can be read with snapshot(), exported in the Prometheus text format with prometheus(), or passed
+    as they are made to hooks, e.g. to forward them to another monitoring system.
+    """
+
+from __future__ import absolute_import
+
+import bisect
+import logging
+import threading
+import time
+
+from .retry import endpoint_key
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+clock = getattr(time, 'perf_counter', time.time)
+
+# Upper bounds, in seconds, of the histogram buckets.
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CPU_BUCKETS = (0.00001, 0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+
+
+class Histogram(object):
+    """ Counts of observations no greater than each bucket's upper bound, as Prometheus histograms have. """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last counts observations above every bound.
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """ :return: list of (upper bound, number of observations no greater than it), ending with +Inf. """
+        total, result = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def as_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'buckets': self.cumulative()}
+
+
+class _EndpointMetrics(object):
+
+    def __init__(self):
+        self.calls = {}  # (method, status) -> count
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.decode = Histogram(CPU_BUCKETS)
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.throttled_seconds = 0.0
+
+
+class Metrics(object):
+    """ Measurements of the calls made by one or more API instances. Thread-safe. """
+
+    def __init__(self, hooks=()):
+        """
+        :param hooks: functions to call with each measurement, as (event, endpoint, values): event is 'call',
+               'decode', 'throttle', 'sign' or 'page', endpoint is named as retry.endpoint_key() names it (or, for
+               'page', is the name of the list), and values is a dictionary of the measurement.
+        """
+        self.hooks = list(hooks)
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._signing = Histogram(CPU_BUCKETS)
+        self._pages = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def _endpoint(self, key):
+        entry = self._endpoints.get(key)
+        if entry is None:
+            entry = self._endpoints[key] = _EndpointMetrics()
+        return entry
+
+    def _notify(self, event, key, values):
+        for hook in self.hooks:
+            try:
+                hook(event, key, values)
+            except Exception:
+                LOGGER.exception("Metrics hook %r failed.", hook)
+
+    def observe_call(self, endpoint, method, status, seconds, request_bytes=0, response_bytes=0):
+        """ Records a call (each attempt, if it was retried). status is None if no response was received. """
+        key = endpoint_key(endpoint)
+        with self._lock:
+            entry = self._endpoint(key)
+            status_key = (method, status)
+            entry.calls[status_key] = entry.calls.get(status_key, 0) + 1
+            entry.latency.observe(seconds)
+            entry.request_bytes += request_bytes
+            entry.response_bytes += response_bytes
+        if self.hooks:
+            self._notify('call', key, {'method': method, 'status': status, 'seconds': seconds,
+                                       'request_bytes': request_bytes, 'response_bytes': response_bytes})
+
+    def observe_decode(self, endpoint, seconds):
+        key = endpoint_key(endpoint)
+        with self._lock:
+            self._endpoint(key).decode.observe(seconds)
+        if self.hooks:
+            self._notify('decode', key, {'seconds': seconds})
+
+    def observe_throttle(self, endpoint, seconds):
+        key = endpoint_key(endpoint)
+        with self._lock:
+            self._endpoint(key).throttled_seconds += seconds
+        if self.hooks:
+            self._notify('throttle', key, {'seconds': seconds})
+
+    def observe_signing(self, seconds):
+        with self._lock:
+            self._signing.observe(seconds)
+        if self.hooks:
+            self._notify('sign', None, {'seconds': seconds})
+
+    def observe_page(self, field, seconds):
+        """ Records the time an iterator over the list named field waited for a page. """
+        with self._lock:
+            histogram = self._pages.get(field)
+            if histogram is None:
+                histogram = self._pages[field] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+        if self.hooks:
+            self._notify('page', field, {'seconds': seconds})
+
+    def timed_pages(self, pages, field):
+        """ Yields the pages pages yields, recording how long each took to arrive. """
+        pages = iter(pages)
+        try:
+            while True:
+                started = clock()
+                try:
+                    page = next(pages)
+                except StopIteration:
+                    return
+                self.observe_page(field, clock() - started)
+                yield page
+        finally:
+            if hasattr(pages, 'close'):
+                pages.close()  # Stops any prefetching, if the caller stopped early.
+
+    def snapshot(self):
+        """
+        :return: dictionary of the measurements so far. "endpoints" maps each endpoint to its "calls" (a dictionary
+                 mapping "METHOD status" to a count), "latency" and "decode" histograms, "request_bytes",
+                 "response_bytes" and "throttled_seconds". "signing" is the histogram of the time taken to sign
+                 requests, and "pages" maps each list the iterators went through to a histogram of the wait for each
+                 page. Histograms are dictionaries of "count", "sum" and cumulative "buckets".
+        """
+        with self._lock:
+            return {
+                'endpoints': dict((key, {
+                    'calls': dict(('%s %s' % (method, status), count)
+                                  for (method, status), count in entry.calls.items()),
+                    'latency': entry.latency.as_dict(),
+                    'decode': entry.decode.as_dict(),
+                    'request_bytes': entry.request_bytes,
+                    'response_bytes': entry.response_bytes,
+                    'throttled_seconds': entry.throttled_seconds,
+                }) for key, entry in self._endpoints.items()),
+                'signing': self._signing.as_dict(),
+                'pages': dict((field, histogram.as_dict()) for field, histogram in self._pages.items()),
+            }
+
+    def prometheus(self, prefix='instagramapi'):
+        """ :return: the measurements in the Prometheus text exposition format. """
+        lines = []
+
+        def header(name, kind, text):
+            lines.append('# HELP %s_%s %s' % (prefix, name, text))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+
+        def sample(name, labels, value):
+            label_text = ','.join('%s="%s"' % (label, _escape(label_value)) for label, label_value in labels)
+            lines.append('%s_%s%s %s' % (prefix, name, '{%s}' % label_text if label_text else '', _number(value)))
+
+        def histogram(name, labels, values):
+            for bound, count in values.cumulative():
+                sample(name + '_bucket', labels + [('le', _number(bound))], count)
+            sample(name + '_sum', labels, values.sum)
+            sample(name + '_count', labels, values.count)
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            header('calls_total', 'counter', 'Calls made to Instagram, by endpoint, method and HTTP status.')
+            for key, entry in endpoints:
+                for (method, status), count in sorted(entry.calls.items(), key=lambda item: str(item[0])):
+                    sample('calls_total', [('endpoint', key), ('method', method),
+                                           ('status', 'none' if status is None else str(status))], count)
+            header('call_seconds', 'histogram', 'Time from sending a call to receiving its response.')
+            for key, entry in endpoints:
+                histogram('call_seconds', [('endpoint', key)], entry.latency)
+            header('decode_seconds', 'histogram', 'Time spent decoding responses.')
+            for key, entry in endpoints:
+                histogram('decode_seconds', [('endpoint', key)], entry.decode)
+            header('request_bytes_total', 'counter', 'Bytes sent in the bodies of calls.')
+            for key, entry in endpoints:
+                sample('request_bytes_total', [('endpoint', key)], entry.request_bytes)
+            header('response_bytes_total', 'counter', 'Bytes received in the bodies of responses.')
+            for key, entry in endpoints:
+                sample('response_bytes_total', [('endpoint', key)], entry.response_bytes)
+            header('throttled_seconds_total', 'counter', 'Time calls waited on the rate limiter.')
+            for key, entry in endpoints:
+                sample('throttled_seconds_total', [('endpoint', key)], entry.throttled_seconds)
+            header('signing_seconds', 'histogram', 'Time spent signing request bodies.')
+            histogram('signing_seconds', [], self._signing)
+            header('page_wait_seconds', 'histogram', 'Time iterators waited for each page, by list.')
+            for field, values in sorted(self._pages.items()):
+                histogram('page_wait_seconds', [('list', field)], values)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def body_size(body):
+    """ :return: the number of bytes in a request body: bytes, URL-encoded text, or a (streaming) multipart encoder. """
+    if body is None:
+        return 0
+    size = getattr(body, 'len', None)  # requests_toolbelt's encoders know their length without being read.
+    if size is not None:
+        return size
+    try:
+        return len(body)
+    except TypeError:
+        return 0
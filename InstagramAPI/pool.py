@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains a pool of Instagram accounts that read-only calls are spread across.
+
+    The pool is thread-safe: calls made from several threads at once are sent through different accounts.
+    """
+
+from __future__ import absolute_import
+
+import logging
+import threading
+import time
+
+import requests
+
+from .base import AuthenticationError
+from .instagram_api import InstagramAPI
+from .throttling import RateLimiter
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+
+class NoHealthyAccountError(RuntimeError):
+    """ Raised when every account in the pool is cooling down after failures. """
+    pass
+
+
+class _Member(object):
+    """ Book-keeping for one account in the pool. """
+
+    def __init__(self, api):
+        self.api = api
+        self.login_lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0
+
+    def budget(self):
+        limiter = self.api.rate_limiter
+        return limiter.available() if limiter is not None else float('inf')
+
+
+class InstagramAPIPool(object):
+    """ Sends read-only calls to the least loaded healthy account of a set of accounts.
+
+        Accounts are logged in to the first time they are used. An account that fails to log in, is throttled by
+        Instagram, or fails max_failures calls in a row is rested for `cooldown` seconds. Calls that fail because of
+        throttling or connection problems are tried again on another account.
+    """
+
+    READ_METHODS = (
+        'fb_user_search',
+        'get_geo_media',
+        'get_hashtag_feed',
+        'get_location_feed',
+        'get_media_comments',
+        'get_media_likers',
+        'get_user_feed',
+        'get_user_followers',
+        'get_user_followings',
+        'get_user_tags',
+        'get_username_info',
+        'media_info',
+        'search_location',
+        'search_tags',
+        'search_username',
+        'search_users',
+        'tag_feed',
+        'user_friendship',
+    )
+
+    ITERATORS = (
+        'followers_iter',
+        'followings_iter',
+        'media_comments_iter',
+        'userfeed_iter',
+    )
+
+    def __init__(self, accounts, rate=1.0, burst=5, cooldown=300, max_failures=3, api_factory=None):
+        """
+        :param accounts: a list of (username, password) pairs, or of InstagramAPI instances.
+        :param rate: calls per second allowed for each account created from a (username, password) pair.
+        :param burst: number of calls each of those accounts may make in quick succession.
+        :param cooldown: number of seconds an account is rested after it fails.
+        :param max_failures: number of failed calls in a row after which an account is rested.
+        :param api_factory: optional function taking (username, password, rate_limiter) and returning an InstagramAPI.
+        """
+        api_factory = api_factory or (lambda username, password, rate_limiter: InstagramAPI(
+            username, password, rate_limiter=rate_limiter))
+        self._members = []
+        for account in accounts:
+            if isinstance(account, InstagramAPI):
+                api = account
+            else:
+                username, password = account
+                api = api_factory(username, password, RateLimiter(rate=rate, burst=burst))
+            self._members.append(_Member(api))
+        self.cooldown = cooldown
+        self.max_failures = max_failures
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._members)
+
+    def _checkout(self, exclude=()):
+        """ Picks the least loaded healthy account, and counts the call against it. """
+        now = time.time()
+        with self._lock:
+            candidates = [member for member in self._members
+                          if member.unhealthy_until <= now and member not in exclude]
+            if not candidates:
+                raise NoHealthyAccountError("No account in the pool is available.")
+            member = min(candidates, key=lambda m: (m.in_flight, -m.budget(), m.calls))
+            member.in_flight += 1
+            member.calls += 1
+        return member
+
+    def _checkin(self, member, error=None):
+        """ Records the outcome of a call.
+        :return: True if the account has been rested, and the call is worth trying on another account.
+        """
+        with self._lock:
+            member.in_flight -= 1
+            if error is None:
+                member.consecutive_failures = 0
+                return False
+            member.failures += 1
+            member.consecutive_failures += 1
+            # Failing to log in, being throttled or losing the connection say nothing about the call itself.
+            rest_and_retry = (not member.api._isloggedin or
+                              self._is_account_problem(error) or self._is_transient(error))
+            if rest_and_retry or member.consecutive_failures >= self.max_failures:
+                LOGGER.info("Resting account %s for %s seconds after: %s",
+                            member.api._username, self.cooldown, error)
+                member.unhealthy_until = time.time() + self.cooldown
+            return rest_and_retry
+
+    @staticmethod
+    def _is_account_problem(error):
+        return isinstance(error, AuthenticationError) or (
+            isinstance(error, requests.HTTPError) and error.response is not None and
+            error.response.status_code in (401, 403))
+
+    @staticmethod
+    def _is_transient(error):
+        return isinstance(error, requests.ConnectionError) or (
+            isinstance(error, requests.HTTPError) and error.response is not None and
+            error.response.status_code == 429)
+
+    def _logged_in(self, member):
+        with member.login_lock:
+            member.api.login()
+        return member.api
+
+    def dispatch(self, method_name, *args, **kwargs):
+        """ Calls the named InstagramAPI method on the least loaded healthy account. """
+        tried = []
+        while True:
+            member = self._checkout(exclude=tried)
+            tried.append(member)
+            try:
+                result = getattr(self._logged_in(member), method_name)(*args, **kwargs)
+            except Exception as e:
+                if self._checkin(member, e) and len(tried) < len(self._members):
+                    LOGGER.info("Retrying %s on another account.", method_name)
+                    continue
+                raise
+            self._checkin(member)
+            return result
+
+    def iterate(self, iterator_name, *args, **kwargs):
+        """ Yields the results of the named InstagramAPI iterator, run on the least loaded healthy account. """
+        member = self._checkout()
+        try:
+            for item in getattr(self._logged_in(member), iterator_name)(*args, **kwargs):
+                yield item
+        except Exception as e:
+            self._checkin(member, e)
+            raise
+        except GeneratorExit:
+            self._checkin(member)
+            raise
+        self._checkin(member)
+
+    def status(self):
+        """ :return: a list of dictionaries describing the state of each account. """
+        now = time.time()
+        with self._lock:
+            return [{
+                'username': member.api._username,
+                'logged_in': member.api._isloggedin,
+                'healthy': member.unhealthy_until <= now,
+                'in_flight': member.in_flight,
+                'calls': member.calls,
+                'failures': member.failures,
+                'budget': member.budget(),
+            } for member in self._members]
+
+
+def _read_call(name):
+    def call(self, *args, **kwargs):
+        return self.dispatch(name, *args, **kwargs)
+
+    call.__name__ = name
+    call.__doc__ = "Calls InstagramAPI.%s on the least loaded healthy account." % name
+    return call
+
+
+def _iterator_call(name):
+    def call(self, *args, **kwargs):
+        return self.iterate(name, *args, **kwargs)
+
+    call.__name__ = name
+    call.__doc__ = "Yields the results of InstagramAPI.%s, run on the least loaded healthy account." % name
+    return call
+
+
+for _name in InstagramAPIPool.READ_METHODS:
+    setattr(InstagramAPIPool, _name, _read_call(_name))
+for _name in InstagramAPIPool.ITERATORS:
+    setattr(InstagramAPIPool, _name, _iterator_call(_name))
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains compact records of users, media and comments, for holding long lists in memory.
+
+    The iterators normally yield the whole dictionary Instagram sent for each item. Given compact=True or a list of
+    fields, they yield records instead, which keep only those fields, in slots rather than a dictionary, with their
+    short strings (such as usernames and the values of enumerations) interned so repeated values are stored once. A
+    RecordList goes further, storing a list of records by
+    column, with the integer columns (such as the pks) in arrays rather than as separate objects.
+    """
+
+from __future__ import absolute_import
+
+import sys
+import threading
+from array import array
+
+try:
+    _intern = sys.intern
+except AttributeError:  # Python 2, where only byte strings can be interned.
+    def _intern(value):
+        return intern(value) if isinstance(value, str) else value  # noqa: F821
+
+try:
+    _INTEGER_TYPES = (int, long)  # noqa: F821
+except NameError:
+    _INTEGER_TYPES = (int,)
+
+try:
+    array('q')
+    _INT64 = 'q'
+except ValueError:  # Python 2 has no 'q'; 'l' is 64 bits on the platforms it runs on in practice.
+    _INT64 = 'l'
+
+# The fields kept by compact=True, for each kind of list the iterators return.
+DEFAULT_FIELDS = {
+    'users': ('pk', 'username', 'full_name', 'is_private', 'is_verified'),
+    'items': ('pk', 'id', 'code', 'media_type', 'taken_at', 'like_count', 'comment_count'),
+    'comments': ('pk', 'user_id', 'text', 'created_at'),
+}
+
+# Fields of free text, whose values are nearly all different, so interning them would save nothing and would keep
+# them in the interpreter's table of interned strings.
+FREE_TEXT_FIELDS = frozenset(('text', 'full_name', 'caption', 'biography', 'title', 'external_url', 'profile_pic_url'))
+# Longer strings of other fields aren't interned either.
+INTERN_MAX_LENGTH = 64
+
+_record_types = {}
+_record_types_lock = threading.Lock()
+
+
+def _compact(value):
+    return _intern(value) if isinstance(value, str) and len(value) <= INTERN_MAX_LENGTH else value
+
+
+class Record(object):
+    """ Base of the record types made by record_type(). Fields missing from an item are None. """
+
+    __slots__ = ()
+    _fields = ()  # The names of the attributes.
+    _paths = ()  # The dotted field names they were read from.
+    _interned = ()  # Whether the strings of each field are interned.
+
+    def __init__(self, *values):
+        if len(values) != len(self._fields):
+            raise TypeError("Expected %d values, got %d" % (len(self._fields), len(values)))
+        for name, value in zip(self._fields, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_dict(cls, item):
+        """ :return: a record of the fields of item, as Instagram sent it. """
+        record = cls.__new__(cls)
+        for name, path, interned in zip(cls._fields, cls._paths, cls._interned):
+            value = item
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            setattr(record, name, _compact(value) if interned else value)
+        return record
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def _asdict(self):
+        return dict(zip(self._fields, self.values()))
+
+    def __eq__(self, other):
+        return isinstance(other, Record) and self._fields == other._fields and self.values() == other.values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Record(%s)' % ', '.join('%s=%r' % item for item in zip(self._fields, self.values()))
+
+    def __reduce__(self):
+        return _make_record, (['.'.join(path) for path in self._paths], self.values())
+
+
+def _make_record(fields, values):
+    return record_type(fields)(*values)
+
+
+def record_type(fields):
+    """
+        Makes (or reuses) the record type holding the given fields.
+
+    :param fields: list of the names of the fields to keep. A field of a nested dictionary is named by its path, e.g.
+           'user.username', and is held in an attribute named with underscores, e.g. user_username.
+    :return: a subclass of Record.
+    """
+    fields = tuple(fields)
+    with _record_types_lock:
+        cls = _record_types.get(fields)
+        if cls is None:
+            names = tuple(field.replace('.', '_') for field in fields)
+            cls = type('Record', (Record,), {
+                '__slots__': names,
+                '_fields': names,
+                '_paths': tuple(tuple(field.split('.')) for field in fields),
+                '_interned': tuple(field.split('.')[-1] not in FREE_TEXT_FIELDS for field in fields),
+            })
+            _record_types[fields] = cls
+    return cls
+
+
+def record_fields(field, compact=False, fields=None):
+    """ :return: the fields an iterator over the list named field should keep, or None to keep whole dictionaries. """
+    if fields is not None:
+        return tuple(fields)
+    if compact:
+        return DEFAULT_FIELDS[field]
+    return None
+
+
+class RecordList(object):
+    """ A list of records, stored by column.
+
+        Columns whose values are all integers (such as pks and timestamps) are kept in arrays of 64 bit integers;
+        other columns are kept in lists. Records are made when they are read back.
+    """
+
+    def __init__(self, fields, records=()):
+        """
+        :param fields: the fields to keep, as for record_type().
+        :param records: optional records, or dictionaries, to add.
+        """
+        self.record_type = record_type(fields)
+        self._columns = [array(_INT64) for _ in self.record_type._fields]
+        self._length = 0
+        self.extend(records)
+
+    def append(self, record):
+        """ Adds a record, or a dictionary as Instagram sent it. """
+        if isinstance(record, dict):
+            record = self.record_type.from_dict(record)
+        for index, name in enumerate(self.record_type._fields):
+            value = getattr(record, name)
+            column = self._columns[index]
+            if isinstance(column, array):
+                if type(value) in _INTEGER_TYPES:  # Not bool, which would come back as an integer.
+                    try:
+                        column.append(value)
+                        continue
+                    except OverflowError:
+                        pass
+                column = self._columns[index] = list(column)
+            column.append(value)
+        self._length += 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def column(self, name):
+        """ :return: the values of one field, in order, as an array of integers or a list. """
+        return self._columns[self.record_type._fields.index(name.replace('.', '_'))]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        return self.record_type(*[column[index] for column in self._columns])
+
+    def __iter__(self):
+        for values in zip(*self._columns):
+            yield self.record_type(*values)
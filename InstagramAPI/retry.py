@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains the policy deciding which failed calls to Instagram are made again, and when.
+
+    Only calls that are safe to repeat are retried: GETs, and the POSTs that just read something or set something to
+    the state it would be left in anyway (such as following a user). Other POSTs, such as commenting or uploading, are
+    only retried if the connection couldn't be made at all, as then Instagram never saw them.
+
+    The wait before each retry grows exponentially, and is picked at random up to that limit ("full jitter"), so that
+    many clients failing at once don't all retry at once. If Instagram says when to retry (with Retry-After), the wait
+    is at least that long.
+    """
+
+from __future__ import absolute_import
+
+import email.utils
+import logging
+import random
+import re
+import threading
+import time
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+_ID = re.compile(r'(?<=/)[0-9_]+(?=/)|^[0-9_]+(?=/)')
+
+
+def endpoint_key(endpoint):
+    """ :return: endpoint without its query string, and with ids replaced by {id}, e.g. users/{id}/info/. """
+    return _ID.sub('{id}', endpoint.split('?')[0])
+
+
+class RetryPolicy(object):
+    """ Retries calls that fail with a connection error, a timeout, HTTP 429 (Too Many Requests) or a 5xx error.
+
+        Also sets the timeout of each call, and counts the retries made for each endpoint. May be shared between
+        instances.
+    """
+
+    RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+    # POSTs that can be repeated without changing the outcome.
+    IDEMPOTENT_POSTS = (
+        r'media/[^/]+/info/',
+        r'media/[^/]+/(like|unlike)/',
+        r'friendships/(show|show_many|create|destroy|block|unblock)/',
+        r'accounts/(current_user|set_private|set_public)/',
+        r'qe/(sync|expose)/',
+    )
+
+    def __init__(self, retries=3, backoff=1.0, max_backoff=60.0, max_retry_after=300.0, timeout=(10.0, 60.0),
+                 idempotent_posts=(), sleep=time.sleep, random=random.random):
+        """
+        :param retries: number of times a call is retried before its error is raised.
+        :param backoff: seconds the longest wait before the first retry can be. It doubles with each further retry.
+        :param max_backoff: the longest wait can't grow beyond this number of seconds.
+        :param max_retry_after: calls that Instagram asks to retry later than this number of seconds aren't retried.
+        :param timeout: seconds to wait to connect, and then for each read of the response, as a (connect, read) pair,
+               or a single number for both. None waits forever.
+        :param idempotent_posts: regular expressions matching further POST endpoints that are safe to repeat.
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.timeout = timeout
+        self._idempotent_posts = re.compile('|'.join('(?:%s)' % pattern for pattern in
+                                                     self.IDEMPOTENT_POSTS + tuple(idempotent_posts)))
+        self._sleep = sleep
+        self._random = random
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def connect_timeout(self):
+        return self.timeout[0] if isinstance(self.timeout, tuple) else self.timeout
+
+    @property
+    def read_timeout(self):
+        return self.timeout[1] if isinstance(self.timeout, tuple) else self.timeout
+
+    def is_idempotent(self, endpoint, post):
+        """ :return: True if the call can be made again without changing the outcome. """
+        return post is None or self._idempotent_posts.match(endpoint) is not None
+
+    @staticmethod
+    def parse_retry_after(value):
+        """ :return: the seconds to wait that a Retry-After header asks for (a number, or a date), or None. """
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            date = email.utils.parsedate_tz(value)
+            if date is None:
+                return None
+            return max(0.0, email.utils.mktime_tz(date) - time.time())
+
+    def retry_delay(self, endpoint, post, attempt, status=None, sent=True, retry_after=None):
+        """
+            Decides whether a failed call should be made again.
+
+        :param attempt: number of retries already made of this call.
+        :param status: HTTP status Instagram responded with, or None if the call failed without a response.
+        :param sent: False if the connection couldn't be made, so Instagram can't have seen the call.
+        :param retry_after: the value of the response's Retry-After header, if any.
+        :return: seconds to wait before retrying, or None if the call shouldn't be retried.
+        """
+        if attempt >= self.retries:
+            return None
+        if status is not None and status not in self.RETRY_STATUSES:
+            return None
+        if sent and not self.is_idempotent(endpoint, post):
+            return None
+        delay = self._random() * min(self.max_backoff, self.backoff * 2 ** attempt)
+        retry_after = self.parse_retry_after(retry_after)
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            delay = max(delay, retry_after)
+        with self._lock:
+            self._entry(endpoint)['retries'] += 1
+        LOGGER.info("Retrying %s in %.1f seconds (retry %d of %d).", endpoint, delay, attempt + 1, self.retries)
+        return delay
+
+    def wait(self, delay):
+        self._sleep(delay)
+
+    def record(self, endpoint, attempts, succeeded):
+        """ Counts a finished call, which took attempts retries and then succeeded or failed. """
+        with self._lock:
+            entry = self._entry(endpoint)
+            entry['calls'] += 1
+            if not succeeded:
+                entry['failed'] += 1
+            elif attempts:
+                entry['recovered'] += 1
+
+    def _entry(self, endpoint):
+        key = endpoint_key(endpoint)
+        entry = self._stats.get(key)
+        if entry is None:
+            entry = self._stats[key] = {'calls': 0, 'retries': 0, 'recovered': 0, 'failed': 0}
+        return entry
+
+    def stats(self):
+        """
+        :return: dictionary mapping each endpoint (as endpoint_key() names it) to a dictionary of the number of
+                 "calls" made to it, "retries" made of them, calls that succeeded after a retry ("recovered"), and
+                 calls that failed even so ("failed").
+        """
+        with self._lock:
+            return dict((key, dict(entry)) for key, entry in self._stats.items())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains a local record of who follows, and is followed by, users, which is brought up to date incrementally.
+
+    Instagram lists the most recent followers (and followings) first. So to find who is new, it is enough to read
+    from the start of the list until a run of users who were already known is seen. Finding who has gone still needs
+    the whole list, so that is done by a separate, less frequent, full sweep.
+    """
+
+from __future__ import absolute_import
+
+import logging
+import sqlite3
+import time
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+RELATIONS = {
+    'followers': 'followers_iter',
+    'followings': 'followings_iter',
+}
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS members (
+        owner INTEGER NOT NULL,
+        relation TEXT NOT NULL,
+        pk INTEGER NOT NULL,
+        username TEXT,
+        first_seen REAL NOT NULL,
+        PRIMARY KEY (owner, relation, pk)
+    );
+    CREATE TABLE IF NOT EXISTS changes (
+        owner INTEGER NOT NULL,
+        relation TEXT NOT NULL,
+        pk INTEGER NOT NULL,
+        change TEXT NOT NULL,
+        at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS changes_by_time ON changes (owner, relation, at);
+    CREATE TABLE IF NOT EXISTS sweeps (
+        owner INTEGER NOT NULL,
+        relation TEXT NOT NULL,
+        completed REAL NOT NULL,
+        PRIMARY KEY (owner, relation)
+    );
+"""
+
+
+class FollowSnapshots(object):
+    """ Snapshots of the followers and followings of users, kept in an SQLite file.
+
+        Additions and removals are only recorded once a sync or sweep has finished, so an interrupted one leaves the
+        snapshot as it was.
+    """
+
+    # Number of already known users in a row after which sync() assumes the rest of the list is known too.
+    KNOWN_RUN = 50
+
+    # Number of users written to the database at a time.
+    BATCH_SIZE = 1000
+
+    def __init__(self, api, filename, clock=time.time):
+        """
+        :param api: an InstagramAPI (or InstagramAPIPool) to read the lists through.
+        :param filename: the SQLite database file. Created if it doesn't exist.
+        """
+        self.api = api
+        self._clock = clock
+        self._db = sqlite3.connect(filename)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def _users(self, owner, relation, delay_between_calls):
+        if relation not in RELATIONS:
+            raise ValueError("relation must be one of %s" % ', '.join(sorted(RELATIONS)))
+        return getattr(self.api, RELATIONS[relation])(owner, delay_between_calls=delay_between_calls)
+
+    def members(self, owner, relation='followers'):
+        """ :return: set of the pks of the users in the snapshot. """
+        return set(pk for (pk,) in self._db.execute(
+            "SELECT pk FROM members WHERE owner = ? AND relation = ?", (owner, relation)))
+
+    def changes(self, owner, relation='followers', since=0):
+        """ :return: list of (pk, 'added' or 'removed', time) of the changes found since a time, oldest first. """
+        return self._db.execute(
+            "SELECT pk, change, at FROM changes WHERE owner = ? AND relation = ? AND at >= ? ORDER BY at, rowid",
+            (owner, relation, since)).fetchall()
+
+    def last_sweep(self, owner, relation='followers'):
+        """ :return: time of the last completed full sweep, or None if there hasn't been one. """
+        row = self._db.execute(
+            "SELECT completed FROM sweeps WHERE owner = ? AND relation = ?", (owner, relation)).fetchone()
+        return row[0] if row else None
+
+    def _stage(self):
+        """ Empties the temporary table the users read are staged in; lists may be millions long. """
+        # position keeps the order the users were read in, and the unique pk drops those read twice (pages shift as
+        # users are added while they are read).
+        self._db.execute("CREATE TEMP TABLE IF NOT EXISTS seen "
+                         "(position INTEGER PRIMARY KEY, pk INTEGER NOT NULL UNIQUE, username TEXT)")
+        self._db.execute("DELETE FROM seen")
+
+    def _stage_users(self, users):
+        self._db.executemany("INSERT OR IGNORE INTO seen (pk, username) VALUES (?, ?)",
+                             [(user['pk'], user.get('username')) for user in users])
+
+    def _known(self, owner, relation, pks):
+        """ :return: set of those of pks already in the snapshot, or staged. """
+        marks = ', '.join('?' * len(pks))
+        return set(pk for (pk,) in self._db.execute(
+            "SELECT pk FROM members WHERE owner = ? AND relation = ? AND pk IN (%s) "
+            "UNION SELECT pk FROM seen WHERE pk IN (%s)" % (marks, marks), [owner, relation] + pks + pks))
+
+    def _add_staged(self, owner, relation, now):
+        """ Adds the staged users not already in the snapshot. :return: the number added. """
+        added = self._db.execute(
+            "INSERT INTO changes (owner, relation, pk, change, at) "
+            "SELECT ?, ?, pk, 'added', ? FROM seen "
+            "WHERE pk NOT IN (SELECT pk FROM members WHERE owner = ? AND relation = ?) ORDER BY position",
+            (owner, relation, now, owner, relation)).rowcount
+        self._db.execute(
+            "INSERT OR IGNORE INTO members (owner, relation, pk, username, first_seen) "
+            "SELECT ?, ?, pk, username, ? FROM seen ORDER BY position", (owner, relation, now))
+        return added
+
+    def sync(self, owner, relation='followers', known_run=None, sweep_every=None, delay_between_calls=0):
+        """
+            Records the users added since the last sync, reading only as far into the list as needed.
+
+            Does a full sweep instead if there has never been one (as the snapshot must be complete for a sync to
+            stop early), or if the last was more than sweep_every seconds ago.
+
+        :param owner: pk of the user whose list to sync.
+        :param relation: 'followers' or 'followings'.
+        :param known_run: number of already known users in a row after which to stop. Defaults to KNOWN_RUN.
+        :param sweep_every: optional number of seconds after which a full sweep is due.
+        :return: dictionary with the numbers of users "added" and "removed". changes() lists them.
+        """
+        last_sweep = self.last_sweep(owner, relation)
+        if last_sweep is None or (sweep_every is not None and self._clock() - last_sweep >= sweep_every):
+            return self.full_sweep(owner, relation, delay_between_calls)
+
+        known_run = known_run or self.KNOWN_RUN
+        self._stage()
+        run, read, chunk = 0, 0, []
+        # Users are looked up known_run at a time, so at most that many are read past the end of the run.
+        for user in self._users(owner, relation, delay_between_calls):
+            chunk.append(user)
+            if len(chunk) >= known_run:
+                run, read, done = self._sync_chunk(owner, relation, chunk, run, read, known_run)
+                chunk = []
+                if done:
+                    break
+        else:
+            run, read, _ = self._sync_chunk(owner, relation, chunk, run, read, known_run)
+        with self._db:
+            added = self._add_staged(owner, relation, self._clock())
+        self._db.execute("DELETE FROM seen")
+        LOGGER.info("Sync of the %s of %s read %d users and found %d new.", relation, owner, read, added)
+        return {'added': added, 'removed': 0}
+
+    def _sync_chunk(self, owner, relation, chunk, run, read, known_run):
+        """
+            Stages the new users of chunk, up to the end of a run of known_run known users.
+
+        :return: (length of the run of known users so far, users read so far, whether the run is long enough).
+        """
+        if not chunk:
+            return run, read, False
+        known = self._known(owner, relation, [user['pk'] for user in chunk])
+        new = []
+        for user in chunk:
+            read += 1
+            if user['pk'] in known:
+                run += 1
+                if run >= known_run:
+                    self._stage_users(new)
+                    return run, read, True
+            else:
+                run = 0
+                known.add(user['pk'])
+                new.append(user)
+        self._stage_users(new)
+        return run, read, False
+
+    def full_sweep(self, owner, relation='followers', delay_between_calls=0):
+        """
+            Reads the whole list, recording both the users added and those removed.
+
+        :return: dictionary with the numbers of users "added" and "removed". changes() lists them.
+        """
+        self._stage()
+        batch = []
+        for user in self._users(owner, relation, delay_between_calls):
+            batch.append(user)
+            if len(batch) >= self.BATCH_SIZE:
+                self._stage_users(batch)
+                batch = []
+        self._stage_users(batch)
+
+        now = self._clock()
+        with self._db:
+            added = self._add_staged(owner, relation, now)
+            removed = self._db.execute(
+                "INSERT INTO changes (owner, relation, pk, change, at) "
+                "SELECT owner, relation, pk, 'removed', ? FROM members "
+                "WHERE owner = ? AND relation = ? AND pk NOT IN (SELECT pk FROM seen)",
+                (now, owner, relation)).rowcount
+            self._db.execute("DELETE FROM members WHERE owner = ? AND relation = ? AND pk NOT IN (SELECT pk FROM seen)",
+                             (owner, relation))
+            self._db.execute("INSERT OR REPLACE INTO sweeps (owner, relation, completed) VALUES (?, ?, ?)",
+                             (owner, relation, now))
+        self._db.execute("DELETE FROM seen")
+        LOGGER.info("Full sweep of the %s of %s found %d new and %d gone.", relation, owner, added, removed)
+        return {'added': added, 'removed': removed}
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains the rate limiter that paces calls to Instagram.
+
+    A RateLimiter can be given to one API instance, or shared between several so that together they stay within a
+    budget.
+    """
+
+from __future__ import absolute_import
+
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+
+class TokenBucket(object):
+    """ A token bucket that allows bursts of up to `burst` calls, refilled at `rate` calls per second.
+
+        Not thread-safe on its own; RateLimiter serialises access to it.
+    """
+
+    def __init__(self, rate, burst, clock=time.time):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self):
+        """ :return: number of calls that could be made right now without waiting (may be negative). """
+        self._refill()
+        return self._tokens
+
+    def reserve(self):
+        """
+            Takes a token, borrowing against the future if none are left.
+        :return: number of seconds the caller must wait before using the token.
+        """
+        self._refill()
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+
+class RateLimiter(object):
+    """ Paces calls to Instagram with token buckets, and adapts the pace to Instagram's responses.
+
+        Every call is charged to an overall bucket. Calls to an endpoint family ("friendships", "feed" or "media") are
+        also charged to that family's bucket, if a budget was given for it.
+
+        When Instagram responds with HTTP 429 (Too Many Requests), the rates are cut by `backoff`. Each successful call
+        then raises them by `ramp_up` of their starting rate, until they reach `max_rate` times their starting rate.
+    """
+
+    FAMILIES = (
+        ('friendships/', 'friendships'),
+        ('feed/', 'feed'),
+        ('media/', 'media'),
+        ('upload/', 'media'),
+    )
+
+    def __init__(self, rate=1.0, burst=5, family_rates=None, backoff=0.5, ramp_up=0.05, min_rate=0.01, max_rate=1.0,
+                 clock=time.time, sleep=time.sleep):
+        """
+        :param rate: calls per second, overall.
+        :param burst: number of calls that may be made in quick succession after a quiet period.
+        :param family_rates: optional dictionary mapping family name to (rate, burst).
+        :param backoff: factor the rates are multiplied by when Instagram says there are too many requests.
+        :param ramp_up: fraction of the starting rate added back to the rates after each successful call.
+        :param min_rate: rates are never cut below this number of calls per second.
+        :param max_rate: rates are never raised above this multiple of their starting rate. Values above 1 let the
+               limiter probe for a faster sustainable rate.
+        """
+        self._lock = threading.Lock()
+        self._sleep = sleep
+        self.backoff = backoff
+        self.ramp_up = ramp_up
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._buckets = {None: TokenBucket(rate, burst, clock)}
+        for family, (family_rate, family_burst) in (family_rates or {}).items():
+            self._buckets[family] = TokenBucket(family_rate, family_burst, clock)
+        self._base_rates = dict((name, bucket.rate) for name, bucket in self._buckets.items())
+        self.throttled_calls = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def family(cls, endpoint):
+        """ :return: the name of the family of endpoint, or None. """
+        for prefix, family in cls.FAMILIES:
+            if endpoint.startswith(prefix):
+                return family
+        return None
+
+    def _budgets_for(self, endpoint):
+        """ :return: names of the buckets a call to endpoint is charged to. """
+        family = self.family(endpoint) if endpoint is not None else None
+        if family is not None and family in self._buckets:
+            return [None, family]
+        return [None]
+
+    def reserve(self, endpoint):
+        """
+            Charges a call to endpoint against the budgets.
+        :return: number of seconds the caller must wait before making the call.
+        """
+        with self._lock:
+            return max(self._buckets[name].reserve() for name in self._budgets_for(endpoint))
+
+    def acquire(self, endpoint):
+        """
+            Charges a call to endpoint against the budgets, sleeping until the call may be made.
+        :return: number of seconds slept.
+        """
+        delay = self.reserve(endpoint)
+        if delay > 0:
+            LOGGER.debug("Throttling call to %s for %.2f seconds.", endpoint, delay)
+            self._sleep(delay)
+        return delay
+
+    def available(self, endpoint=None):
+        """ :return: number of calls to endpoint (or to any endpoint) that could be made right now without waiting. """
+        with self._lock:
+            return min(self._buckets[name].available() for name in self._budgets_for(endpoint))
+
+    def record(self, endpoint, status_code):
+        """ Adapts the rates to Instagram's response to a call to endpoint. """
+        with self._lock:
+            for name in self._budgets_for(endpoint):
+                bucket, base_rate = self._buckets[name], self._base_rates[name]
+                bucket.available()  # Settle the tokens earned at the old rate.
+                if status_code == 429:
+                    bucket.rate = max(self.min_rate, bucket.rate * self.backoff)
+                elif status_code < 400:
+                    bucket.rate = min(base_rate * self.max_rate, bucket.rate + base_rate * self.ramp_up)
+            if status_code == 429:
+                self.throttled_calls += 1
+                LOGGER.info("Instagram asked for fewer requests. Slowing to %.3f calls per second.",
+                            self._buckets[None].rate)
+
+    @property
+    def rate(self):
+        """ The current overall rate, in calls per second. """
+        return self._buckets[None].rate
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains the HTTP transport plumbing that sits underneath the requests.Session used by the API.
+
+    Clients don't normally need to touch this module; the API classes mount the adapters for you.
+
+    The exception is recording and replaying: give an API instance a RecordingAdapter to record the calls it makes
+    (and the responses to them) in a Cassette, and later a ReplayAdapter to answer the same calls from the cassette,
+    without a network or an Instagram account, optionally as slowly as a given network would. This makes runs
+    repeatable, so they can be profiled and benchmarked.
+    """
+
+from __future__ import absolute_import
+
+import base64
+import collections
+import gzip
+import io
+import json
+import logging
+import threading
+import time
+
+import requests
+from requests import Request
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from .metrics import body_size
+from .retry import endpoint_key
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:  # Python 2
+    from urlparse import urlsplit
+
+LOGGER = logging.getLogger('InstagramAPI')
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """ An HTTPAdapter that keeps connections to Instagram alive between calls.
+
+        It also keeps count of how many connections were opened, and how many requests were served by re-using an
+        existing connection, so the benefit of the pool can be observed.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=10, **kwargs):
+        self._stats_lock = threading.Lock()
+        self._opened = 0
+        self._reused = 0
+        HTTPAdapter.__init__(self, pool_connections=pool_connections, pool_maxsize=pool_maxsize, **kwargs)
+
+    def __setstate__(self, state):
+        self._stats_lock = threading.Lock()
+        self._opened = 0
+        self._reused = 0
+        HTTPAdapter.__setstate__(self, state)
+
+    def _count(self, conn):
+        """ Records whether conn is still using the socket it used last time (i.e. it was kept alive). """
+        sock = getattr(conn, 'sock', None)
+        if sock is None:
+            return
+        with self._stats_lock:
+            if getattr(conn, '_instagram_last_sock', None) is sock:
+                self._reused += 1
+            else:
+                conn._instagram_last_sock = sock
+                self._opened += 1
+
+    def build_response(self, req, resp):
+        # The urllib3 response still holds the connection it was read from at this point.
+        self._count(getattr(resp, '_connection', None))
+        return HTTPAdapter.build_response(self, req, resp)
+
+    def connection_stats(self):
+        """
+        :return: dictionary with the number of connections "opened" and how many requests "reused" an already open
+                 connection.
+        """
+        with self._stats_lock:
+            return {'opened': self._opened, 'reused': self._reused}
+
+    def _pool_for(self, url, verify, cert, proxies):
+        """ Returns the same connection pool that a request to url with these settings would use. """
+        if hasattr(self, 'get_connection_with_tls_context'):
+            return self.get_connection_with_tls_context(
+                Request('GET', url).prepare(), verify, proxies=proxies, cert=cert)
+        return self.get_connection(url, proxies)
+
+    def warm_up(self, url, connections=1, verify=True, cert=None, proxies=None):
+        """
+            Opens (up to) `connections` connections to the host of `url` and leaves them idle in the pool, so the
+            first calls don't pay for the TCP and TLS handshakes.
+
+            verify, cert and proxies should match the settings the session will send requests with; otherwise the
+            connections end up in a different pool and are never used.
+
+        :return: number of connections that were opened.
+        """
+        pool = self._pool_for(url, verify, cert, proxies)
+        checked_out = []
+        opened = 0
+        try:
+            for _ in range(min(connections, self._pool_maxsize)):
+                conn = pool._get_conn()
+                checked_out.append(conn)
+                if getattr(conn, 'sock', None) is None:
+                    conn.connect()
+                    self._count(conn)
+                    opened += 1
+        finally:
+            for conn in checked_out:
+                pool._put_conn(conn)
+        return opened
+
+
+class CassetteMiss(requests.RequestException):
+    """ Raised when a replayed call has no recorded response left to answer it with. """
+
+
+class Cassette(object):
+    """ Recorded calls to Instagram, and the responses to them.
+
+        Calls are matched by method and path, with ids folded (as retry.endpoint_key() does), so calls whose URLs
+        change from run to run (such as uploads, named after the time) still match. Calls with the same method and
+        path are answered with their responses in the order they were recorded.
+
+        Request bodies aren't kept, only their size, so passwords and uploaded media stay out of the cassette. Unless
+        scrub is False, cookie values are replaced too; but the responses themselves may still hold private data.
+    """
+
+    VERSION = 1
+
+    # Response headers worth keeping; others (dates, tracing ids) only make cassettes bigger. Content-Encoding isn't
+    # kept, as bodies are kept decoded.
+    HEADERS = ('Content-Type', 'Retry-After')
+
+    def __init__(self, interactions=(), scrub=True):
+        self.scrub = scrub
+        self.interactions = list(interactions)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(method, url):
+        return method.upper(), endpoint_key(urlsplit(url).path.lstrip('/'))
+
+    def add(self, method, url, status=200, body=b'', headers=None, cookies=None, request_size=0):
+        """
+            Adds a call and its response.
+
+        :param body: the response's body, as bytes or text (which is encoded as UTF-8).
+        :param cookies: optional dictionary of the cookies the response sets.
+        """
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        interaction = {
+            'method': method.upper(),
+            'url': url,
+            'request_size': request_size,
+            'status': status,
+            'headers': dict(headers or {}),
+            'cookies': dict(cookies or {}),
+        }
+        try:
+            interaction['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            interaction['body_base64'] = base64.b64encode(body).decode('ascii')
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def record(self, request, response):
+        """ Adds a call made with requests, and its (already read) response. """
+        cookies = dict((cookie.name, 'scrubbed' if self.scrub else cookie.value) for cookie in response.cookies)
+        headers = dict((name, response.headers[name]) for name in self.HEADERS if name in response.headers)
+        self.add(request.method, request.url, response.status_code, response.content, headers, cookies,
+                 request_size=body_size(request.body))
+
+    def save(self, filename):
+        """ Writes the cassette to a file, as gzipped lines of JSON. """
+        with self._lock:
+            interactions = list(self.interactions)
+        with gzip.open(filename, 'wb') as cassette_file:
+            cassette_file.write((json.dumps({'version': self.VERSION}) + '\n').encode('utf-8'))
+            for interaction in interactions:
+                cassette_file.write((json.dumps(interaction, sort_keys=True) + '\n').encode('utf-8'))
+
+    @classmethod
+    def load(cls, filename):
+        with gzip.open(filename, 'rb') as cassette_file:
+            lines = cassette_file.read().decode('utf-8').splitlines()
+        header = json.loads(lines[0])
+        if header.get('version') != cls.VERSION:
+            raise ValueError("%s is a cassette of an unknown version." % filename)
+        return cls(json.loads(line) for line in lines[1:])
+
+    def __len__(self):
+        return len(self.interactions)
+
+
+class RecordingAdapter(PooledHTTPAdapter):
+    """ A PooledHTTPAdapter that also records each call, and the response to it, in a Cassette.
+
+        Responses are read in full before being returned, so streamed pages aren't streamed while recording.
+    """
+
+    __attrs__ = PooledHTTPAdapter.__attrs__ + ['cassette']
+
+    def __init__(self, cassette, **kwargs):
+        self.cassette = cassette
+        PooledHTTPAdapter.__init__(self, **kwargs)
+
+    def send(self, request, **kwargs):
+        response = PooledHTTPAdapter.send(self, request, **kwargs)
+        response.content  # Read it, so it can be recorded (and still be read by the caller).
+        self.cassette.record(request, response)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """ Answers calls with the responses recorded in a Cassette, without using the network.
+
+        Optionally simulates a network: each call takes latency seconds, plus the time to send the request and
+        receive the response at bandwidth bytes per second.
+    """
+
+    def __init__(self, cassette, latency=0.0, bandwidth=None, repeat=False, sleep=time.sleep):
+        """
+        :param cassette: the Cassette to replay.
+        :param latency: seconds added to each call.
+        :param bandwidth: optional bytes per second the request and response are sent at.
+        :param repeat: if True, once the responses to a call are used up, they are replayed again from the first.
+               Otherwise a further call raises CassetteMiss.
+        """
+        BaseAdapter.__init__(self)
+        self.cassette = cassette
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.repeat = repeat
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._responses = collections.defaultdict(collections.deque)
+        self._used = collections.defaultdict(list)
+        for interaction in cassette.interactions:
+            self._responses[Cassette.key(interaction['method'], interaction['url'])].append(interaction)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _next(self, key):
+        with self._lock:
+            responses = self._responses[key]
+            if not responses and self.repeat and self._used[key]:
+                responses.extend(self._used.pop(key))
+            if not responses:
+                return None
+            interaction = responses.popleft()
+            self._used[key].append(interaction)
+            return interaction
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        interaction = self._next(Cassette.key(request.method, request.url))
+        if interaction is None:
+            raise CassetteMiss("No recorded response to %s %s" % (request.method, request.url), request=request)
+        if 'body_base64' in interaction:
+            body = base64.b64decode(interaction['body_base64'])
+        else:
+            body = interaction['body'].encode('utf-8')
+
+        delay = self.latency
+        if self.bandwidth:
+            delay += float(body_size(request.body) + len(body)) / self.bandwidth
+        if delay > 0:
+            self._sleep(delay)
+
+        response = requests.Response()
+        response.status_code = interaction['status']
+        response.headers = CaseInsensitiveDict(interaction['headers'])
+        response.headers['Content-Length'] = str(len(body))
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        for name, value in interaction['cookies'].items():
+            response.cookies.set(name, value)
+        return response
+
+    def close(self):
+        pass
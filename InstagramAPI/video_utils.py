@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Contains a reader of the duration and size of MP4 and QuickTime (MOV) videos.
+
+    Only the headers are read; the media data, which makes up nearly all of the file, is seeked over.
+    """
+
+from __future__ import absolute_import
+
+import os
+import struct
+
+# Boxes that contain the boxes describing the movie and its tracks.
+CONTAINER_BOXES = (b'moov', b'trak')
+
+
+def _boxes(data, start, end):
+    """ Yields (type, body start, body end) for each box in data[start:end]. """
+    while start + 8 <= end:
+        size, box_type = struct.unpack('>I4s', data[start:start + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', data[start + 8:start + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            raise RuntimeError("Invalid box size")
+        yield box_type, start + header, min(start + size, end)
+        start += size
+
+
+def _find_moov(fhandle):
+    """ Walks the top-level boxes, seeking over the (large) media data, and returns the body of the moov box. """
+    fhandle.seek(0, os.SEEK_END)
+    file_size = fhandle.tell()
+    position = 0
+    while position + 8 <= file_size:
+        fhandle.seek(position)
+        head = fhandle.read(16)
+        size, box_type = struct.unpack('>I4s', head[:8])
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', head[8:16])[0]
+            header = 16
+        elif size == 0:
+            size = file_size - position
+        if size < header:
+            raise RuntimeError("Invalid box size")
+        if box_type == b'moov':
+            fhandle.seek(position + header)
+            return fhandle.read(size - header)
+        position += size
+    raise RuntimeError("Unsupported format")
+
+
+def get_video_info(filename):
+    """ Reads the duration (in seconds), width and height of an MP4 or QuickTime (MOV) file from its headers.
+
+        Raises RuntimeError if the file can't be parsed.
+    """
+    try:
+        return _get_video_info(filename)
+    except struct.error:
+        raise RuntimeError("Truncated header")
+
+
+def _get_video_info(filename):
+    with open(filename, 'rb') as fhandle:
+        moov = _find_moov(fhandle)
+    duration = None
+    width = height = 0
+    for box_type, start, end in _boxes(moov, 0, len(moov)):
+        if box_type == b'mvhd':
+            version = ord(moov[start:start + 1])
+            if version == 1:
+                timescale, length = struct.unpack('>IQ', moov[start + 20:start + 32])
+            else:
+                timescale, length = struct.unpack('>II', moov[start + 12:start + 20])
+            if not timescale:
+                raise RuntimeError("Invalid timescale")
+            duration = float(length) / timescale
+        elif box_type == b'trak' and not width:
+            for child_type, child_start, child_end in _boxes(moov, start, end):
+                if child_type == b'tkhd':
+                    version = ord(moov[child_start:child_start + 1])
+                    # Skip version, flags, times, track id and duration; then reserved, layer, group, volume, matrix.
+                    offset = child_start + (4 + 8 + 8 + 4 + 4 + 8 if version == 1 else 4 + 4 + 4 + 4 + 4 + 4)
+                    offset += 8 + 2 + 2 + 2 + 2 + 36
+                    track_width, track_height = struct.unpack('>II', moov[offset:offset + 8])
+                    # Only video tracks have a size; they are 16.16 fixed point numbers.
+                    width, height = track_width >> 16, track_height >> 16
+    if duration is None or not width or not height:
+        raise RuntimeError("No video track found")
+    return duration, width, height
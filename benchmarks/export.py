@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measures how many followers can be exported per second.
+
+    Compares the usual hand-written loop (json.dumps and write for each follower) with NDJSONSink, which encodes and
+    writes a batch of followers at a time, both uncompressed and with gzip.
+
+    Usage: python benchmarks/export.py [number of followers]
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from InstagramAPI.export import NDJSONSink  # noqa: E402
+
+
+def followers(number):
+    for pk in range(number):
+        yield {
+            'pk': 1000000000 + pk,
+            'username': 'follower%d' % pk,
+            'full_name': 'Follower %d' % pk,
+            'is_private': pk % 3 == 0,
+            'profile_pic_url': 'https://scontent.cdninstagram.com/v/t51.2885-19/%d_n.jpg' % pk,
+            'is_verified': False,
+            'has_anonymous_profile_picture': False,
+            'latest_reel_media': 0,
+        }
+
+
+def written_one_by_one(items, filename):
+    """ The loop exports were written with before NDJSONSink. """
+    with open(filename, 'w') as ndjson_file:
+        for item in items:
+            ndjson_file.write(json.dumps(item) + '\n')
+
+
+def written_by_sink(items, filename):
+    with NDJSONSink(filename) as sink:
+        sink.write_all(items)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    directory = tempfile.mkdtemp()
+    try:
+        for name, write in [
+                ('one by one', lambda items: written_one_by_one(items, os.path.join(directory, 'a.ndjson'))),
+                ('NDJSONSink', lambda items: written_by_sink(items, os.path.join(directory, 'b.ndjson'))),
+                ('NDJSONSink, gzip', lambda items: written_by_sink(items, os.path.join(directory, 'c.ndjson.gz')))]:
+            items = list(followers(number))  # Made in advance, so only the export is timed.
+            started = time.time()
+            write(items)
+            seconds = time.time() - started
+            print("%-20s %10.0f followers/s" % (name, number / seconds))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measures how long a fresh interpreter takes to import the package, on top of importing requests.
+
+    Each import is made in a new process, so nothing is already loaded. The median is compared with the budget
+    (INSTAGRAMAPI_IMPORT_BUDGET seconds, 0.25 by default, as in test.py), and the modules of the package that took the
+    longest to import are listed, as reported by python -X importtime.
+
+    Usage: python benchmarks/import_time.py [number of runs]
+
+    Exits with status 1 if the median is over the budget.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BUDGET = float(os.environ.get('INSTAGRAMAPI_IMPORT_BUDGET', 0.25))
+
+SCRIPT = (
+    "import json, time\n"
+    "import requests\n"
+    "start = time.time()\n"
+    "import InstagramAPI\n"
+    "print(json.dumps(time.time() - start))\n")
+
+
+def cold_import():
+    """ :return: seconds a new interpreter took to import the package. """
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT], cwd=ROOT)
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def slowest_modules(number):
+    """ :return: list of (microseconds, module) of the package's slowest modules to import, themselves included. """
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import requests; import InstagramAPI'],
+                               cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, errors = process.communicate()
+    timings = []
+    for line in errors.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        if module.strip().startswith('InstagramAPI'):
+            timings.append((int(cumulative), module.strip()))
+    return sorted(timings, reverse=True)[:number]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 9
+    timings = sorted(cold_import() for _ in range(runs))
+    median = timings[len(timings) // 2]
+    print("import InstagramAPI: median %.1f ms, best %.1f ms, worst %.1f ms (budget %.1f ms)" % (
+        median * 1000, timings[0] * 1000, timings[-1] * 1000, BUDGET * 1000))
+    if sys.version_info >= (3, 7):  # -X importtime is new in Python 3.7.
+        for microseconds, module in slowest_modules(10):
+            print("%10.1f ms  %s" % (microseconds / 1000.0, module))
+    if median > BUDGET:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
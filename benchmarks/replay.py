@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measures the time the library itself spends logging in, going through followers and uploading, offline.
+
+    The calls are answered by a ReplayAdapter from a cassette built here, so no network or account is needed and the
+    runs are repeatable. Each is run without a simulated network, which measures just the library, and then over a
+    simulated slow network.
+
+    Usage: python benchmarks/replay.py [number of pages of followers] [--profile]
+
+    With --profile, going through the followers is also profiled, and the functions it spent the most time in are
+    printed.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from InstagramAPI import InstagramAPI  # noqa: E402
+from InstagramAPI.transport import Cassette, ReplayAdapter  # noqa: E402
+
+PAGE_SIZE = 200
+UPLOAD_URL = 'https://upload.instagram.com/rupload_igvideo/'
+CHUNK_SIZE = 64 * 1024
+
+
+def box(kind, payload):
+    return struct.pack('>I', 8 + len(payload)) + kind + payload
+
+
+def make_png(width, height, size):
+    """ :return: the bytes of a PNG header, padded to size bytes; enough to read its size from. """
+    header = b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>IIBBBBB', width, height, 8, 2,
+                                                                                  0, 0, 0) + b'\0' * 4
+    return header + b'\0' * (size - len(header))
+
+
+def make_mp4(duration, width, height, size):
+    """ :return: the bytes of an MP4 file of about size bytes, with just enough headers to describe a video track. """
+    mvhd = struct.pack('>B3xIIII', 0, 0, 0, 1000, int(duration * 1000)) + b'\0' * 80
+    tkhd = struct.pack('>B3xIIIII', 0, 0, 0, 1, 0, int(duration * 1000)) + b'\0' * 52 + struct.pack(
+        '>II', width << 16, height << 16)
+    moov = box(b'mvhd', mvhd) + box(b'trak', box(b'tkhd', tkhd))
+    return box(b'ftyp', b'isom\0\0\0\0') + box(b'mdat', b'\0' * size) + box(b'moov', moov)
+
+
+def build_cassette(pages):
+    """ :return: a Cassette of a login, pages of followers, and the calls made by uploading a photo and a video. """
+    api_url = InstagramAPI.API_URL
+    cassette = Cassette()
+    cassette.add('GET', api_url + 'si/fetch_headers/', body='{"status": "ok"}', cookies={'csrftoken': 'replayed'})
+    cassette.add('POST', api_url + 'accounts/login/', body=json.dumps({
+        'logged_in_user': {'pk': 1234, 'username': 'replayed'}, 'status': 'ok'}), cookies={'csrftoken': 'replayed'})
+    for page in range(pages):
+        result = {'users': [{
+            'pk': 1000000000 + page * PAGE_SIZE + i,
+            'username': 'follower%d' % (page * PAGE_SIZE + i),
+            'full_name': 'Follower %d' % (page * PAGE_SIZE + i),
+            'is_private': i % 3 == 0,
+            'profile_pic_url': 'https://scontent.cdninstagram.com/v/t51.2885-19/%d_n.jpg' % i,
+            'is_verified': False,
+        } for i in range(PAGE_SIZE)], 'status': 'ok'}
+        if page + 1 < pages:
+            result['next_max_id'] = str(page + 1)
+        cassette.add('GET', api_url + 'friendships/1234/followers/', body=json.dumps(result))
+    configured = json.dumps({'media': {'pk': 1, 'code': 'replayed'}, 'status': 'ok'})
+    cassette.add('POST', api_url + 'upload/photo/', body='{"upload_id": "1", "status": "ok"}')
+    cassette.add('POST', api_url + 'media/configure/', body=configured)
+    cassette.add('POST', api_url + 'qe/expose/', body='{"status": "ok"}')
+    cassette.add('POST', api_url + 'upload/video/', body=json.dumps({'video_upload_urls': [
+        {}, {}, {}, {'url': UPLOAD_URL, 'job': 'replayed'}], 'status': 'ok'}))
+    cassette.add('POST', UPLOAD_URL, body='{"status": "ok"}')
+    cassette.add('POST', api_url + 'upload/photo/', body='{"upload_id": "1", "status": "ok"}')
+    cassette.add('POST', api_url + 'media/configure/', body=configured)
+    cassette.add('POST', api_url + 'qe/expose/', body='{"status": "ok"}')
+    return cassette
+
+
+def timed(name, func, repeat, unit):
+    started = time.time()
+    for _ in range(repeat):
+        count = func()
+    seconds = (time.time() - started) / repeat
+    print("%-40s %10.2f ms %12.0f %s/s" % (name, seconds * 1000, count / seconds, unit))
+
+
+def run(api, photo, video, repeat, label):
+    def login():
+        api.login(force=True)
+        return 1
+
+    def followers():
+        return sum(1 for _ in api.followers_iter())
+
+    def upload():
+        api.upload_photo(photo)
+        api.upload_video(video, photo, chunk_size=CHUNK_SIZE)
+        return 2
+
+    timed('login, ' + label, login, repeat, 'logins')
+    timed('followers_iter, ' + label, followers, repeat, 'followers')
+    timed('photo and video upload, ' + label, upload, repeat, 'uploads')
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 50
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'cassette.ndjson.gz')
+        build_cassette(pages).save(filename)
+        print("Cassette of %d pages of followers: %d bytes" % (pages, os.path.getsize(filename)))
+        photo, video = os.path.join(directory, 'photo.png'), os.path.join(directory, 'video.mp4')
+        with open(photo, 'wb') as photo_file:
+            photo_file.write(make_png(1080, 1080, 256 * 1024))
+        with open(video, 'wb') as video_file:
+            video_file.write(make_mp4(10, 640, 360, 1024 * 1024))
+
+        for label, options, repeat in [
+                ('no network', {}, 10),
+                ('50 ms, 10 MB/s', {'latency': 0.05, 'bandwidth': 10 * 1024 * 1024}, 2)]:
+            api = InstagramAPI('replayed', 'replayed',
+                               transport=ReplayAdapter(Cassette.load(filename), repeat=True, **options))
+            run(api, photo, video, repeat, label)
+
+        if '--profile' in sys.argv:
+            import cProfile
+            import pstats
+
+            api = InstagramAPI('replayed', 'replayed', transport=ReplayAdapter(Cassette.load(filename), repeat=True))
+            api.login()
+            profile = cProfile.Profile()
+            profile.runcall(lambda: sum(1 for _ in api.followers_iter()))
+            pstats.Stats(profile).sort_stats('cumulative').print_stats(20)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Measures how many signed request bodies can be built per second.
+
+    Compares building a typical body (that of like()) the way every endpoint used to, with _signed_payload().
+
+    Usage: python benchmarks/signing.py [number of bodies]
+"""
+
+from __future__ import print_function
+
+import hashlib
+import hmac
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from InstagramAPI import InstagramAPI  # noqa: E402
+
+if sys.version_info.major == 3:
+    from urllib.parse import quote
+else:
+    from urllib import quote
+
+
+def rebuilt_each_time(api, media_id):
+    """ Builds the body of like() from scratch, as the endpoints did before _signed_payload(). """
+    data = json.dumps({
+        '_uuid': api._uuid,
+        '_uid': api._loggedinuserid,
+        '_csrftoken': api._csrftoken,
+        'media_id': media_id
+    })
+    return ('ig_sig_key_version=' + api.SIG_KEY_VERSION + '&signed_body=' +
+            hmac.new(api.IG_SIG_KEY.encode('utf-8'), data.encode('utf-8'), hashlib.sha256).hexdigest() +
+            '.' + quote(data))
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    api = InstagramAPI('benchmark', 'benchmark')
+    api._loggedinuserid = 1234567890
+    api._csrftoken = 'aNhUh3kGpTsl4rNHoWcyZrVsXqS5Fn6z'
+    media_id = '1234567890123456789_1234567890'
+
+    for name, build in [('rebuilt each time', lambda: rebuilt_each_time(api, media_id)),
+                        ('_signed_payload', lambda: api._signed_payload(media_id=media_id))]:
+        seconds = min(timeit.repeat(build, number=number, repeat=3))
+        print("%-20s %10.0f bodies/s  %6.2f us/body" % (name, number / seconds, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
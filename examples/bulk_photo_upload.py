@@ -4,36 +4,34 @@
 # Instructions:
 #  - Create a directory that only contains photos to upload, and edit it into PHOTO_PATH.
 #  - Edit CAPTION to be your favourite caption.
+#  - If the script is interrupted, run it again: the photos already uploaded are recorded in CHECKPOINT, and skipped.
 #
 # Warning makes change to test account.
 
 
 from os import listdir
-from os.path import isfile, join
-import time
-from random import randint
-from InstagramAPI import InstagramAPI, credentials
+from os.path import expanduser, isfile, join
+from InstagramAPI import BulkUploader, InstagramAPI, credentials
 
 # Change Directory to Folder with pictures that you want to upload
-PHOTO_PATH = "~/igphoto/"
+PHOTO_PATH = expanduser("~/igphoto/")
 CAPTION = "Your Caption Here #hashtag"
-
+CHECKPOINT = join(PHOTO_PATH, ".uploaded.json")
 
 
 def main():
-    file_list = [f for f in listdir(PHOTO_PATH) if isfile(join(PHOTO_PATH, f))]
+    file_list = sorted(join(PHOTO_PATH, f) for f in listdir(PHOTO_PATH)
+                       if isfile(join(PHOTO_PATH, f)) and not f.startswith('.'))
     # Start Login and Uploading Photo
     api = InstagramAPI(credentials.USERNAME, credentials.PASSWORD)
     api.login()
-    for i, photo in enumerate(file_list):
-        print("Progress : %s of %s" % (i + 1, len(file_list)))
-        print("Now uploading this photo to Instagram: %s" % photo)
-        api.upload_photo(photo, caption=CAPTION, upload_id=None)
-
-        # sleep for random between 600 - 1200s
-        sleep_time = randint(600, 1200)
-        print("Sleep upload for %s seconds." % sleep_time)
-        time.sleep(sleep_time)
+    # Photos are probed ahead of time; between uploads, sleep for random between 600 - 1200s.
+    uploader = BulkUploader(api, checkpoint_file=CHECKPOINT, caption=CAPTION, delay_between_uploads=(600, 1200))
+    for result in uploader.upload(file_list):
+        if result['error'] is None:
+            print("Uploaded %s" % result['item'])
+        else:
+            print("Failed to upload %s: %s" % (result['item'], result['error']))
 
 
 if __name__ == '__main__':
@@ -3,14 +3,974 @@
 
 # See ReadMe for preparation instructions for credentials.
 
+import asyncio
+import csv
+import gzip
+import hashlib
+import hmac
+import importlib.util
+import itertools
+import json
+import os
+import pickle
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
 import unittest
-from InstagramAPI import InstagramAPI, credentials
+import unittest.mock
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import requests
+
+from InstagramAPI import (AsyncInstagramAPI, BulkUploader, FollowSnapshots, InstagramAPI, InstagramAPIPool,
+                          Metrics, RateLimiter, RecordList, ResponseCache, RetryPolicy, credentials)
+from InstagramAPI import image_utils
+from InstagramAPI.base import AuthenticationError
+from InstagramAPI.chunked_upload import ChunkedUpload
+from InstagramAPI.export import ColumnarSink, export
+from InstagramAPI.image_prep import ImageNormalizer
+from InstagramAPI.image_utils import get_image_info, get_image_size, get_image_sizes
+from InstagramAPI.transport import Cassette, CassetteMiss, RecordingAdapter, ReplayAdapter
+from InstagramAPI.video_utils import get_video_info
 
 """
     WARNING: These tests may affect your account. Use a test account.
+    
+    The tests in the Offline classes don't need credentials; they talk to a local stand-in for Instagram.
 """
 
 
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._respond(b'')
+
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                chunk = self.rfile.read(size + 2)[:size]
+                if not size:
+                    break
+                body += chunk
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._respond(body)
+
+    def _respond(self, body):
+        server = self.server
+        path = self.path[len('/api/v1/'):] if self.path.startswith('/api/v1/') else self.path
+        with server.lock:
+            server.requests.append((self.command, path, body, dict(self.headers)))
+        server.current.headers = self.headers
+        status, payload, headers = server.route(self.command, path, body)
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, values in headers.items():
+            for value in values if isinstance(values, list) else [values]:
+                self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInInstagram(ThreadingMixIn, HTTPServer):
+    """ A local HTTP server that impersonates enough of Instagram to exercise the library offline.
+
+        `routes` maps an endpoint prefix to a JSON-able response, or to a function(method, path, body) that returns
+        (status, payload) or (status, payload, headers). While it runs, the request's headers are in
+        `current.headers`.
+    """
+    daemon_threads = True
+
+    def __init__(self, routes=None):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _StandInHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.current = threading.local()
+        self.routes = {
+            'si/fetch_headers/': lambda method, path, body: (200, {'status': 'ok'}, {
+                'Set-Cookie': 'csrftoken=stand-in-token; Path=/'}),
+            'accounts/login/': lambda method, path, body: (200, {'logged_in_user': {'pk': 1234}}, {
+                'Set-Cookie': 'csrftoken=stand-in-token; Path=/'}),
+        }
+        self.routes.update(routes or {})
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def api_url(self):
+        return 'http://127.0.0.1:%s/api/v1/' % self.server_address[1]
+
+    def route(self, method, path, body):
+        for prefix in sorted(self.routes, key=len, reverse=True):
+            if path.startswith(prefix):
+                response = self.routes[prefix]
+                if callable(response):
+                    response = response(method, path, body)
+                    if len(response) == 2:
+                        response = response + ({},)
+                    return response
+                return 200, response, {}
+        return 200, {'status': 'ok'}, {}
+
+    def handle_error(self, request, client_address):
+        # A client that gave up waiting (e.g. after a timeout) has hung up; that is expected, so don't report it.
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def endpoints_called(self):
+        with self.lock:
+            return [path for (_, path, _, _) in self.requests]
+
+    def login(self, **kwargs):
+        """ Returns an InstagramAPI logged in to this stand-in. """
+        api = InstagramAPI(username='stand-in', password='stand-in', **kwargs)
+        api.API_URL = self.api_url
+        api.login()
+        return api
+
+    def paginate(self, field, pages):
+        """ Serves pages (a list of lists of items) through max_id pagination. """
+
+        def respond(method, path, body):
+            page = int(path.split('max_id=')[1].split('&')[0] or 0) if 'max_id=' in path else 0
+            result = {field: pages[page]}
+            if page + 1 < len(pages):
+                result['next_max_id'] = str(page + 1)
+            return 200, result
+
+        return respond
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ImportTimeTests(unittest.TestCase):
+    """ Importing the package must stay cheap: command-line jobs and short-lived workers pay for it on every run. """
+
+    # Seconds the package may add on top of importing requests, which it can't do without.
+    BUDGET = float(os.environ.get('INSTAGRAMAPI_IMPORT_BUDGET', 0.25))
+    HEAVY_MODULES = ('moviepy', 'numpy', 'imageio', 'requests_toolbelt', 'aiohttp', 'asyncio', 'sqlite3')
+
+    def test_cold_import_within_budget(self):
+        script = (
+            "import json, sys, time\n"
+            "import requests\n"
+            "start = time.time()\n"
+            "import InstagramAPI\n"
+            "print(json.dumps([time.time() - start, [m for m in %r if m in sys.modules]]))\n" % (self.HEAVY_MODULES,))
+        timings = []
+        for _ in range(3):
+            output = subprocess.check_output([sys.executable, '-c', script], cwd=os.path.dirname(
+                os.path.abspath(__file__)))
+            elapsed, heavy_modules = json.loads(output.decode('utf-8').splitlines()[-1])
+            self.assertEqual(heavy_modules, [])
+            timings.append(elapsed)
+        self.assertLess(sorted(timings)[1], self.BUDGET)
+
+
+def _box(box_type, body):
+    return struct.pack('>I4s', 8 + len(body), box_type) + body
+
+
+def make_mp4(duration, width, height, version=0):
+    """ :return: the bytes of a minimal MP4 file, with just enough headers to describe a video track. """
+    if version == 1:
+        mvhd = struct.pack('>B3xQQIQ', 1, 0, 0, 1000, int(duration * 1000)) + b'\0' * 80
+        tkhd = struct.pack('>B3xQQIIQ', 1, 0, 0, 1, 0, int(duration * 1000))
+    else:
+        mvhd = struct.pack('>B3xIIII', 0, 0, 0, 1000, int(duration * 1000)) + b'\0' * 80
+        tkhd = struct.pack('>B3xIIIII', 0, 0, 0, 1, 0, int(duration * 1000))
+    tkhd += b'\0' * 52 + struct.pack('>II', width << 16, height << 16)
+    sound_tkhd = struct.pack('>B3xIIIII', 0, 0, 0, 2, 0, 0) + b'\0' * 60
+    moov = _box(b'mvhd', mvhd) + _box(b'trak', _box(b'tkhd', sound_tkhd)) + _box(b'trak', _box(b'tkhd', tkhd))
+    return _box(b'ftyp', b'isom\0\0\0\0') + _box(b'mdat', b'\0' * 1000) + _box(b'moov', moov)
+
+
+def make_png(width, height):
+    """ :return: the bytes of the start of a PNG image; enough to read its size from. """
+    return b'\x89PNG\r\n\x1a\n' + _box(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))[:-5]
+
+
+class MediaProbeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, data):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'wb') as media_file:
+            media_file.write(data)
+        return filename
+
+    def test_image_info(self):
+        exif = b'\xff\xe1' + struct.pack('>H', 2 + 40000) + b'Exif\0\0' + b'\0' * 39994  # Beyond the first read.
+        jpeg = b'\xff\xd8' + exif + b'\xff\xc4\x00\x04\x00\x00' + b'\xff\xc0\x00\x11\x08' + struct.pack('>HH', 480, 640)
+        ispe = _box(b'ispe', struct.pack('>III', 0, 4032, 3024))
+        thumbnail_ispe = _box(b'ispe', struct.pack('>III', 0, 320, 240))
+        meta = _box(b'meta', b'\0' * 4 + _box(b'hdlr', b'\0' * 20) + _box(b'iprp', _box(b'ipco', thumbnail_ispe + ispe)))
+        heic = _box(b'ftyp', b'heic\0\0\0\0mif1heic') + meta + _box(b'mdat', b'\0' * 100)
+        webp = b'RIFF\0\0\0\0WEBPVP8X' + struct.pack('<II', 10, 0) + struct.pack('<I', 1919)[:3] + struct.pack(
+            '<I', 1079)[:3] + b'\0' * 8
+        for name, data, expected in [
+                ('photo.png', make_png(640, 360), ('png', 640, 360)),
+                ('photo.gif', b'GIF89a' + struct.pack('<HH', 16, 9) + b'\0' * 20, ('gif', 16, 9)),
+                ('photo.jpg', jpeg + b'\0' * 20, ('jpeg', 640, 480)),
+                ('photo.webp', webp, ('webp', 1920, 1080)),
+                ('photo.heic', heic, ('heic', 4032, 3024))]:
+            self.assertEqual(get_image_info(self.write(name, data)), expected)
+        with self.assertRaises(RuntimeError):
+            get_image_info(self.write('truncated.jpg', jpeg[:30000]))
+        with self.assertRaises(RuntimeError):
+            get_image_info(self.write('photo.txt', b'not a photo' * 10))
+
+    def test_image_sizes_of_a_directory_are_remembered(self):
+        self.write('a.png', make_png(1, 2))
+        self.write('b.png', make_png(3, 4))
+        self.write('c.txt', b'not a photo' * 10)
+        self.assertEqual(get_image_sizes(self.directory), {
+            os.path.join(self.directory, 'a.png'): (1, 2), os.path.join(self.directory, 'b.png'): (3, 4)})
+        self.addCleanup(image_utils.clear_cache)
+        original_get_image_info = image_utils.get_image_info
+        self.addCleanup(setattr, image_utils, 'get_image_info', original_get_image_info)
+        image_utils.get_image_info = None  # Sizes come from the cache, so the file isn't read again.
+        self.assertEqual(get_image_size(os.path.join(self.directory, 'b.png')), (3, 4))
+
+    def test_video_info(self):
+        self.assertEqual(get_video_info(self.write('v0.mp4', make_mp4(12.5, 640, 360))), (12.5, 640, 360))
+        self.assertEqual(get_video_info(self.write('v1.mov', make_mp4(3, 1080, 1920, version=1))), (3, 1080, 1920))
+        with self.assertRaises(RuntimeError):
+            get_video_info(self.write('truncated.mp4', make_mp4(12.5, 640, 360)[:-20]))
+        with self.assertRaises(RuntimeError):
+            get_video_info(self.write('not_a_video.avi', b'RIFF' + b'\0' * 100))
+
+
+class OfflineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInInstagram()
+        self.addCleanup(self.server.close)
+
+    def test_connections_are_reused(self):
+        api = self.server.login()
+        for _ in range(5):
+            api.get_username_info(1)
+        # The connection opened in advance by login() serves both login calls and the five lookups.
+        stats = api.connection_stats()
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(stats['reused'], 7)
+
+    def test_connections_closed_without_keep_alive(self):
+        api = self.server.login(keep_alive=False, warm_connections=0)
+        for _ in range(3):
+            api.get_username_info(1)
+        self.assertEqual(api.connection_stats()['reused'], 0)
+
+    def test_prefetch_stops_when_closed_early(self):
+        pages = [[{'pk': page * 10 + i} for i in range(10)] for page in range(20)]
+        self.server.routes['friendships/1234/followers/'] = self.server.paginate('users', pages)
+        api = self.server.login()
+
+        self.assertEqual([user['pk'] for user in api.followers_iter(prefetch=3)],
+                         [user['pk'] for page in pages for user in page])
+
+        del self.server.requests[:]
+        followers = api.followers_iter(prefetch=3)
+        self.assertEqual([user['pk'] for user in itertools.islice(followers, 15)], list(range(15)))
+        followers.close()
+        time.sleep(0.5)
+        # Two pages consumed, at most three queued and one in flight when closed.
+        self.assertLessEqual(len(self.server.requests), 6)
+
+    def test_streamed_pages(self):
+        pages = [[{'pk': page * 3 + i, 'tags': [{'x': i}]} for i in range(3)] for page in range(4)]
+        self.server.routes['friendships/1234/followers/'] = self.server.paginate('users', pages)
+        api = self.server.login()
+        self.assertEqual(list(api.followers_iter(stream=True)), [user for page in pages for user in page])
+        self.assertEqual([user['pk'] for user in itertools.islice(api.followers_iter(stream=True), 4)],
+                         [0, 1, 2, 3])
+        with self.assertRaises(ValueError):
+            list(api.followers_iter(stream=True, prefetch=2))
+
+    def test_rate_limiter_is_shared_and_adapts(self):
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        limiter = RateLimiter(rate=2, burst=2, family_rates={'friendships': (1, 1)},
+                              clock=lambda: now[0], sleep=sleep)
+        throttled = [True]
+        self.server.routes['users/'] = lambda method, path, body: (429, {}) if throttled[0] else (200, {})
+        first = self.server.login(rate_limiter=limiter)
+        second = self.server.login(rate_limiter=limiter)
+
+        # Four login calls: two free from the burst, then half a second each.
+        self.assertEqual(now[0], 1.0)
+        first.user_friendship(1)
+        second.user_friendship(2)
+        self.assertEqual(now[0], 2.0)
+
+        with self.assertRaises(requests.HTTPError):
+            first.get_username_info(1)
+        self.assertEqual(limiter.rate, 1.0)
+        throttled[0] = False
+        for _ in range(10):
+            second.get_username_info(1)
+        self.assertEqual(limiter.rate, 2)
+
+    def test_pool_spreads_calls_over_healthy_accounts(self):
+        def login(method, path, body):
+            if b'locked-out' in body:
+                return 403, {'message': 'checkpoint_required'}
+            return 200, {'logged_in_user': {'pk': 1234}}, {'Set-Cookie': 'csrftoken=stand-in-token; Path=/'}
+
+        self.server.routes['accounts/login/'] = login
+
+        def api_factory(username, password, rate_limiter):
+            api = InstagramAPI(username, password, rate_limiter=rate_limiter)
+            api.API_URL = self.server.api_url
+            return api
+
+        pool = InstagramAPIPool([('first', 'pw'), ('locked-out', 'pw'), ('third', 'pw')], rate=100,
+                                api_factory=api_factory)
+        for pk in range(6):
+            pool.get_username_info(pk)
+        status = dict((account['username'], account) for account in pool.status())
+        self.assertFalse(status['locked-out']['healthy'])
+        self.assertFalse(status['locked-out']['logged_in'])
+        self.assertEqual(status['first']['calls'] + status['third']['calls'], 6)
+        self.assertGreaterEqual(min(status['first']['calls'], status['third']['calls']), 2)
+
+    def test_session_can_be_saved_and_pickled(self):
+        self.server.routes['accounts/login/'] = lambda method, path, body: (
+            200, {'logged_in_user': {'pk': 1234}},
+            {'Set-Cookie': ['csrftoken=stand-in-token; Path=/', 'sessionid=stand-in-session; Path=/; Max-Age=3600']})
+        api = self.server.login()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'session.json')
+        api.save_session(filename)
+
+        del self.server.requests[:]
+        restored = InstagramAPI(username='stand-in', password='stand-in')
+        restored.API_URL = self.server.api_url
+        self.assertTrue(restored.load_session(filename))
+        restored.get_username_info(1)
+        unpickled = pickle.loads(pickle.dumps(api))
+        unpickled.get_username_info(2)
+        self.assertEqual(self.server.endpoints_called(), ['users/1/info/', 'users/2/info/'])
+        self.assertIn('sessionid=stand-in-session', self.server.requests[0][3]['Cookie'])
+        self.assertIn('sessionid=stand-in-session', self.server.requests[1][3]['Cookie'])
+
+        self.assertFalse(restored.session_is_valid(now=time.time() + 7200))
+        self.assertFalse(restored.load_session(os.path.join(directory, 'missing.json')))
+        with open(os.path.join(directory, 'damaged.json'), 'w') as session_file:
+            session_file.write('{"cookies": [')
+        self.assertFalse(restored.load_session(os.path.join(directory, 'damaged.json')))
+
+    def test_cache_answers_repeated_reads_until_a_write(self):
+        now = [0.0]
+        cache = ResponseCache(maxsize=2, clock=lambda: now[0])
+        api = self.server.login(cache=cache)
+        del self.server.requests[:]
+
+        for _ in range(3):
+            api.user_friendship(1)
+            api.media_info(7)
+        api.follow(1)
+        api.user_friendship(1)
+        api.media_info(7)
+        api.get_username_info(1)  # Evicts the least recently used, user_friendship(1).
+        now[0] += 120  # media_info expires after a minute.
+        api.media_info(7)
+        api.user_friendship(1)
+
+        self.assertEqual(self.server.endpoints_called(), [
+            'friendships/show/1/', 'media/7/info/', 'friendships/create/1/', 'friendships/show/1/',
+            'users/1/info/', 'media/7/info/', 'friendships/show/1/'])
+        self.assertEqual(cache.stats(), {'hits': 5, 'misses': 6, 'evictions': 2, 'size': 2})
+
+    def test_video_upload_is_chunked_retried_and_resumable(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        video, thumbnail = os.path.join(directory, 'video.mp4'), os.path.join(directory, 'thumbnail.png')
+        with open(video, 'wb') as video_file:
+            video_file.write(make_mp4(12.5, 640, 360))
+        with open(thumbnail, 'wb') as thumbnail_file:
+            thumbnail_file.write(make_png(640, 360))
+        resume_file = os.path.join(directory, 'upload.json')
+        self.server.routes['upload/video/'] = {'video_upload_urls': [{}, {}, {}, {
+            'url': self.server.api_url.replace('/api/v1/', '/rupload/'), 'job': 'stand-in-job'}]}
+        received = {}
+        failures = {256: [500], 512: [500, 400]}  # A server error is retried; a client error is not.
+
+        def upload_chunk(method, path, body):
+            start = int(self.server.current.headers['Content-Range'].split()[1].split('-')[0])
+            if failures.get(start):
+                return failures[start].pop(0), {'status': 'fail'}
+            received[start] = body
+            return 200, {'status': 'ok'}
+
+        self.server.routes['/rupload/'] = upload_chunk
+        api = self.server.login()
+        self.addCleanup(setattr, ChunkedUpload, 'RETRY_DELAY', ChunkedUpload.RETRY_DELAY)
+        ChunkedUpload.RETRY_DELAY = 0
+        del self.server.requests[:]
+
+        with self.assertRaises(requests.HTTPError):
+            api.upload_video(video, thumbnail, chunk_size=256, concurrency=1, resume_file=resume_file)
+        self.assertEqual(sorted(received), [0, 256])
+        self.assertEqual(self.server.endpoints_called().count('upload/video/'), 1)
+
+        api.upload_video(video, thumbnail, chunk_size=256, concurrency=3, resume_file=resume_file)
+        self.assertEqual(self.server.endpoints_called().count('upload/video/'), 1)
+        self.assertIn('media/configure/?video=1', self.server.endpoints_called())
+        with open(video, 'rb') as video_file:
+            self.assertEqual(b''.join(received[start] for start in sorted(received)), video_file.read())
+        self.assertFalse(os.path.exists(resume_file))
+
+    def test_photo_upload_is_streamed_from_the_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        photo = os.path.join(directory, 'photo.png')
+        image = make_png(640, 360) + os.urandom(256 * 1024)
+        with open(photo, 'wb') as photo_file:
+            photo_file.write(image)
+        api = self.server.login()
+        del self.server.requests[:]
+        progress = []
+
+        api.upload_photo(photo, caption='stand-in', progress=lambda sent, total: progress.append((sent, total)))
+
+        uploads = [body for (_, path, body, _) in self.server.requests if path == 'upload/photo/']
+        self.assertIn(image, uploads[0])
+        self.assertGreater(len(progress), 2)
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], (len(uploads[0]), len(uploads[0])))
+
+    def test_uploads_send_each_payload_once(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        video, photo = os.path.join(directory, 'video.mp4'), os.path.join(directory, 'photo.png')
+        with open(video, 'wb') as video_file:
+            video_file.write(make_mp4(12.5, 640, 360))
+        with open(photo, 'wb') as photo_file:
+            photo_file.write(make_png(640, 360))
+        self.server.routes['upload/video/'] = {'video_upload_urls': [{}, {}, {}, {
+            'url': self.server.api_url.replace('/api/v1/', '/rupload/'), 'job': 'stand-in-job'}]}
+        metrics = Metrics()
+        api = self.server.login(metrics=metrics, rate_limiter=RateLimiter(rate=1000, burst=10),
+                                retry_policy=RetryPolicy(timeout=5))
+        del self.server.requests[:]
+
+        api.upload_photo(photo, caption='stand-in')
+        self.assertEqual(self.server.endpoints_called(), ['upload/photo/', 'media/configure/', 'qe/expose/'])
+
+        del self.server.requests[:]
+        video_size = os.path.getsize(video)
+        api.upload_video(video, photo, caption='stand-in', chunk_size=video_size // 2 + 1)
+        self.assertEqual(self.server.endpoints_called(), [
+            'upload/video/', '/rupload/', '/rupload/', 'upload/photo/', 'media/configure/?video=1', 'qe/expose/'])
+        self.assertEqual(sum(len(body) for (_, path, body, _) in self.server.requests if path == '/rupload/'),
+                         video_size)
+        chunks = metrics.snapshot()['endpoints']['upload/video/chunk/']
+        self.assertEqual(chunks['calls'], {'POST 200': 2})
+        self.assertEqual(chunks['request_bytes'], video_size)
+
+    def test_bulk_upload_skips_what_was_already_posted(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        items = []
+        for name, data in [('1.png', make_png(10, 10)), ('2.txt', b'not a photo'), ('3.png', make_png(30, 30))]:
+            items.append(os.path.join(directory, name))
+            with open(items[-1], 'wb') as media_file:
+                media_file.write(data)
+        video = {'video': os.path.join(directory, 'video.mp4'), 'thumbnail': items[0], 'caption': 'video'}
+        with open(video['video'], 'wb') as video_file:
+            video_file.write(make_mp4(1, 64, 48))
+        items.append(video)
+        self.server.routes['upload/video/'] = {'video_upload_urls': [{}, {}, {}, {
+            'url': self.server.api_url.replace('/api/v1/', '/rupload/'), 'job': 'stand-in-job'}]}
+        self.server.routes['media/configure/'] = {'media': {'id': 'stand-in-media'}}
+        checkpoint = os.path.join(directory, 'checkpoint.json')
+        api = self.server.login()
+        del self.server.requests[:]
+
+        results = BulkUploader(api, checkpoint_file=checkpoint).upload(items)
+        self.assertEqual([result['error'] is None for result in results], [True, False, True, True])
+        self.assertEqual(self.server.endpoints_called().count('media/configure/'), 2)
+        self.assertEqual(self.server.endpoints_called().count('media/configure/?video=1'), 1)
+
+        with open(items[1], 'wb') as media_file:
+            media_file.write(make_png(20, 20))
+        del self.server.requests[:]
+        results = BulkUploader(api, checkpoint_file=checkpoint).upload(items)
+        self.assertEqual([result['item'] for result in results], [items[1]])
+        self.assertEqual(self.server.endpoints_called(), ['upload/photo/', 'media/configure/', 'qe/expose/'])
+        with open(checkpoint) as checkpoint_file:
+            self.assertEqual(len([json.loads(line) for line in checkpoint_file]), 4)  # A line per item.
+
+        # Checkpoints of earlier versions, a single object of every item, are read and converted.
+        with open(checkpoint, 'w') as checkpoint_file:
+            json.dump(dict((BulkUploader.key(item), {'media_id': None}) for item in items), checkpoint_file, indent=1)
+        self.assertTrue(BulkUploader(api, checkpoint_file=checkpoint).is_done(items[2]))
+        with open(checkpoint) as checkpoint_file:
+            self.assertEqual(len([json.loads(line) for line in checkpoint_file]), 4)
+
+        with open(checkpoint, 'w') as checkpoint_file:
+            checkpoint_file.write('{"truncated')
+        with self.assertRaises(ValueError):
+            BulkUploader(api, checkpoint_file=checkpoint)
+
+    def test_bulk_upload_prepares_only_a_few_items_ahead(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        items = []
+        for number in range(12):
+            items.append(os.path.join(directory, '%d.png' % number))
+            with open(items[-1], 'wb') as media_file:
+                media_file.write(make_png(10, 10))
+        uploader = BulkUploader(self.server.login(), workers=2)
+        prepared, ahead = [0], []
+        prepare, post = uploader._prepare, uploader._post
+
+        def counted_prepare(item):
+            prepared[0] += 1
+            return prepare(item)
+
+        def counted_post(*args):
+            ahead.append(prepared[0] - len(ahead) - 1)
+            return post(*args)
+
+        with unittest.mock.patch.object(uploader, '_prepare', counted_prepare), \
+                unittest.mock.patch.object(uploader, '_post', counted_post):
+            results = uploader.upload(items)
+        self.assertEqual([result['error'] for result in results], [None] * 12)
+        self.assertLessEqual(max(ahead), 4)
+
+    @unittest.skipUnless(importlib.util.find_spec('PIL'), "Needs Pillow")
+    def test_photos_are_normalized_before_upload(self):
+        from PIL import Image
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        wide, small = os.path.join(directory, 'wide.png'), os.path.join(directory, 'small.jpg')
+        Image.new('RGB', (4000, 1000), 'red').save(wide)
+        Image.new('RGB', (800, 800), 'blue').save(small, quality=87)
+        normalizer = ImageNormalizer(directory=directory)
+        self.assertEqual(normalizer.normalize(small), small)
+        api = self.server.login()
+        del self.server.requests[:]
+
+        results = BulkUploader(api, normalizer=normalizer, processes=2).upload([wide, small])
+        self.assertEqual([result['error'] for result in results], [None, None])
+        uploads = [body for (_, path, body, _) in self.server.requests if path == 'upload/photo/']
+        self.assertIn(b'\xff\xd8', uploads[0])  # Re-encoded as JPEG...
+        configuration = [body for (_, path, body, _) in self.server.requests if path == 'media/configure/'][0]
+        self.assertIn('"source_width": 1080, "source_height": 565',  # ...shrunk, and cropped to 1.91:1.
+                      urllib.parse.unquote(configuration.decode('ascii')))
+        self.assertEqual(sorted(os.listdir(directory)), ['small.jpg', 'wide.png'])  # Normalized copies are removed.
+
+        # An upload stopped by being logged out still removes the copies normalized ahead of it.
+        api.logout()
+        with self.assertRaises(AuthenticationError):
+            BulkUploader(api, normalizer=normalizer, processes=2, workers=2).upload([wide, wide, wide])
+        self.assertEqual(sorted(os.listdir(directory)), ['small.jpg', 'wide.png'])
+
+    def test_signed_payloads(self):
+        api = self.server.login()
+
+        def unsign(body):
+            prefix, signed_body = urllib.parse.unquote(body).split('&signed_body=')
+            signature, data = signed_body.split('.', 1)
+            self.assertEqual(prefix, 'ig_sig_key_version=' + api.SIG_KEY_VERSION)
+            self.assertEqual(signature, hmac.new(api.IG_SIG_KEY.encode('utf-8'), data.encode('utf-8'),
+                                                 hashlib.sha256).hexdigest())
+            return json.loads(data)
+
+        session = {'_uuid': api._uuid, '_uid': 1234, '_csrftoken': 'stand-in-token'}
+        self.assertEqual(unsign(api._signed_payload()), session)
+        self.assertEqual(unsign(api._signed_payload(media_id='1_2', text=u'caf\xe9 & co')),
+                         dict(session, media_id='1_2', text=u'caf\xe9 & co'))
+        api._csrftoken = 'new-token'
+        self.assertEqual(unsign(api._signed_payload(user_id=5)), dict(session, _csrftoken='new-token', user_id=5))
+        self.assertEqual(unsign(api._generatesignature('{"a": 1}')), {'a': 1})
+
+    def test_multipart_body(self):
+        body = InstagramAPI.build_body([
+            {'type': 'form-data', 'name': 'text', 'data': u'caf\xe9'},
+            {'type': 'form-data', 'name': 'photo', 'data': b'\xff\xd8', 'filename': 'photo.jpg',
+             'headers': ['Content-Type: application/octet-stream']},
+        ], 'stand-in-boundary')
+        self.assertIsInstance(body, bytes)
+        self.assertTrue(body.startswith(
+            b'--stand-in-boundary\r\nContent-Disposition: form-data; name="text"\r\n\r\ncaf\xc3\xa9\r\n'
+            b'--stand-in-boundary\r\nContent-Disposition: form-data; name="photo"; filename="pending_media_'))
+        self.assertTrue(body.endswith(
+            b'.jpg"\r\nContent-Type: application/octet-stream\r\n\r\n\xff\xd8\r\n--stand-in-boundary--'))
+
+    def test_direct_share_is_batched(self):
+        def share(method, path, body):
+            recipients = json.loads(body.split(b'name="recipient_users"\r\n\r\n')[1].split(b'\r\n')[0])[0]
+            return (500, {'status': 'fail'}) if '20' in recipients else (200, {'status': 'ok'})
+
+        self.server.routes['direct_v2/threads/broadcast/media_share/'] = share
+        api = self.server.login()
+        del self.server.requests[:]
+
+        results = api.direct_share_batched('1_2', list(range(35)), 'stand-in', batch_size=15, concurrency=3)
+        self.assertEqual([result['recipients'] for result in results],
+                         [list(range(15)), list(range(15, 30)), list(range(30, 35))])
+        self.assertEqual([result['error'] is None for result in results], [True, False, True])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_follower_snapshots_sync_only_the_new_pages(self):
+        pages = [[{'pk': page * 10 + i, 'username': 'user%d' % (page * 10 + i)} for i in range(10)]
+                 for page in range(5)]
+        self.server.routes['friendships/1234/followers/'] = self.server.paginate('users', pages)
+        api = self.server.login()
+        clock = [1000.0]
+        snapshots = FollowSnapshots(api, ':memory:', clock=lambda: clock[0])
+        self.addCleanup(snapshots.close)
+
+        # With nothing known yet, the first sync is a full sweep.
+        self.assertEqual(snapshots.sync(1234), {'added': 50, 'removed': 0})
+        self.assertEqual(snapshots.last_sweep(1234), 1000.0)
+
+        # Two new followers, and one gone: a sync reads just the first page and doesn't notice who has gone.
+        clock[0] = 2000.0
+        pages[0] = [{'pk': 100}, {'pk': 101}] + pages[0]
+        pages[4] = pages[4][1:]
+        del self.server.requests[:]
+        self.assertEqual(snapshots.sync(1234, known_run=5), {'added': 2, 'removed': 0})
+        self.assertEqual(len(self.server.requests), 1)
+
+        # A full sweep reads everything, and finds who has gone.
+        clock[0] = 3000.0
+        self.assertEqual(snapshots.sync(1234, sweep_every=1500), {'added': 0, 'removed': 1})
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertEqual(snapshots.members(1234), set(range(50)) - {40} | {100, 101})
+        self.assertEqual(snapshots.changes(1234, since=2000.0),
+                         [(100, 'added', 2000.0), (101, 'added', 2000.0), (40, 'removed', 3000.0)])
+
+        # A user turning up twice, as pages shift while they are read, is added once.
+        clock[0] = 4000.0
+        pages[0] = [{'pk': 102}, {'pk': 103}, {'pk': 102}] + pages[0]
+        self.assertEqual(snapshots.sync(1234, known_run=5), {'added': 2, 'removed': 0})
+        clock[0] = 5000.0
+        pages[1] = [{'pk': 104}] + pages[1]
+        pages[2] = [{'pk': 104}] + pages[2]
+        self.assertEqual(snapshots.full_sweep(1234), {'added': 1, 'removed': 0})
+        self.assertEqual(snapshots.changes(1234, since=4000.0),
+                         [(102, 'added', 4000.0), (103, 'added', 4000.0), (104, 'added', 5000.0)])
+
+    def test_compact_records(self):
+        pages = [[{'pk': page * 2 + i, 'username': 'user%d' % (page * 2 + i), 'full_name': 'A follower',
+                   'is_private': i == 1, 'friendship_status': {'following': i == 0}} for i in range(2)]
+                 for page in range(3)]
+        self.server.routes['friendships/1234/followers/'] = self.server.paginate('users', pages)
+        api = self.server.login()
+
+        users = list(api.followers_iter(compact=True))
+        self.assertEqual([(user.pk, user.username, user.is_private, user.is_verified) for user in users[:2]],
+                         [(0, 'user0', False, None), (1, 'user1', True, None)])
+        self.assertFalse(hasattr(users[0], '__dict__'))
+        self.assertIs(users[0].username, sys.intern('user0'))  # Short strings are interned...
+        self.assertIsNot(users[0].full_name, users[2].full_name)  # ...but free text is kept as it is.
+
+        users = list(api.followers_iter(stream=True, fields=['pk', 'friendship_status.following']))
+        self.assertEqual([(user.pk, user.friendship_status_following) for user in users[:2]], [(0, True), (1, False)])
+        self.assertEqual(pickle.loads(pickle.dumps(users[0])), users[0])
+
+        followers = RecordList(['pk', 'username'], api.followers_iter(fields=['pk', 'username']))
+        self.assertEqual(len(followers), 6)
+        self.assertEqual(followers.column('pk').typecode, 'q')
+        self.assertEqual(list(followers.column('pk')), list(range(6)))
+        self.assertIsInstance(followers.column('username'), list)
+        self.assertEqual(followers[-1].username, 'user5')
+        self.assertEqual([user.pk for user in followers[1:3]], [1, 2])
+
+    def test_export(self):
+        pages = [[{'pk': page * 3 + i, 'user': {'username': 'user%d' % (page * 3 + i)}} for i in range(3)]
+                 for page in range(4)]
+        self.server.routes['friendships/1234/followers/'] = self.server.paginate('users', pages)
+        api = self.server.login()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        filename, rows = export(api.followers_iter(), os.path.join(directory, 'followers.ndjson.gz'), batch_size=5)
+        self.assertEqual(rows, 12)
+        with gzip.open(filename) as ndjson_file:
+            self.assertEqual([json.loads(line) for line in ndjson_file], [user for page in pages for user in page])
+
+        with ColumnarSink(os.path.join(directory, 'followers.csv'), ['pk', 'user.username'], row_group_size=5) as sink:
+            sink.write_all(api.followers_iter(fields=['pk', 'user.username']))
+        with open(sink.filename) as csv_file:
+            rows = list(csv.reader(csv_file))
+        self.assertEqual(rows[0], ['pk', 'user_username'])
+        self.assertEqual(rows[1:3], [['0', 'user0'], ['1', 'user1']])
+        self.assertEqual(len(rows), 13)
+
+    def test_columnar_sink_writes_short_and_empty_tables(self):
+        class Table(object):
+            def __init__(self, columns):
+                self.columns = columns
+                self.schema = tuple(columns)
+
+            def cast(self, schema):
+                return self
+
+        class Writer(object):
+            def __init__(self, filename, schema):
+                self.filename, self.tables = filename, []
+
+            def write_table(self, table):
+                self.tables.append(table.columns)
+
+            def close(self):
+                with open(self.filename, 'w') as table_file:
+                    json.dump(self.tables, table_file)
+
+        pyarrow = types.SimpleNamespace(table=Table, parquet=types.SimpleNamespace(ParquetWriter=Writer),
+                                        ipc=types.SimpleNamespace(new_file=Writer))
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        with unittest.mock.patch('InstagramAPI.export._import_pyarrow', return_value=pyarrow):
+            # Fewer rows than a row group are written on closing.
+            with ColumnarSink(os.path.join(directory, 'followers.parquet'), ['pk', 'username']) as sink:
+                for pk in range(10):
+                    sink.write({'pk': pk, 'username': 'user%d' % pk})
+            with open(sink.filename) as table_file:
+                self.assertEqual(json.load(table_file),
+                                 [{'pk': list(range(10)), 'username': ['user%d' % pk for pk in range(10)]}])
+
+            # No rows at all still make a file, of an empty table.
+            filename, rows = export(iter([]), os.path.join(directory, 'empty.arrow'), fields=['pk'])
+            self.assertEqual(rows, 0)
+            with open(filename) as table_file:
+                self.assertEqual(json.load(table_file), [{'pk': []}])
+
+    def test_map_calls_an_endpoint_for_each_item(self):
+        in_flight, most_in_flight = [0], [0]
+        lock = threading.Lock()
+
+        def info(method, path, body):
+            pk = int(path.split('/')[1])
+            with lock:
+                in_flight[0] += 1
+                most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+            time.sleep(0.02 if pk % 2 else 0.05)
+            with lock:
+                in_flight[0] -= 1
+            return (404, {'status': 'fail'}) if pk == 13 else (200, {'user': {'pk': pk}})
+
+        self.server.routes['users/'] = info
+        api = self.server.login()
+
+        calls = api.map('get_username_info', iter(range(40)), concurrency=4)
+        results = list(calls)
+        self.assertEqual([result['item'] for result in results], list(range(40)))
+        self.assertEqual([result['response']['user']['pk'] for result in results if result['error'] is None],
+                         [pk for pk in range(40) if pk != 13])
+        self.assertIsInstance(results[13]['error'], requests.HTTPError)
+        self.assertEqual((calls.stats.calls, calls.stats.errors), (40, 1))
+        self.assertEqual(dict(calls.stats.errors_by_type), {'HTTPError': 1})
+        self.assertLessEqual(most_in_flight[0], 4)
+
+        unordered = [result['item'] for result in api.map(api.get_username_info, range(8), ordered=False)]
+        self.assertEqual(sorted(unordered), list(range(8)))
+        self.assertNotEqual(unordered, list(range(8)))  # The odd pks are answered sooner.
+
+        async def crawl():
+            async with AsyncInstagramAPI(username='stand-in', password='stand-in') as async_api:
+                async_api.API_URL = self.server.api_url
+                await async_api.login()
+                return [result async for result in async_api.map('get_username_info', range(10, 16), concurrency=3)]
+
+        results = asyncio.run(crawl())
+        self.assertEqual([result['item'] for result in results], list(range(10, 16)))
+        self.assertEqual([result['error'] is None for result in results], [True, True, True, False, True, True])
+
+    def test_retry_policy(self):
+        failures = {'users/1/info/': [503, 503], 'users/2/info/': [429], 'media/5/comment/': [500],
+                    'media/5/info/': [502], 'friendships/1234/followers/?rank_token=': [504]}
+        pages = self.server.paginate('users', [[{'pk': 1}], [{'pk': 2}]])
+
+        def respond(method, path, body):
+            for prefix, statuses in failures.items():
+                if path.startswith(prefix) and statuses:
+                    status = statuses.pop(0)
+                    return status, {'status': 'fail'}, {'Retry-After': '7'} if status == 429 else {}
+            if path.startswith('users/3/'):
+                time.sleep(0.5)  # Longer than the read timeout.
+            return pages(method, path, body) if path.startswith('friendships/') else (200, {'status': 'ok'})
+
+        for prefix in ('users/', 'media/', 'friendships/1234/followers/'):
+            self.server.routes[prefix] = respond
+        sleeps = []
+        policy = RetryPolicy(retries=2, backoff=1.0, timeout=(5, 0.2), sleep=sleeps.append, random=lambda: 0.5)
+        api = self.server.login(retry_policy=policy)
+
+        self.assertEqual(api.get_username_info(1), {'status': 'ok'})
+        self.assertEqual(sleeps, [0.5, 1.0])  # Half of the longest wait, which doubles.
+        self.assertEqual(api.get_username_info(2), {'status': 'ok'})
+        self.assertEqual(sleeps[-1], 7.0)  # As Retry-After asks.
+        self.assertEqual(api.media_info(5), {'status': 'ok'})  # A POST that only reads.
+        with self.assertRaises(requests.HTTPError):
+            api.comment(5, 'Not posted twice')
+        with self.assertRaises(requests.Timeout):
+            api.get_username_info(3)
+        self.assertEqual([user['pk'] for user in api.followers_iter()], [1, 2])
+
+        stats = policy.stats()
+        self.assertEqual(stats['users/{id}/info/'], {'calls': 3, 'retries': 5, 'recovered': 2, 'failed': 1})
+        self.assertEqual(stats['media/{id}/comment/'], {'calls': 1, 'retries': 0, 'recovered': 0, 'failed': 1})
+        self.assertEqual(stats['friendships/{id}/followers/']['recovered'], 1)
+        self.assertEqual(len([path for path in self.server.endpoints_called() if path.startswith('media/5/com')]), 1)
+
+    def test_metrics(self):
+        self.server.routes['friendships/1234/followers/'] = self.server.paginate('users', [[{'pk': 1}], [{'pk': 2}]])
+        self.server.routes['users/'] = lambda method, path, body: (
+            (404, {'status': 'fail'}) if path.startswith('users/2/') else (200, {'user': {'pk': 1}}))
+        events = []
+        metrics = Metrics(hooks=[lambda event, endpoint, values: events.append((event, endpoint))])
+        api = self.server.login(metrics=metrics, rate_limiter=RateLimiter(rate=20, burst=1))
+
+        api.get_username_info(1)
+        with self.assertRaises(requests.HTTPError):
+            api.get_username_info(2)
+        api.like(5)
+        self.assertEqual([user['pk'] for user in api.followers_iter()], [1, 2])
+
+        snapshot = metrics.snapshot()
+        users = snapshot['endpoints']['users/{id}/info/']
+        self.assertEqual(users['calls'], {'GET 200': 1, 'GET 404': 1})
+        self.assertEqual(users['latency']['count'], 2)
+        self.assertEqual(users['decode']['count'], 1)
+        self.assertEqual(users['response_bytes'], len(b'{"user": {"pk": 1}}') + len(b'{"status": "fail"}'))
+        self.assertGreater(sum(entry['throttled_seconds'] for entry in snapshot['endpoints'].values()), 0)
+        self.assertGreater(snapshot['endpoints']['media/{id}/like/']['request_bytes'], 0)
+        self.assertEqual(snapshot['signing']['count'], 1)
+        self.assertEqual(snapshot['pages']['users']['count'], 2)
+        self.assertIn(('sign', None), events)
+        self.assertIn(('page', 'users'), events)
+
+        text = metrics.prometheus()
+        self.assertIn('instagramapi_calls_total{endpoint="users/{id}/info/",method="GET",status="404"} 1\n', text)
+        self.assertIn('instagramapi_call_seconds_bucket{endpoint="users/{id}/info/",le="+Inf"} 2\n', text)
+        self.assertIn('# TYPE instagramapi_page_wait_seconds histogram\n', text)
+
+    def test_record_and_replay(self):
+        self.server.routes['friendships/1234/followers/'] = self.server.paginate('users', [[{'pk': 1}], [{'pk': 2}]])
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'followers.ndjson.gz')
+
+        cassette = Cassette()
+        api = self.server.login(transport=RecordingAdapter(cassette))
+        self.assertEqual([user['pk'] for user in api.followers_iter()], [1, 2])
+        api.get_username_info(5)
+        cassette.save(filename)
+        with gzip.open(filename) as cassette_file:
+            self.assertNotIn(b'stand-in-token', cassette_file.read())
+        called = len(self.server.requests)
+
+        delays = []
+        replayed = InstagramAPI(username='stand-in', password='stand-in',
+                                transport=ReplayAdapter(Cassette.load(filename), latency=0.5, bandwidth=1000,
+                                                        sleep=delays.append))
+        replayed.API_URL = 'https://i.instagram.invalid/api/v1/'
+        replayed.login()
+        self.assertEqual([user['pk'] for user in replayed.followers_iter()], [1, 2])
+        self.assertEqual(replayed.get_username_info(6), {'status': 'ok'})
+        with self.assertRaises(CassetteMiss):
+            replayed.get_username_info(7)
+        self.assertEqual(len(self.server.requests), called)
+        self.assertEqual(len(delays), len(cassette))
+        self.assertTrue(all(delay > 0.5 for delay in delays))
+
+    def test_upload_ids_are_unique_across_threads(self):
+        upload_ids = []
+
+        def generate():
+            upload_ids.extend(InstagramAPI.generate_upload_id() for _ in range(200))
+
+        threads = [threading.Thread(target=generate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(upload_ids)), 800)
+
+    def test_async_video_chunk_that_times_out_is_retried(self):
+        self.addCleanup(setattr, ChunkedUpload, 'RETRY_DELAY', ChunkedUpload.RETRY_DELAY)
+        ChunkedUpload.RETRY_DELAY = 0
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        video, photo = os.path.join(directory, 'video.mp4'), os.path.join(directory, 'photo.png')
+        with open(video, 'wb') as video_file:
+            video_file.write(make_mp4(1, 64, 48))
+        with open(photo, 'wb') as photo_file:
+            photo_file.write(make_png(64, 48))
+        self.server.routes['upload/video/'] = {'video_upload_urls': [{}, {}, {}, {
+            'url': self.server.api_url.replace('/api/v1/', '/rupload/'), 'job': 'stand-in-job'}]}
+        timed_out = []
+
+        async def upload():
+            async with AsyncInstagramAPI(username='stand-in', password='stand-in') as api:
+                api.API_URL = self.server.api_url
+                await api.login()
+                request = api._request
+
+                async def stalling_request(url, post, headers, endpoint=None):
+                    if '/rupload/' in url and not timed_out:
+                        timed_out.append(url)
+                        raise asyncio.TimeoutError()  # As aiohttp raises when a call's total timeout runs out.
+                    return await request(url, post, headers, endpoint)
+
+                api._request = stalling_request
+                return await api.upload_video(video, photo)
+
+        self.assertEqual(asyncio.run(upload()), {'status': 'ok'})
+        self.assertEqual(len(timed_out), 1)
+        self.assertEqual(self.server.endpoints_called().count('/rupload/'), 1)
+
+    def test_async_api(self):
+        self.server.routes['friendships/1234/followers/'] = self.server.paginate(
+            'users', [[{'pk': 1}, {'pk': 2}], [{'pk': 3}]])
+
+        async def crawl():
+            async with AsyncInstagramAPI(username='stand-in', password='stand-in') as api:
+                api.API_URL = self.server.api_url
+                await api.login()
+                infos = await asyncio.gather(*[api.get_username_info(pk) for pk in range(5)])
+                followers = [user['pk'] async for user in api.followers_iter()]
+                return infos, followers
+
+        infos, followers = asyncio.run(crawl())
+        self.assertEqual(len(infos), 5)
+        self.assertEqual(followers, [1, 2, 3])
+
+
 class InstagramAPITests(unittest.TestCase):
 
     # def test_login(self):